@@ -0,0 +1,227 @@
+"""
+End-to-end throughput benchmark of a sync from GitHub to DBFS, against in-process fake GitHub
+and DBFS servers.
+
+Usage:
+    python -m benchmarks.benchmark --files 1,10,100 --sizes 1KB,1MB --engines sync,files,main
+        [--latency 0.01] [--bandwidth 100MB] [--error-rate 0.01] [--max-concurrency 8]
+        [--fixed-limit 16] [--json]
+
+For every engine, file count and file size, it copies a version folder and reports files/s,
+MB/s, number of requests to each server and peak RSS. Every cell of the matrix runs in a new
+process with its own fake servers, so its peak RSS (fake servers included) isn't the peak of the
+cells before it. The "files" engine is the sync engine uploading with the Files API (one
+streamed request per file) instead of DBFS API.
+With --max-concurrency, the fake DBFS throttles requests, which lets compare the adaptive
+concurrency limit of the sync engine (default) against a fixed one (--fixed-limit).
+"""
+
+import argparse
+import asyncio
+from hashlib import sha1
+from hmac import HMAC
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import time
+from typing import Callable, Dict, List, Optional
+
+import azure.functions as func
+
+from git_to_dbfs.services import GitPath, GitHub, DBFS, FilesSink, AdaptiveLimiter
+from git_to_dbfs.tests.fakes import FakeGitHub, FakeDBFS
+from git_to_dbfs.version import copy_versions_to_dbfs
+
+REPO = 'magencio/git_to_dbfs_function'
+BRANCH = 'master'
+BASE_PATH = 'samplefiles'
+DBFS_BASE_PATH = '/mnt/benchmark/samplefiles'
+WEBHOOK_SECRET = 'benchmark'
+
+UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+def parse_size(size: str) -> int:
+    """
+    Parses a size like "64KB" into bytes.
+    """
+    size = size.strip().upper()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * UNITS[unit])
+    return int(size)
+
+def run_sync(git_server: FakeGitHub, dbfs_server: FakeDBFS, version: str,
+    limiter: AdaptiveLimiter):
+    """
+    Copies a version with the thread-based engine.
+    """
+    logger = logging.getLogger(__name__)
+    copy_versions_to_dbfs({version}, GitHub(git_server.url, 'token', logger),
+        GitPath(REPO, BASE_PATH, BRANCH), DBFS(dbfs_server.url, 'token', limiter=limiter),
+        DBFS_BASE_PATH, logger)
+
+def run_files(git_server: FakeGitHub, dbfs_server: FakeDBFS, version: str,
+    limiter: AdaptiveLimiter):
+    """
+    Copies a version with the thread-based engine and the Files API.
+    """
+    logger = logging.getLogger(__name__)
+    copy_versions_to_dbfs({version}, GitHub(git_server.url, 'token', logger),
+        GitPath(REPO, BASE_PATH, BRANCH), FilesSink(dbfs_server.url, 'token', limiter=limiter),
+        DBFS_BASE_PATH, logger)
+
+def run_main(_: FakeGitHub, __: FakeDBFS, version: str, ___: AdaptiveLimiter):
+    """
+    Copies a version through the Azure Function entry point, with a signed push notification.
+    """
+    import git_to_dbfs # pylint: disable=import-outside-toplevel
+
+    body = json.dumps({
+        'ref': f'refs/heads/{BRANCH}',
+        'repository': {'full_name': REPO},
+        'commits': [{'added': [f'{BASE_PATH}/{version}/file0.dat'], 'removed': [],
+            'modified': []}]
+    }).encode()
+    signature = HMAC(key=WEBHOOK_SECRET.encode(), msg=body, digestmod=sha1).hexdigest()
+    req = func.HttpRequest(method='POST', url='http://localhost/api/git_to_dbfs',
+        headers={'X-Hub-Signature': f'sha1={signature}'}, body=body)
+
+    response = asyncio.run(git_to_dbfs.main(req))
+    if response.status_code != 200:
+        raise RuntimeError(response.get_body().decode())
+
+ENGINES: Dict[str, Callable[[FakeGitHub, FakeDBFS, str, AdaptiveLimiter], None]] = {
+    'sync': run_sync,
+    'files': run_files,
+    'main': run_main
+}
+
+def configure_main(git_server: FakeGitHub, dbfs_server: FakeDBFS):
+    """
+    Configures the Azure Function entry point to use the fake servers.
+    Telemetry goes to an unreachable Application Insights endpoint, so its errors are muted.
+    """
+    logging.getLogger('opencensus').setLevel(logging.CRITICAL)
+    os.environ.update({
+        'ApplicationInsights': 'InstrumentationKey=00000000-0000-0000-0000-000000000000;'
+            'IngestionEndpoint=http://127.0.0.1:9',
+        'WebhookSecret': WEBHOOK_SECRET,
+        'GitApi': git_server.url, 'GitToken': 'token',
+        'GitRepo': REPO, 'GitBranch': BRANCH, 'GitBasePath': BASE_PATH,
+        'DatabricksHost': dbfs_server.url, 'DatabricksToken': 'token',
+        'DatabricksDbfsBasePath': DBFS_BASE_PATH})
+
+def benchmark(engine: str, file_count: int, file_size: int, git_server: FakeGitHub,
+    dbfs_server: FakeDBFS, fixed_limit: Optional[int] = None) -> dict:
+    """
+    Benchmarks the copy of a version folder with file_count files of file_size bytes.
+    DBFS requests of the sync engine go through a new adaptive limiter, or a fixed one.
+    """
+    if fixed_limit:
+        limiter = AdaptiveLimiter(dbfs_server.url, initial_limit=fixed_limit,
+            min_limit=fixed_limit, max_limit=fixed_limit)
+    else:
+        limiter = AdaptiveLimiter(dbfs_server.url)
+    version = f'{engine}-{file_count}x{file_size}'
+    content = os.urandom(file_size)
+    for index in range(file_count):
+        git_server.add_file(REPO, BRANCH, f'{BASE_PATH}/{version}/file{index}.dat', content)
+    git_server.requests.clear()
+    dbfs_server.requests.clear()
+    dbfs_server.errors.clear()
+
+    error = None
+    start = time.perf_counter()
+    try:
+        ENGINES[engine](git_server, dbfs_server, version, limiter)
+    except Exception as ex: # pylint: disable=broad-except
+        error = repr(ex)
+    seconds = time.perf_counter() - start
+
+    total_bytes = file_count * file_size
+    copied = sum(1 for path in dbfs_server.files if path.startswith(f'{DBFS_BASE_PATH}/{version}/'))
+    result = {
+        'engine': engine,
+        'files': file_count,
+        'file_size': file_size,
+        'seconds': round(seconds, 3),
+        'files_per_second': round(file_count / seconds, 2),
+        'mb_per_second': round(total_bytes / seconds / UNITS['MB'], 2),
+        'copied_files': copied,
+        'github_requests': sum(git_server.requests.values()),
+        'dbfs_requests': sum(dbfs_server.requests.values()),
+        'dbfs_requests_by_api': dict(dbfs_server.requests),
+        'dbfs_errors': dict(dbfs_server.errors),
+        'dbfs_throttled': dbfs_server.errors[429],
+        'dbfs_limit': limiter.limit,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'error': error
+    }
+
+    for index in range(file_count):
+        git_server.remove_file(REPO, BRANCH, f'{BASE_PATH}/{version}/file{index}.dat')
+    with dbfs_server.lock:
+        dbfs_server.files.clear()
+    return result
+
+def run_cell(engine: str, file_count: int, file_size: int, args: argparse.Namespace) -> dict:
+    """
+    Benchmarks a cell of the matrix against new fake servers, in the calling process.
+    """
+    bandwidth = parse_size(args.bandwidth) if args.bandwidth else None
+    with FakeGitHub(latency=args.latency, bandwidth=bandwidth) as git_server, \
+        FakeDBFS(latency=args.latency, bandwidth=bandwidth, error_rate=args.error_rate,
+            max_concurrency=args.max_concurrency) as dbfs_server:
+        configure_main(git_server, dbfs_server)
+        return benchmark(engine, file_count, file_size, git_server, dbfs_server,
+            args.fixed_limit)
+
+def print_table(results: List[dict]):
+    """
+    Prints the results as a table.
+    """
+    columns = ['engine', 'files', 'file_size', 'seconds', 'files_per_second', 'mb_per_second',
+        'github_requests', 'dbfs_requests', 'dbfs_throttled', 'dbfs_limit', 'peak_rss_mb', 'error']
+    print(' | '.join(columns))
+    for result in results:
+        print(' | '.join(str(result[column]) for column in columns))
+
+def main():
+    """
+    Runs the benchmark matrix.
+    """
+    parser = argparse.ArgumentParser(description='GitHub to DBFS throughput benchmark')
+    parser.add_argument('--files', default='1,10,100', help='Comma-separated file counts')
+    parser.add_argument('--sizes', default='1KB,1MB', help='Comma-separated file sizes')
+    parser.add_argument('--engines', default='sync,files', help=f'Any of {", ".join(ENGINES)}')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds added per request')
+    parser.add_argument('--bandwidth', default=None, help='Bandwidth per request, e.g. 10MB')
+    parser.add_argument('--error-rate', type=float, default=0, help='DBFS error probability')
+    parser.add_argument('--max-concurrency', type=int, default=None,
+        help='In-flight DBFS requests above which DBFS throttles with 429')
+    parser.add_argument('--fixed-limit', type=int, default=None,
+        help='Fixed limit of in-flight DBFS requests of the sync engine, instead of adaptive')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON lines')
+    args = parser.parse_args()
+
+    # ru_maxrss is the peak of the whole process, so every cell gets a new (spawned) process
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for engine in args.engines.split(','):
+        for file_count in [int(x) for x in args.files.split(',')]:
+            for file_size in [parse_size(x) for x in args.sizes.split(',')]:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(run_cell, engine, file_count, file_size,
+                        args).result()
+                results.append(result)
+                if args.json:
+                    print(json.dumps(result), flush=True)
+
+    if not args.json:
+        print_table(results)
+
+if __name__ == '__main__':
+    main()
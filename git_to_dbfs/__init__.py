@@ -7,6 +7,7 @@ folder to DBFS in Databricks.
 Path to files: {base_path}/{version}/{file}
 """
 
+import asyncio
 import copy
 import json
 import logging
@@ -15,14 +16,19 @@ import requests
 
 import azure.functions as func
 from opencensus.ext.azure.log_exporter import AzureLogHandler
-from opencensus.ext.azure.trace_exporter import AzureExporter
 from opencensus.trace import config_integration
-from opencensus.trace.samplers import AlwaysOnSampler
-from opencensus.trace.samplers import ProbabilitySampler
-from opencensus.trace.tracer import Tracer
 
 from .version import *
 from .services import *
+from .routing import Checkpoints, Mapping, RoutingTable
+from .services import profiling, telemetry
+
+# Seconds after which no new copies get started, under the 230 seconds limit of HTTP responses
+DEFAULT_TIME_BUDGET = 200
+DEFAULT_MAX_CONTINUATIONS = 10
+DEFAULT_RECONCILE_API_CALLS = 1000
+
+__ROUTING_TABLE = None
 
 def __get_logger() -> Logger:
     # Create a logger with Azure Application Insights
@@ -33,45 +39,165 @@ def __get_logger() -> Logger:
     logger.addHandler(handler)
     return logger
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+def __get_routing_table() -> RoutingTable:
+    # Routing table (and its connection pools) is shared by all invocations in this worker
+    global __ROUTING_TABLE # pylint: disable=global-statement
+    if __ROUTING_TABLE is None:
+        __ROUTING_TABLE = RoutingTable.from_env()
+    return __ROUTING_TABLE
+
+def __get_deadline() -> Deadline:
+    # No new copies get started after the time budget of the invocation
+    return Deadline(float(os.getenv('InvocationTimeBudget', str(DEFAULT_TIME_BUDGET))))
+
+async def main(req: func.HttpRequest, continuation: func.Out[str] = None) -> func.HttpResponse:
     """
     Entry point for this Azure Function.
+    Copies that don't fit in the time budget of the invocation get continued by
+    "git_to_dbfs_continuation" function from a message sent to the "continuation" queue.
     """
+    deadline = __get_deadline()
     logger = __get_logger()
     logger.info('Python HTTP trigger function processed a request.')
 
+    telemetry.enable_metrics(os.getenv('ApplicationInsights'))
+    tracer = telemetry.start_tracing(os.getenv('ApplicationInsights'),
+        os.getenv('TracingSamplingRate'))
+    try:
+        with profiling.profile(os.getenv('Profiling'), req.headers, os.getenv('ProfilingPath'),
+            logger), telemetry.span('git_to_dbfs'):
+            return await __process(req, logger, deadline, continuation)
+    finally:
+        if tracer:
+            tracer.finish()
+
+async def continue_copy(message: dict, continuation: func.Out[str]):
+    """
+    Continues the copies of a continuation message (see "main"), from their checkpoints, and
+    completes and copies its truncated notification, if any.
+    Errors get raised, so the message gets retried. While the circuit of any GitHub API or
+    Databricks host of the copies is open, nothing gets copied and CircuitOpenException gets
+    raised, so the message gets retried after the visibility timeout of the queue (host.json).
+    """
+    deadline = __get_deadline()
+    logger = __get_logger()
+    logger.info('Continuing copies, continuation %d', message['Continuation'])
+
+    telemetry.enable_metrics(os.getenv('ApplicationInsights'))
+    tracer = telemetry.start_tracing(os.getenv('ApplicationInsights'),
+        os.getenv('TracingSamplingRate'))
+    try:
+        with telemetry.span('git_to_dbfs_continuation',
+            continuation=message['Continuation']):
+            routing_table = __get_routing_table()
+            routes, checkpoints = routing_table.from_continuation(message)
+            open_circuits = routing_table.get_open_circuits(routes)
+            if open_circuits:
+                logger.warning('Postponing continuation %d, circuit of %s is open',
+                    message['Continuation'], open_circuits)
+                raise CircuitOpenException(', '.join(open_circuits))
+            heads = None
+            if message.get('Notification'):
+                notification = GitPushNotification(message['Notification'])
+                await asyncio.get_running_loop().run_in_executor(None,
+                    telemetry.run_in_context(routing_table.complete), notification, logger)
+                for mapping, versions in routing_table.route(notification).items():
+                    routes.setdefault(mapping, set()).update(versions)
+                heads = __get_heads(notification)
+            if not routes:
+                logger.info('No version folders to copy')
+                return
+            unfinished = await __copy(routing_table, routes, logger, deadline, checkpoints,
+                heads)
+            if unfinished:
+                __continue_later(routing_table, unfinished, message['Continuation'] + 1,
+                    continuation, logger)
+    finally:
+        if tracer:
+            tracer.finish()
+
+async def reconcile_dbfs(continuation: func.Out[str]):
+    """
+    Copies again the version folders whose DBFS copy drifted from Git (e.g. because a webhook
+    delivery got lost), sending at most "ReconcileApiCalls" setting requests to GitHub and DBFS
+    to find them. Copies that don't fit in the time budget get continued as in "main".
+    """
+    deadline = __get_deadline()
+    logger = __get_logger()
+    logger.info('Reconciling DBFS with Git')
+
+    telemetry.enable_metrics(os.getenv('ApplicationInsights'))
+    tracer = telemetry.start_tracing(os.getenv('ApplicationInsights'),
+        os.getenv('TracingSamplingRate'))
+    try:
+        with telemetry.span('git_to_dbfs_reconcile'):
+            routing_table = __get_routing_table()
+            max_api_calls = int(os.getenv('ReconcileApiCalls',
+                str(DEFAULT_RECONCILE_API_CALLS)))
+            routes = await asyncio.get_running_loop().run_in_executor(None,
+                telemetry.run_in_context(routing_table.reconcile), logger, max_api_calls)
+            if not routes:
+                logger.info('No version folders drifted')
+                return
+
+            unfinished = await __copy(routing_table, routes, logger, deadline)
+            if unfinished:
+                __continue_later(routing_table, unfinished, 1, continuation, logger)
+    finally:
+        if tracer:
+            tracer.finish()
+
+async def __process(req: func.HttpRequest, logger: Logger, deadline: Deadline,
+    continuation: func.Out[str]) -> func.HttpResponse:
     # Verify request comes from GitHub Webhook
-    if not validate_payload(req, os.getenv('WebhookSecret')):
+    with telemetry.span('Validate payload'):
+        valid = validate_payload(req, os.getenv('WebhookSecret'))
+    if not valid:
         logger.error('Forbidden request')
         return func.HttpResponse('Forbidden.', status_code=403)
 
     # Process "Git push to a repository" notifications
     try:
-        notification = GitPushNotification(req.get_json())
+        with telemetry.span('Parse notification'):
+            notification = GitPushNotification(req.get_json())
     except AttributeError:
         logger.warning('Ignoring notification: Invalid type')
         return func.HttpResponse('Ignoring notification: Invalid type', status_code=200)
 
-    # Get the version folders that got modified under Git base path
-    git_base_path = GitPath(os.getenv('GitRepo'), os.getenv('GitBasePath'), os.getenv('GitBranch'))
-    logger.info('Checking for modified version folders '
-        '[GitHub Repo "%s", Branch "%s", Base Path "%s"]',
-        git_base_path.repo, git_base_path.branch, git_base_path.path)
+    # Get all changed files from GitHub if the notification doesn't list all of them
+    routing_table = __get_routing_table()
+    if notification.is_truncated:
+        try:
+            with telemetry.span('Complete notification'):
+                await asyncio.get_running_loop().run_in_executor(None,
+                    telemetry.run_in_context(routing_table.complete), notification, logger)
+        except CircuitOpenException as ex:
+            # GitHub doesn't deliver the notification again, so it gets completed later
+            if not __complete_later(routing_table, notification, continuation, logger, ex):
+                return func.HttpResponse('Failed to compare GitHub commits.', status_code=500)
+            return func.HttpResponse('Notification postponed, it will be processed later.',
+                status_code=202)
+        except GitHubException as ex:
+            logger.exception('Failed to compare GitHub commits', exc_info=ex)
+            return func.HttpResponse('Failed to compare GitHub commits.', status_code=500)
 
-    modified_files = notification.get_modified_files(git_base_path)
+    # Get the version folders that got modified under the Git base paths of every mapping
+    with telemetry.span('Route notification'):
+        routes = routing_table.route(notification)
+    for mapping, versions in routes.items():
+        logger.info('Modified version folders %s '
+            '[GitHub Repo "%s", Branch "%s", Base Path "%s"]', sorted(versions),
+            mapping.git_path.repo, mapping.git_path.branch, mapping.git_path.path)
 
-    versions = get_versions(git_base_path.path, modified_files)
-    if len(versions) == 0:
+    if len(routes) == 0:
         logger.warning('Ignoring notification: No version folders modified')
         return func.HttpResponse('Ignoring notification: No version folders modified',
             status_code=200)
 
     # Copy all files in modified version folders from GitHub to Databricks
     try:
-        git = GitHub(os.getenv('GitApi'), os.getenv('GitToken'), logger)
-        dbfs = DBFS(os.getenv('DatabricksHost'), os.getenv('DatabricksToken'))
-        dbfs_base_path = os.getenv('DatabricksDbfsBasePath')
-        copy_versions_to_dbfs(versions, git, git_base_path, dbfs, dbfs_base_path, logger)
+        unfinished = await __copy(routing_table, routes, logger, deadline,
+            heads=__get_heads(notification))
     except GitHubException as ex:
         logger.exception('Failed to access GitHub files', exc_info=ex)
         return func.HttpResponse('Failed to access GitHub files.', status_code=500)
@@ -79,4 +205,57 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         logger.exception('Failed to access DBFS', exc_info=ex)
         return func.HttpResponse('Failed to access DBFS.', status_code=500)
 
+    if unfinished:
+        if not __continue_later(routing_table, unfinished, 1, continuation, logger):
+            return func.HttpResponse('Failed to copy all files in time.', status_code=500)
+        return func.HttpResponse('Notification partially processed, copies will be continued.',
+            status_code=202)
+
     return func.HttpResponse('Notification processed successfully.', status_code=200)
+
+async def __copy(routing_table: RoutingTable, routes: Dict[Mapping, Set[str]], logger: Logger,
+    deadline: Deadline, checkpoints: Checkpoints = None,
+    heads: Dict[Tuple[str, str], str] = None) -> Checkpoints:
+    # Copies interrupted by a crash (see "SyncJournalPath" setting) get finished along with these
+    recovered_routes, recovered_checkpoints = routing_table.recover(logger)
+    if recovered_routes:
+        routes = {mapping: set(versions) for mapping, versions in routes.items()}
+        for mapping, versions in recovered_routes.items():
+            routes.setdefault(mapping, set()).update(versions)
+        checkpoints = {**recovered_checkpoints, **(checkpoints or {})}
+
+    return await asyncio.get_running_loop().run_in_executor(None,
+        telemetry.run_in_context(routing_table.sync), routes, logger, deadline, checkpoints,
+        heads)
+
+def __get_heads(notification: GitPushNotification) -> Dict[Tuple[str, str], str]:
+    # Copies for the head of a push can use the entries of the version cache for that head
+    return {(notification.repo, notification.ref): notification.after}
+
+def __complete_later(routing_table: RoutingTable, notification: GitPushNotification,
+    continuation: func.Out[str], logger: Logger, ex: CircuitOpenException) -> bool:
+    # Send a continuation message with the truncated notification, to complete and copy it
+    if continuation is None:
+        logger.exception('Failed to compare GitHub commits', exc_info=ex)
+        return False
+
+    logger.warning('Circuit of GitHub is open, completing notification in a continuation: %s',
+        ex)
+    continuation.set(json.dumps(routing_table.to_continuation({}, 1, notification)))
+    return True
+
+def __continue_later(routing_table: RoutingTable, unfinished: Checkpoints, number: int,
+    continuation: func.Out[str], logger: Logger) -> bool:
+    # Send a continuation message with the checkpoints of unfinished copies
+    max_continuations = int(os.getenv('MaxContinuations', str(DEFAULT_MAX_CONTINUATIONS)))
+    versions = sorted({version for version, _ in unfinished})
+    if continuation is None or number > max_continuations:
+        logger.error('Copies of versions %s did not finish in time and cannot be continued',
+            versions)
+        return False
+
+    logger.warning('Copies of versions %s did not finish in time, sending continuation %d',
+        versions, number)
+    continuation.set(json.dumps(routing_table.to_continuation(unfinished, number)))
+    routing_table.release(unfinished)
+    return True
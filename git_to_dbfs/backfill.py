@@ -0,0 +1,235 @@
+"""
+Command-line bulk loader that copies every version folder of the mappings of a routing table from
+GitHub to DBFS, e.g. when onboarding a repo.
+
+Usage:
+    python -m git_to_dbfs.backfill [--routing-table routing.json] [--versions v0.0.1,v0.0.2]
+        [--concurrency 16] [--journal backfill.journal] [--dry-run] [--verbose]
+
+Without --routing-table, the routing table comes from the environment (see
+RoutingTable.from_env). Versions are found with one recursive tree request per repo/branch.
+Every copied version gets recorded in a local journal (JSON lines), so an interrupted backfill
+can be run again and only copies what is missing (or what changed in Git since). With
+--dry-run, it only prints the versions, requests and bytes that the backfill would copy.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from hashlib import sha1
+import json
+import logging
+from logging import Logger
+import math
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Set, TextIO, Tuple
+
+from .reconcile import get_git_versions
+from .routing import Mapping, RoutingTable
+from .services import DBFS
+from .services.telemetry import run_in_context
+
+DEFAULT_JOURNAL = 'backfill.journal'
+
+class BackfillUnit:
+    """
+    Copy of a version folder to the DBFS base path of one or many mappings that only differ in
+    their Databricks workspace.
+    """
+
+    def __init__(self, version: str, mappings: List[Mapping], files: Dict[str, Tuple[str, int]]):
+        self.version = version
+        self.mappings = mappings
+        self.files = files
+        # Changes whenever any file of the version changes in Git
+        self.digest = sha1(json.dumps(sorted(files.items())).encode()).hexdigest()
+
+    @property
+    def keys(self) -> List[str]:
+        """
+        Identifies the copy of the version to every mapping, e.g. in the journal.
+        """
+        return [json.dumps([*mapping.key, self.version]) for mapping in self.mappings]
+
+    @property
+    def size(self) -> int:
+        """
+        Bytes to download from GitHub.
+        """
+        return sum(size for _, size in self.files.values())
+
+    def get_requests(self, block_size: int = DBFS.MAX_BLOCK_SIZE) -> int:
+        """
+        Estimates the requests of the copy: listing and downloading the files from GitHub, and
+        deleting the folder and creating, adding blocks to and closing every file in every DBFS
+        target.
+        """
+        uploads = sum(2 + math.ceil(size / block_size) for _, size in self.files.values())
+        return 1 + len(self.files) + len(self.mappings) * (1 + uploads)
+
+class Journal:
+    """
+    Append-only file with the copies done by previous backfills, one JSON object per line.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.done[entry['Key']] = entry['Digest']
+
+    def is_done(self, unit: BackfillUnit) -> bool:
+        """
+        Whether a version was already copied to all its mappings, with the same files.
+        """
+        return all(self.done.get(key) == unit.digest for key in unit.keys)
+
+    def record(self, unit: BackfillUnit):
+        """
+        Records that a version got copied to all its mappings.
+        """
+        with open(self.path, 'a', encoding='utf-8') as file:
+            for key in unit.keys:
+                file.write(json.dumps({'Key': key, 'Digest': unit.digest}) + '\n')
+                self.done[key] = unit.digest
+
+def plan(routing_table: RoutingTable, logger: Logger,
+    versions: Optional[Set[str]] = None) -> List[BackfillUnit]:
+    """
+    Gets the copies of all versions (or only the given ones) of every mapping, with the files
+    from the recursive tree of every repo/branch.
+    Raises a ValueError if GitHub truncated any tree.
+    """
+    trees: Dict[tuple, dict] = {}
+    units: Dict[tuple, BackfillUnit] = {}
+    for mapping in routing_table.mappings:
+        key = (mapping.settings['GitApi'], mapping.settings['GitToken'],
+            mapping.git_path.repo, mapping.git_path.branch)
+        if key not in trees:
+            trees[key] = routing_table.git(mapping, logger).get_tree(mapping.git_path.repo,
+                mapping.git_path.branch)
+
+        for version, files in get_git_versions(trees[key], mapping.git_path.path,
+            mapping.git_path.recursive).items():
+            if versions and version not in versions:
+                continue
+            unit_key = (*key, mapping.git_path.path, mapping.git_path.recursive,
+                mapping.dbfs_base_path, mapping.settings['Transform'], version)
+            if unit_key in units:
+                units[unit_key].mappings.append(mapping)
+            else:
+                units[unit_key] = BackfillUnit(version, [mapping], files)
+    return sorted(units.values(), key=lambda x: (x.version, x.mappings[0].dbfs_base_path))
+
+def backfill(routing_table: RoutingTable, units: List[BackfillUnit], journal: Journal,
+    logger: Logger, concurrency: int = 16, out: TextIO = sys.stderr) -> int:
+    """
+    Copies the versions that are not done in the journal yet, with up to concurrency versions
+    being copied at the same time, printing the progress and the estimated time left to out.
+    Versions whose copies did not finish (e.g. a circuit breaker was open, or they ran out of
+    time) are not recorded in the journal, so the next backfill copies them again.
+    Returns the number of versions that failed or did not finish.
+    """
+    pending = [unit for unit in units if not journal.is_done(unit)]
+    if not pending:
+        print(f'All {len(units)} versions already done', file=out)
+        return 0
+
+    total_size = sum(unit.size for unit in pending)
+    print(f'{len(units) - len(pending)} versions already done, copying {len(pending)} versions '
+        f'({__format_size(total_size)})', file=out)
+
+    start = time.perf_counter()
+    copied_size = done = failed = unfinished = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(run_in_context(routing_table.sync),
+                {mapping: {unit.version} for mapping in unit.mappings}, logger): unit
+            for unit in pending}
+        for future in as_completed(futures):
+            unit = futures[future]
+            try:
+                if future.result():
+                    status = 'unfinished'
+                    unfinished += 1
+                else:
+                    journal.record(unit)
+                    status = 'done'
+                    done += 1
+            except Exception as ex: # pylint: disable=broad-except
+                logger.exception('Failed to copy version "%s"', unit.version, exc_info=ex)
+                status = 'failed'
+                failed += 1
+            copied_size += unit.size
+            elapsed = time.perf_counter() - start
+            left = (total_size - copied_size) / copied_size * elapsed if copied_size else 0
+            print(f'[{done + failed + unfinished}/{len(pending)}] {unit.version}: {status} | '
+                f'{__format_size(copied_size)}/{__format_size(total_size)} | '
+                f'{copied_size / 1024 / 1024 / elapsed:.1f} MB/s | ETA {left:.0f}s',
+                file=out)
+
+    print(f'Copied {done} versions, {failed} failed, {unfinished} unfinished, in '
+        f'{time.perf_counter() - start:.1f}s', file=out)
+    return failed + unfinished
+
+def print_plan(units: List[BackfillUnit], journal: Journal, out: TextIO = sys.stdout):
+    """
+    Prints the versions that a backfill would copy, with their requests and bytes.
+    """
+    requests = size = 0
+    for unit in units:
+        if journal.is_done(unit):
+            continue
+        requests += unit.get_requests()
+        size += unit.size * len(unit.mappings)
+        print(f'{unit.version} -> {", ".join(x.dbfs_base_path for x in unit.mappings)}: '
+            f'{len(unit.files)} files, {__format_size(unit.size)}, {unit.get_requests()} '
+            'requests', file=out)
+    print(f'Planned: {requests} requests, {__format_size(size)} to upload', file=out)
+
+def main(args: Optional[List[str]] = None) -> int:
+    """
+    Entry point of the command line.
+    """
+    parser = argparse.ArgumentParser(description='Copy all version folders from GitHub to DBFS.')
+    parser.add_argument('--routing-table', help='JSON or YAML routing table '
+        '(default: from environment variables)')
+    parser.add_argument('--versions', help='Comma-separated versions to copy (default: all)')
+    parser.add_argument('--concurrency', type=int, default=16,
+        help='Versions copied at the same time')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL,
+        help='Journal of copied versions, to resume interrupted backfills')
+    parser.add_argument('--dry-run', action='store_true',
+        help='Only print the versions, requests and bytes to copy')
+    parser.add_argument('--verbose', action='store_true', help='Log every file copied')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    logger = logging.getLogger(__name__)
+    config = RoutingTable.from_file(args.routing_table) if args.routing_table \
+        else RoutingTable.from_env()
+    # Connection pools sized for the concurrency of the backfill
+    routing_table = RoutingTable(config.mappings, args.concurrency)
+    versions = set(args.versions.split(',')) if args.versions else None
+    units = plan(routing_table, logger, versions)
+    journal = Journal(args.journal)
+
+    if args.dry_run:
+        print_plan(units, journal)
+        return 0
+    return 1 if backfill(routing_table, units, journal, logger, args.concurrency) else 0
+
+def __format_size(size: float) -> str:
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GB'
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Helper methods to find version folders whose DBFS copy drifted from Git (e.g. because a webhook
+delivery got lost), so they can be copied again.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from .services import LFS_POINTER_MAX_SIZE, DBFSException, Sink, Transform
+from .services.telemetry import run_in_context, span
+from .version import VersionMatcher
+
+# Files of every version folder, by version: {version: {file: (sha, size)}}
+VersionIndex = Dict[str, Dict[str, Tuple[str, int]]]
+
+class ApiBudget:
+    """
+    Number of API calls that a reconciliation run can still make.
+    """
+
+    def __init__(self, calls: int):
+        self.calls = calls
+
+    def charge(self, calls: int):
+        """
+        Takes calls that were already made from the budget, even if it goes over it.
+        """
+        self.calls -= calls
+
+    def spend(self, calls: int = 1) -> bool:
+        """
+        Takes some calls from the budget, if there are enough left.
+        """
+        if self.calls < calls:
+            return False
+        self.calls -= calls
+        return True
+
+def get_git_versions(tree: dict, base_path: str, recursive: bool = False) -> VersionIndex:
+    """
+    Gets the files of all version folders under a base path from the recursive tree of a branch
+    (see GitHub.get_tree). With recursive, files in subfolders of version folders are included,
+    by their path relative to the version folder.
+    Raises a ValueError if GitHub truncated the tree, as missing versions couldn't be told apart
+    from removed ones.
+    """
+    if tree.get('truncated'):
+        raise ValueError('Tree is truncated')
+
+    matcher = VersionMatcher([base_path], [base_path] if recursive else [])
+    versions: VersionIndex = {}
+    for entry in tree['tree']:
+        match = matcher.match(entry['path']) if entry['type'] == 'blob' else None
+        if match:
+            _, version, file = match
+            versions.setdefault(version, {})[file] = (entry['sha'], entry.get('size', 0))
+    return versions
+
+def list_dbfs_versions(dbfs: Sink, dbfs_base_path: str) -> Set[str]:
+    """
+    Lists the version folders under a DBFS base path.
+    """
+    try:
+        files = dbfs.list(dbfs_base_path).get('files', [])
+    except DBFSException as ex:
+        if str(ex) == '404':
+            return set()
+        raise
+    return {x['path'].rstrip('/').split('/')[-1] for x in files if x['is_dir']}
+
+def list_dbfs_files(dbfs: Sink, dbfs_path: str, recursive: bool = False) \
+    -> Tuple[Dict[str, int], int]:
+    """
+    Lists the sizes of the files in a DBFS folder (and its subfolders, with recursive), by path
+    relative to the folder.
+    Returns the sizes and the number of requests sent.
+    """
+    sizes: Dict[str, int] = {}
+    folders = [dbfs_path]
+    requests = 0
+    while folders:
+        folder = folders.pop()
+        requests += 1
+        try:
+            files = dbfs.list(folder).get('files', [])
+        except DBFSException as ex:
+            if str(ex) == '404':
+                continue
+            raise
+        for file in files:
+            if not file['is_dir']:
+                sizes[file['path'][len(dbfs_path) + 1:]] = file['file_size']
+            elif recursive:
+                folders.append(file['path'].rstrip('/'))
+    return sizes, requests
+
+def get_drifted_versions(git_versions: VersionIndex, dbfs: Sink, dbfs_base_path: str,
+    budget: ApiBudget, logger: Logger, max_workers: int = 4,
+    order: Iterable[str] = None, recursive: bool = False,
+    transform: Optional[Transform] = None) -> Set[str]:
+    """
+    Gets the versions whose DBFS folder differs from Git: versions missing from DBFS, versions
+    removed from Git and versions with missing, extra or resized files. Small files in Git may
+    be LFS pointers, so their copies in DBFS may be bigger. Files changed by the transform of the
+    copies, if any, are expected with their new names, and any size.
+    Version folders in both get listed in parallel batches of max_workers requests, in the given
+    order (all of them by default), while there are API calls left in the budget (with
+    recursive, their subfolders get listed too, and charged to the budget once listed).
+    Versions that couldn't be checked are logged and left for later runs.
+    """
+    if not budget.spend():
+        return set()
+    with span('List DBFS versions', path=dbfs_base_path):
+        dbfs_versions = list_dbfs_versions(dbfs, dbfs_base_path)
+
+    drifted = (git_versions.keys() - dbfs_versions) | (dbfs_versions - git_versions.keys())
+    candidates = [x for x in (order or sorted(git_versions)) if x in dbfs_versions]
+    checked = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+        span('List DBFS files', path=dbfs_base_path):
+        while checked < len(candidates) and budget.calls > 0:
+            batch = candidates[checked:checked + min(max_workers, budget.calls)]
+            budget.spend(len(batch))
+            checked += len(batch)
+            futures = [
+                executor.submit(run_in_context(list_dbfs_files), dbfs,
+                    f'{dbfs_base_path}/{version}', recursive)
+                for version in batch]
+            for version, future in zip(batch, futures):
+                expected = __get_expected_sizes(git_versions[version], transform)
+                files, requests = future.result()
+                budget.charge(requests - 1)
+                if not __sizes_match(files, expected):
+                    drifted.add(version)
+
+    if checked < len(candidates):
+        logger.warning('API call budget exhausted, %d versions in DBFS base path "%s" '
+            'not checked', len(candidates) - checked, dbfs_base_path)
+    return drifted
+
+def __get_expected_sizes(files: Dict[str, Tuple[str, int]], transform: Optional[Transform]) \
+    -> Dict[str, Optional[int]]:
+    # Sizes of transformed files are unknown
+    return dict(
+        (transform.rename(file), None) if transform and transform.applies(file) else (file, size)
+        for file, (_, size) in files.items())
+
+def __sizes_match(dbfs_sizes: Dict[str, int], git_sizes: Dict[str, Optional[int]]) -> bool:
+    # Trees list the size of LFS pointers, not of their objects
+    return dbfs_sizes.keys() == git_sizes.keys() and all(
+        git_sizes[file] is None or size == git_sizes[file] or
+        (git_sizes[file] < LFS_POINTER_MAX_SIZE and size > git_sizes[file])
+        for file, size in dbfs_sizes.items())
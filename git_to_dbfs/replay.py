@@ -0,0 +1,198 @@
+"""
+Command-line bulk replay of GitHub push deliveries, e.g. the deliveries that failed during an
+outage: instead of redelivering each of them to the function (copying the same versions again
+and again), all of them get reduced to the final set of version folders they modified, which
+get copied once, in a single sync. Copies catch up with the head of every branch at the time
+of the replay, which includes the changes of all the pushes replayed.
+
+Usage:
+    python -m git_to_dbfs.replay deliveries.jsonl [--routing-table routing.json]
+        [--concurrency 16] [--dry-run] [--verbose]
+
+Every line of the file (or of stdin, with "-") is a JSON push payload, or a delivery with its
+payload, like the ones of GitHub API for webhook deliveries ({"event": "push", "request":
+{"headers": {...}, "payload": {...}}}). Deliveries of other events, and payloads that are not
+valid push notifications, are skipped. Without --routing-table, the routing table comes from
+the environment (see RoutingTable.from_env). With --dry-run, it only prints the version folders
+that the replay would copy.
+"""
+
+import argparse
+import json
+import logging
+from logging import Logger
+import sys
+from typing import Dict, Iterable, List, Optional, Set, TextIO, Tuple
+
+from .routing import Mapping, RoutingTable
+from .services import GitHubException, GitPushNotification
+
+PUSH_EVENT = 'push'
+
+class Delivery:
+    """
+    Push notification of a delivery, with the line it was read from.
+    """
+
+    def __init__(self, line: int, notification: GitPushNotification):
+        self.line = line
+        self.notification = notification
+
+class ReplayTarget:
+    """
+    Version folder of a repo/branch to copy to the DBFS base paths of one or many mappings.
+    """
+
+    def __init__(self, repo: str, branch: str, version: str, mappings: List[Mapping]):
+        self.repo = repo
+        self.branch = branch
+        self.version = version
+        self.mappings = mappings
+
+def read_deliveries(lines: Iterable[str], logger: Logger) -> Tuple[List[Delivery], int]:
+    """
+    Reads push notifications from JSON lines with push payloads or deliveries (see module
+    docstring). Duplicated deliveries of the same push are only read once.
+    Returns the deliveries and the number of invalid lines, which get logged and skipped.
+    """
+    deliveries = []
+    pushes = set()
+    invalid = 0
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            event, payload = __get_payload(json.loads(line))
+            if event and event != PUSH_EVENT:
+                logger.info('Skipping line %d: "%s" event', number, event)
+                continue
+            notification = GitPushNotification(payload)
+        except (AttributeError, TypeError, ValueError) as ex:
+            logger.warning('Skipping line %d: Invalid push notification %s', number, ex)
+            invalid += 1
+            continue
+
+        push = (notification.repo, notification.ref, notification.before, notification.after)
+        if notification.after and push in pushes:
+            continue
+        pushes.add(push)
+        deliveries.append(Delivery(number, notification))
+    return deliveries, invalid
+
+def reduce_deliveries(routing_table: RoutingTable, deliveries: List[Delivery],
+    logger: Logger) -> List[ReplayTarget]:
+    """
+    Reduces deliveries to the version folders they modified in every mapping, each of them once.
+    Truncated notifications get completed from GitHub first (see RoutingTable.complete).
+    Raises a GitHubException if they can't be.
+    """
+    targets: Dict[tuple, ReplayTarget] = {}
+    for delivery in deliveries:
+        notification = delivery.notification
+        routing_table.complete(notification, logger)
+        branch = notification.ref.replace('refs/heads/', '', 1)
+        for mapping, versions in routing_table.route(notification).items():
+            for version in versions:
+                key = (notification.repo, branch, mapping.git_path.path, version)
+                target = targets.setdefault(key,
+                    ReplayTarget(notification.repo, branch, version, []))
+                if mapping not in target.mappings:
+                    target.mappings.append(mapping)
+    return sorted(targets.values(), key=lambda x: (x.repo, x.branch, x.version))
+
+def get_routes(targets: List[ReplayTarget]) -> Dict[Mapping, Set[str]]:
+    """
+    Gets the routes to sync the version folders of replay targets.
+    """
+    routes: Dict[Mapping, Set[str]] = {}
+    for target in targets:
+        for mapping in target.mappings:
+            routes.setdefault(mapping, set()).add(target.version)
+    return routes
+
+def replay(routing_table: RoutingTable, targets: List[ReplayTarget], logger: Logger,
+    out: TextIO = sys.stderr) -> bool:
+    """
+    Copies the version folders of replay targets in a single sync.
+    Returns whether all of them got copied.
+    """
+    if not targets:
+        print('No version folders to copy', file=out)
+        return True
+
+    print(f'Copying {len(targets)} version folders', file=out)
+    try:
+        unfinished = routing_table.sync(get_routes(targets), logger)
+    except Exception as ex: # pylint: disable=broad-except
+        logger.exception('Failed to replay deliveries', exc_info=ex)
+        print(f'Failed to copy version folders: {ex}', file=out)
+        return False
+
+    if unfinished:
+        print(f'Copies of versions {sorted({version for version, _ in unfinished})} did not '
+            'finish, run the replay again', file=out)
+        return False
+    print(f'Copied {len(targets)} version folders', file=out)
+    return True
+
+def print_plan(deliveries: List[Delivery], targets: List[ReplayTarget],
+    out: TextIO = sys.stdout):
+    """
+    Prints the version folders that a replay would copy.
+    """
+    for target in targets:
+        print(f'{target.repo}@{target.branch} {target.version} -> '
+            f'{", ".join(x.dbfs_base_path for x in target.mappings)}', file=out)
+    print(f'Planned: {len(targets)} version folders from {len(deliveries)} pushes', file=out)
+
+def main(args: Optional[List[str]] = None) -> int:
+    """
+    Entry point of the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Replay GitHub push deliveries, copying each modified version folder once.')
+    parser.add_argument('deliveries', help='JSON lines file with push payloads or deliveries '
+        '("-" for stdin)')
+    parser.add_argument('--routing-table', help='JSON or YAML routing table '
+        '(default: from environment variables)')
+    parser.add_argument('--concurrency', type=int, default=16,
+        help='Versions copied at the same time')
+    parser.add_argument('--dry-run', action='store_true',
+        help='Only print the version folders to copy')
+    parser.add_argument('--verbose', action='store_true', help='Log every file copied')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    logger = logging.getLogger(__name__)
+    config = RoutingTable.from_file(args.routing_table) if args.routing_table \
+        else RoutingTable.from_env()
+    # Connection pools sized for the concurrency of the replay
+    routing_table = RoutingTable(config.mappings, args.concurrency, config.journal)
+
+    if args.deliveries == '-':
+        deliveries, invalid = read_deliveries(sys.stdin, logger)
+    else:
+        with open(args.deliveries, encoding='utf-8') as file:
+            deliveries, invalid = read_deliveries(file, logger)
+    try:
+        targets = reduce_deliveries(routing_table, deliveries, logger)
+    except GitHubException as ex:
+        print(f'Failed to compare GitHub commits: {ex}', file=sys.stderr)
+        return 1
+
+    print(f'Read {len(deliveries)} pushes ({invalid} invalid lines skipped)', file=sys.stderr)
+    if args.dry_run:
+        print_plan(deliveries, targets)
+        return 0
+    return 0 if replay(routing_table, targets, logger) else 1
+
+def __get_payload(delivery: dict) -> Tuple[Optional[str], dict]:
+    # Deliveries of GitHub API have the event and the request with its headers and payload
+    request = delivery.get('request', delivery)
+    if 'payload' not in request:
+        return None, delivery
+    headers = {name.lower(): value for name, value in (request.get('headers') or {}).items()}
+    return delivery.get('event') or headers.get('x-github-event'), request['payload']
+
+if __name__ == '__main__':
+    sys.exit(main())
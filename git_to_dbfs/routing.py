@@ -0,0 +1,477 @@
+"""
+Routing table that maps many GitHub repos/branches/base paths to DBFS base paths, so a single
+deployment can serve all of them.
+
+Example of routing table (JSON, or YAML if PyYAML is installed):
+{
+    "MaxConcurrency": 8,
+    "Mappings": [
+        {
+            "GitRepo": "magencio/git_to_dbfs_function",
+            "GitBranch": "master",
+            "GitBasePath": "samplefiles",
+            "DatabricksDbfsBasePath": "/mnt/playground/magencio/data/samplefiles"
+        }
+    ]
+}
+Settings missing from a mapping ("GitApi", "GitToken", "DatabricksHost", "DatabricksToken"...)
+are taken from the environment variables with the same name (see "Settings" in README.md).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+from logging import Logger
+import os
+import random
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .services import GitHub, GitPath, GitPushNotification, DBFS, Checkpoint, Deadline
+from .services import DEFAULT_LEASE, JournaledCheckpoint, SyncJournal
+from .services import FilesSink, LocalSink, Sink, get_transform
+from .services import get_rate_limiter
+from .services import CircuitOpenException, get_breaker
+from .services import DEFAULT_VERSION_CACHE_TTL, VersionCache
+from .services.telemetry import run_in_context, span
+from .reconcile import ApiBudget, get_drifted_versions, get_git_versions
+from .version import VERSION_ORDERS, VersionMatcher, copy_versions_to_dbfs, sort_versions
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+MAPPING_SETTINGS = ['GitApi', 'GitToken', 'GitRepo', 'GitBranch', 'GitBasePath',
+    'DatabricksHost', 'DatabricksToken', 'DatabricksDbfsBasePath', 'GitRateLimit',
+    'DatabricksRateLimit', 'RateLimitStatePath', 'RecursiveVersions', 'DatabricksSink',
+    'LocalSinkPath', 'Transform', 'ParquetRowGroupSize', 'VersionOrder', 'VersionTimeBudget']
+
+SINKS = ['dbfs', 'files', 'local']
+
+class Mapping:
+    """
+    Mapping from a GitHub repo/branch/base path to a DBFS base path.
+    """
+
+    def __init__(self, settings: dict):
+        self.settings = {name: settings.get(name, os.getenv(name)) for name in MAPPING_SETTINGS}
+        self.settings.update(
+            {name: value for name, value in settings.items() if name not in self.settings})
+        self.git_path = GitPath(self.settings['GitRepo'], self.settings['GitBasePath'],
+            self.settings['GitBranch'],
+            str(self.settings['RecursiveVersions']).lower() == 'true')
+        self.dbfs_base_path = self.settings['DatabricksDbfsBasePath']
+        self.sink = (self.settings['DatabricksSink'] or 'dbfs').lower()
+        if self.sink not in SINKS:
+            raise ValueError(f'Unknown sink "{self.sink}", expected any of {", ".join(SINKS)}')
+        self.transform = get_transform(self.settings['Transform'],
+            int(self.settings['ParquetRowGroupSize'] or 0))
+        self.version_order = (self.settings['VersionOrder'] or 'newest').lower()
+        if self.version_order not in VERSION_ORDERS:
+            raise ValueError(f'Unknown version order "{self.version_order}", expected any of '
+                f'{", ".join(VERSION_ORDERS)}')
+        self.version_time_budget = float(self.settings['VersionTimeBudget']) \
+            if self.settings['VersionTimeBudget'] else None
+
+    @property
+    def key(self) -> Tuple[str, str, str, str, str]:
+        """
+        Identifies the mapping without its secrets, e.g. in continuation messages.
+        """
+        return (self.git_path.repo, self.git_path.branch, self.git_path.path,
+            self.settings['DatabricksHost'], self.dbfs_base_path)
+
+# Checkpoints of copies of versions, by (version, mapping)
+Checkpoints = Dict[Tuple[str, Mapping], Checkpoint]
+
+class RoutingTable:
+    """
+    Routing table with many mappings, indexed by (repo, ref) and by base path.
+    GitHub and DBFS clients, their connection pools and the concurrency limit are shared by all
+    mappings.
+    With a journal, copies get claimed in the journal when they start, and forgotten once they
+    finish or get handed off to other invocations (see release).
+    With a version cache, shared by the GitHub clients, version folders known to be missing at
+    the head of a push are neither listed nor deleted again by copies for that push (see sync).
+    """
+
+    def __init__(self, mappings: Iterable[Mapping], max_concurrency: int = 4,
+        journal: Optional[SyncJournal] = None, version_cache: Optional[VersionCache] = None):
+        self.mappings = list(mappings)
+        self.max_concurrency = max_concurrency
+        self.journal = journal
+        self.version_cache = version_cache
+
+        mappings_by_ref: Dict[Tuple[str, str], List[Mapping]] = {}
+        for mapping in self.mappings:
+            key = (mapping.git_path.repo, mapping.git_path.ref)
+            mappings_by_ref.setdefault(key, []).append(mapping)
+
+        self.__index: Dict[Tuple[str, str], Tuple[VersionMatcher, Dict[str, List[Mapping]]]] = {}
+        for key, ref_mappings in mappings_by_ref.items():
+            mappings_by_base_path: Dict[str, List[Mapping]] = {}
+            for mapping in ref_mappings:
+                mappings_by_base_path.setdefault(mapping.git_path.path, []).append(mapping)
+            matcher = VersionMatcher(mappings_by_base_path,
+                [x.git_path.path for x in ref_mappings if x.git_path.recursive])
+            self.__index[key] = (matcher, mappings_by_base_path)
+
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max_concurrency)
+        self.__session.mount('https://', adapter)
+        self.__session.mount('http://', adapter)
+        self.__clients = {}
+
+    @classmethod
+    def from_dict(cls, config: dict) -> 'RoutingTable':
+        """
+        Creates a routing table from its configuration.
+        """
+        return cls([Mapping(x) for x in config['Mappings']], config.get('MaxConcurrency', 4))
+
+    @classmethod
+    def from_file(cls, path: str) -> 'RoutingTable':
+        """
+        Creates a routing table from a JSON or YAML configuration file.
+        """
+        with open(path, encoding='utf-8') as file:
+            if path.endswith(('.yaml', '.yml')):
+                if yaml is None:
+                    raise ImportError('PyYAML is required to read YAML routing tables')
+                return cls.from_dict(yaml.safe_load(file))
+            return cls.from_dict(json.load(file))
+
+    @classmethod
+    def from_env(cls) -> 'RoutingTable':
+        """
+        Creates a routing table from the file in "RoutingTable" environment variable or, if not
+        set, with a single mapping from the environment variables, and with the journal and
+        version cache of "SyncJournalPath" and "VersionCacheTtl" environment variables.
+        """
+        path = os.getenv('RoutingTable')
+        routing_table = cls.from_file(path) if path else cls([Mapping({})])
+        if os.getenv('SyncJournalPath'):
+            routing_table.journal = SyncJournal(os.getenv('SyncJournalPath'),
+                float(os.getenv('SyncJournalLease', str(DEFAULT_LEASE))))
+        ttl = float(os.getenv('VersionCacheTtl', str(DEFAULT_VERSION_CACHE_TTL)))
+        if ttl > 0:
+            routing_table.version_cache = VersionCache(ttl)
+        return routing_table
+
+    def route(self, notification: GitPushNotification) -> Dict[Mapping, Set[str]]:
+        """
+        Gets the modified versions of every mapping matching a "Git push to a repository"
+        notification.
+        """
+        entry = self.__index.get((notification.repo, notification.ref))
+        if not entry:
+            return {}
+
+        matcher, mappings_by_base_path = entry
+        repo_path = GitPath(notification.repo, '', notification.ref.replace('refs/heads/', '', 1))
+
+        versions = set()
+        for file in notification.get_modified_files(repo_path):
+            match = matcher.match(file)
+            if match:
+                base_path, version, file_path = match
+                versions.add((base_path, version, '/' in file_path))
+
+        # Files in subfolders of version folders only modify recursive mappings
+        routes: Dict[Mapping, Set[str]] = {}
+        for base_path, version, nested in versions:
+            for mapping in mappings_by_base_path[base_path]:
+                if not nested or mapping.git_path.recursive:
+                    routes.setdefault(mapping, set()).add(version)
+        return routes
+
+    def complete(self, notification: GitPushNotification, logger: Logger) -> bool:
+        """
+        Gets all changed files of a truncated notification of a repo/branch with mappings from
+        GitHub, with the GitHub client of any of those mappings.
+        Returns whether the notification was truncated.
+        """
+        entry = self.__index.get((notification.repo, notification.ref))
+        if not entry or not notification.is_truncated:
+            return False
+
+        _, mappings_by_base_path = entry
+        mapping = next(iter(mappings_by_base_path.values()))[0]
+        logger.info('Notification is truncated, comparing commits "%s" and "%s"',
+            notification.before, notification.after)
+        notification.changed_files = self.git(mapping, logger).get_changed_files(
+            notification.repo, notification.before, notification.after)
+        return True
+
+    def reconcile(self, logger: Logger, max_api_calls: int) -> Dict[Mapping, Set[str]]:
+        """
+        Gets the versions of every mapping whose DBFS folder drifted from Git (see
+        reconcile.get_drifted_versions), as routes to sync.
+        The recursive tree of every repo/branch gets fetched once, and at most max_api_calls
+        requests get sent to GitHub and DBFS. Mappings and versions get checked in random order,
+        so the ones left unchecked once the budget is exhausted get checked by later runs.
+        """
+        budget = ApiBudget(max_api_calls)
+        trees: Dict[tuple, Optional[dict]] = {}
+        routes: Dict[Mapping, Set[str]] = {}
+        for mapping in random.sample(self.mappings, len(self.mappings)):
+            key = (mapping.settings['GitApi'], mapping.settings['GitToken'],
+                mapping.git_path.repo, mapping.git_path.branch)
+            if key not in trees:
+                if not budget.spend():
+                    logger.warning('API call budget exhausted, not all mappings checked')
+                    break
+                with span('Get Git tree', repo=mapping.git_path.repo):
+                    trees[key] = self.git(mapping, logger).get_tree(mapping.git_path.repo,
+                        mapping.git_path.branch)
+
+            try:
+                git_versions = get_git_versions(trees[key], mapping.git_path.path,
+                    mapping.git_path.recursive)
+            except ValueError:
+                logger.warning('Not reconciling DBFS base path "%s": Git tree is truncated',
+                    mapping.dbfs_base_path)
+                continue
+
+            drifted = get_drifted_versions(git_versions, self.dbfs(mapping),
+                mapping.dbfs_base_path, budget, logger, self.max_concurrency,
+                random.sample(sorted(git_versions), len(git_versions)),
+                mapping.git_path.recursive, mapping.transform)
+            if drifted:
+                logger.warning('Versions %s in DBFS base path "%s" drifted from Git',
+                    sorted(drifted), mapping.dbfs_base_path)
+                routes[mapping] = drifted
+        return routes
+
+    def git(self, mapping: Mapping, logger: Logger) -> GitHub:
+        """
+        Gets the shared GitHub client for a mapping.
+        """
+        key = ('git', mapping.settings['GitApi'], mapping.settings['GitToken'])
+        if key not in self.__clients:
+            rate_limiter = get_rate_limiter(mapping.settings['GitApi'],
+                mapping.settings['GitRateLimit'], mapping.settings['RateLimitStatePath'])
+            self.__clients[key] = GitHub(mapping.settings['GitApi'], mapping.settings['GitToken'],
+                logger, self.__session, rate_limiter=rate_limiter,
+                version_cache=self.version_cache)
+        return self.__clients[key]
+
+    def dbfs(self, mapping: Mapping) -> Sink:
+        """
+        Gets the shared DBFS client (or the sink picked by "DatabricksSink" setting) for a
+        mapping.
+        """
+        if mapping.sink == 'local':
+            key = ('local', mapping.settings['LocalSinkPath'])
+            if key not in self.__clients:
+                self.__clients[key] = LocalSink(mapping.settings['LocalSinkPath'])
+            return self.__clients[key]
+
+        key = (mapping.sink, mapping.settings['DatabricksHost'],
+            mapping.settings['DatabricksToken'])
+        if key not in self.__clients:
+            rate_limiter = get_rate_limiter(mapping.settings['DatabricksHost'],
+                mapping.settings['DatabricksRateLimit'], mapping.settings['RateLimitStatePath'])
+            sink_class = FilesSink if mapping.sink == 'files' else DBFS
+            self.__clients[key] = sink_class(mapping.settings['DatabricksHost'],
+                mapping.settings['DatabricksToken'], self.__session, rate_limiter=rate_limiter)
+        return self.__clients[key]
+
+    def sync(self, routes: Dict[Mapping, Set[str]], logger: Logger,
+        deadline: Optional[Deadline] = None, checkpoints: Optional[Checkpoints] = None,
+        heads: Optional[Dict[Tuple[str, str], str]] = None) -> Checkpoints:
+        """
+        Copy all files in modified version folders of every mapping from GitHub to Databricks,
+        with at most max_concurrency versions being copied at the same time.
+        Mappings that only differ in their Databricks workspace download each file once and
+        copy it to all their workspaces at the same time.
+        Copies start from their checkpoints, if any, and stop once the deadline is reached (or
+        once the time budget of their version is over).
+        Versions get started by priority: every mapping gets its first version (see
+        "VersionOrder" setting) started before the second version of any mapping, and so on.
+        Heads are the SHAs of the branch heads that copies are for, by (repo, ref) (e.g. the
+        "after" commit of a push): only copies with a head use the version cache.
+        Returns the checkpoints of the copies that didn't finish, by (version, mapping).
+        """
+        targets = self.__get_targets(routes, checkpoints or {})
+        heads = heads or {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = [
+                executor.submit(run_in_context(copy_versions_to_dbfs), {version},
+                    self.git(mapping, logger), self.__get_git_path(mapping, heads),
+                    [self.dbfs(x) for x in mappings], mapping.dbfs_base_path,
+                    logger, deadline, {version: checkpoint}, mapping.transform,
+                    mapping.version_order, mapping.version_time_budget)
+                for version, mapping, mappings, checkpoint in targets]
+
+            errors = [future.exception() for future in futures]
+
+        errors = self.__defer_open_circuits(targets, errors, logger)
+        self.__forget_finished(targets, errors)
+        for error in errors:
+            if error is not None:
+                raise error
+        return self.__get_unfinished(targets)
+
+    @staticmethod
+    def get_open_circuits(routes: Dict[Mapping, Set[str]]) -> List[str]:
+        """
+        Gets the GitHub APIs and Databricks hosts of the routes whose circuit is open (see
+        CircuitBreaker), so their copies can't make progress for now.
+        """
+        endpoints = set()
+        for mapping in routes:
+            endpoints.add(mapping.settings['GitApi'])
+            if mapping.sink != 'local':
+                endpoints.add(mapping.settings['DatabricksHost'])
+        return sorted(endpoint for endpoint in endpoints
+            if endpoint and get_breaker(endpoint).is_open)
+
+    def recover(self, logger: Logger) -> Tuple[Dict[Mapping, Set[str]], Checkpoints]:
+        """
+        Claims the copies left unfinished in the journal by other workers whose lease expired
+        (e.g. after a crash), and gets them as routes to sync with their checkpoints, so only
+        their incomplete files get copied. Copies of mappings that are no longer in the routing
+        table get rolled back (forgotten).
+        """
+        routes: Dict[Mapping, Set[str]] = {}
+        checkpoints: Checkpoints = {}
+        if not self.journal:
+            return routes, checkpoints
+
+        mappings = {mapping.key: mapping for mapping in self.mappings}
+        dropped = []
+        for key, data, checkpoint in self.journal.recover():
+            copy_mappings = [mappings[tuple(x)] for x in data['Mappings'] if tuple(x) in mappings]
+            if not copy_mappings:
+                dropped.append(key)
+            for mapping in copy_mappings:
+                routes.setdefault(mapping, set()).add(data['Version'])
+                checkpoints[(data['Version'], mapping)] = checkpoint
+
+        if dropped:
+            logger.warning('Rolling back %d interrupted copies of unknown mappings', len(dropped))
+            self.journal.forget(dropped)
+        if checkpoints:
+            logger.warning('Recovering interrupted copies of versions %s',
+                sorted({version for version, _ in checkpoints}))
+        return routes, checkpoints
+
+    def release(self, checkpoints: Checkpoints):
+        """
+        Forgets copies from the journal once handed off to other invocations (e.g. in a
+        continuation message), so they never get recovered too.
+        """
+        if self.journal:
+            self.journal.forget({checkpoint.key for checkpoint in checkpoints.values()
+                if isinstance(checkpoint, JournaledCheckpoint)})
+
+    def to_continuation(self, checkpoints: Checkpoints, continuation: int = 1,
+        notification: Optional[GitPushNotification] = None) -> dict:
+        """
+        Creates the message of a job that continues unfinished copies (see sync), and with a
+        truncated notification, that completes and copies it too (e.g. when it couldn't be
+        completed because the circuit of GitHub was open).
+        """
+        message = {
+            'Continuation': continuation,
+            'Copies': [
+                {'Mapping': list(mapping.key), 'Version': version,
+                    'Checkpoint': checkpoint.to_dict()}
+                for (version, mapping), checkpoint in checkpoints.items()]
+        }
+        if notification:
+            message['Notification'] = notification.to_dict()
+        return message
+
+    def from_continuation(self, message: dict) -> Tuple[Dict[Mapping, Set[str]], Checkpoints]:
+        """
+        Gets the routes and checkpoints to continue unfinished copies from a continuation
+        message. Copies of mappings that are no longer in the routing table are dropped.
+        """
+        mappings = {mapping.key: mapping for mapping in self.mappings}
+        routes: Dict[Mapping, Set[str]] = {}
+        checkpoints: Checkpoints = {}
+        for copy in message['Copies']:
+            mapping = mappings.get(tuple(copy['Mapping']))
+            if mapping:
+                routes.setdefault(mapping, set()).add(copy['Version'])
+                checkpoints[(copy['Version'], mapping)] = \
+                    Checkpoint.from_dict(copy['Checkpoint'])
+        return routes, checkpoints
+
+    @staticmethod
+    def __get_git_path(mapping: Mapping, heads: Dict[Tuple[str, str], str]) -> GitPath:
+        head = heads.get((mapping.git_path.repo, mapping.git_path.ref))
+        if not head:
+            return mapping.git_path
+        git_path = mapping.git_path
+        return GitPath(git_path.repo, git_path.path, git_path.branch, git_path.recursive, head)
+
+    def __get_targets(self, routes: Dict[Mapping, Set[str]], checkpoints: Checkpoints) \
+        -> List[Tuple[str, Mapping, List[Mapping], Checkpoint]]:
+        # Mappings copied together share the checkpoint of any of them
+        targets = []
+        for version, mapping, mappings in self.__group_targets(routes):
+            checkpoint = next((checkpoints[(version, x)] for x in mappings
+                if (version, x) in checkpoints), None)
+            if self.journal:
+                key = json.dumps([mapping.git_path.repo, mapping.git_path.branch,
+                    mapping.git_path.path, mapping.dbfs_base_path, version])
+                checkpoint = self.journal.checkpoint(key,
+                    {'Mappings': [list(x.key) for x in mappings], 'Version': version}, checkpoint)
+            targets.append((version, mapping, mappings, checkpoint or Checkpoint()))
+        return targets
+
+    @staticmethod
+    def __defer_open_circuits(targets: List[Tuple[str, Mapping, List[Mapping], Checkpoint]],
+        errors: List[Optional[BaseException]], logger: Logger) -> List[Optional[BaseException]]:
+        # Copies stopped by an open circuit stay unfinished instead of failing, so they get
+        # continued once their endpoint recovers
+        deferred = []
+        for (version, _, _, checkpoint), error in zip(targets, errors):
+            if isinstance(error, CircuitOpenException):
+                checkpoint.finished = False
+                deferred.append(version)
+        if deferred:
+            logger.warning('Copies of versions %s deferred, circuit of %s is open',
+                sorted(set(deferred)), sorted({str(error) for error in errors
+                    if isinstance(error, CircuitOpenException)}))
+        return [None if isinstance(error, CircuitOpenException) else error
+            for error in errors]
+
+    def __forget_finished(self, targets: List[Tuple[str, Mapping, List[Mapping], Checkpoint]],
+        errors: List[Optional[BaseException]]):
+        # Copies that failed stay in the journal, so their next attempt continues them
+        if self.journal:
+            self.journal.forget(checkpoint.key
+                for (_, _, _, checkpoint), error in zip(targets, errors)
+                if error is None and checkpoint.finished)
+
+    @staticmethod
+    def __get_unfinished(targets: List[Tuple[str, Mapping, List[Mapping], Checkpoint]]) \
+        -> Checkpoints:
+        return {
+            (version, x): checkpoint
+            for version, _, mappings, checkpoint in targets
+            for x in mappings
+            if not checkpoint.finished}
+
+    @staticmethod
+    def __group_targets(
+        routes: Dict[Mapping, Set[str]]) -> List[Tuple[str, Mapping, List[Mapping]]]:
+        # Group mappings that only differ in their Databricks workspace, ordered by the rank of
+        # their version in their mapping
+        targets: Dict[tuple, Tuple[str, Mapping, List[Mapping]]] = {}
+        ranks: Dict[tuple, int] = {}
+        for mapping, versions in routes.items():
+            for rank, version in enumerate(sort_versions(versions, mapping.version_order)):
+                key = (mapping.settings['GitApi'], mapping.settings['GitToken'],
+                    mapping.git_path.repo, mapping.git_path.branch, mapping.git_path.path,
+                    mapping.git_path.recursive, mapping.dbfs_base_path,
+                    mapping.settings['Transform'], version)
+                targets.setdefault(key, (version, mapping, []))[2].append(mapping)
+                ranks[key] = min(rank, ranks.get(key, rank))
+        return [targets[key] for key in sorted(targets, key=ranks.get)]
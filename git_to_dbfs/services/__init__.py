@@ -1,4 +1,16 @@
 """API Wrappers module"""
 
+from .breaker import *
+from .limiter import *
+from .checkpoint import *
+from .journal import *
+from .lfs import *
+from .sink import *
 from .dbfs import *
+from .files import *
+from .local import *
+from .transfer import *
+from .transform import *
+from .verify import *
+from .cache import *
 from .github import *
@@ -0,0 +1,102 @@
+"""
+Timeouts and circuit breakers, so requests to degraded GitHub or DBFS endpoints fail fast
+instead of waiting on TCP timeouts.
+"""
+
+from threading import Lock
+import time
+from typing import Dict, Tuple
+
+# Seconds to wait for a connection, and between bytes of a response
+DEFAULT_TIMEOUT: Tuple[float, float] = (10, 60)
+
+class CircuitOpenException(Exception):
+    """
+    Exception when a request doesn't get sent because the circuit of its endpoint is open.
+    """
+
+class CircuitBreaker:
+    """
+    Circuit breaker of an endpoint: after failure_threshold consecutive failures (connection
+    errors, timeouts or 5xx responses), the circuit opens and requests fail right away with
+    CircuitOpenException for reset_timeout seconds. Then a single trial request gets through
+    (half-open): the circuit closes if it succeeds, or opens again if it fails. No other trial
+    gets through until the outcome of the trial gets recorded, even if requests that were in
+    flight finish meanwhile.
+    """
+
+    FAILURE_STATUS_CODES = (500, 502, 503, 504)
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.__failures = 0
+        self.__opened_at = None
+        self.__trial = False
+        self.__lock = Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """
+        Whether requests currently fail right away (no trial request is due yet).
+        """
+        return self.retry_in() > 0
+
+    def retry_in(self) -> float:
+        """
+        Seconds until the circuit lets a trial request through (0 if closed or due).
+        """
+        with self.__lock:
+            if self.__opened_at is None:
+                return 0
+            return max(0.0, self.__opened_at + self.reset_timeout - time.monotonic())
+
+    def check(self) -> bool:
+        """
+        Raises CircuitOpenException if a request can't be sent now. Once the circuit has been
+        open for reset_timeout seconds, lets a single trial request through.
+        Returns whether the request is the trial request.
+        """
+        with self.__lock:
+            if self.__opened_at is None:
+                return False
+            if self.__trial or time.monotonic() < self.__opened_at + self.reset_timeout:
+                raise CircuitOpenException(self.name)
+            self.__trial = True
+            return True
+
+    def record(self, success: bool, trial: bool = False):
+        """
+        Records the outcome of a request (of the trial request, if trial).
+        """
+        with self.__lock:
+            if trial:
+                self.__trial = False
+            if success:
+                self.__failures = 0
+                self.__opened_at = None
+                return
+            self.__failures += 1
+            if self.__opened_at is not None or self.__failures >= self.failure_threshold:
+                self.__opened_at = time.monotonic()
+
+    def is_failure(self, status_code: int) -> bool:
+        """
+        Whether a response counts as a failure of the endpoint.
+        """
+        return status_code in self.FAILURE_STATUS_CODES
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = Lock()
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """
+    Gets the circuit breaker of an endpoint (e.g. a Databricks host), shared by all clients and
+    invocations in the process.
+    """
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(endpoint)
+        if breaker is None:
+            breaker = _BREAKERS[endpoint] = CircuitBreaker(endpoint)
+        return breaker
@@ -0,0 +1,90 @@
+"""
+Short-lived cache of the version folders known to be missing from Git or from DBFS at the head
+of their branch after a push, so copies for the same push (e.g. of other mappings, or of
+redeliveries) don't list and delete them again.
+"""
+
+from threading import Lock
+import time
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+DEFAULT_VERSION_CACHE_TTL = 60
+
+class VersionCache:
+    """
+    Cache of the version folders known to be missing from Git (their listing got a 404) and from
+    DBFS targets (their folder got deleted after that), for ttl seconds.
+    Entries are kept by the SHA of the head of the branch that their copy was for (see
+    GitPath.head), so every push (to any worker) starts with no entries, and caches of other
+    workers never need to be invalidated. Entries of DBFS get discarded when files get copied to
+    their folder.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_VERSION_CACHE_TTL):
+        self.ttl = ttl
+        self.__expirations: Dict[Hashable, float] = {}
+        self.__lock = Lock()
+
+    def is_missing(self, key: Hashable) -> bool:
+        """
+        Whether a folder (see get_git_key and get_dbfs_key) is known to be missing.
+        """
+        with self.__lock:
+            expiration = self.__expirations.get(key)
+            if expiration is None:
+                return False
+            if expiration <= time.monotonic():
+                del self.__expirations[key]
+                return False
+            return True
+
+    def set_missing(self, key: Hashable):
+        """
+        Records that a folder is missing, for ttl seconds.
+        """
+        with self.__lock:
+            self.__expirations[key] = time.monotonic() + self.ttl
+
+    def discard(self, key: Hashable):
+        """
+        Forgets that a folder is missing, e.g. once files got added to it.
+        """
+        with self.__lock:
+            self.__expirations.pop(key, None)
+
+    def get_dbfs_targets(self, targets: Sequence[Hashable], dbfs_path: str,
+        head: str) -> List[Hashable]:
+        """
+        Gets the DBFS targets where a folder is not known to be missing at a head.
+        """
+        return [target for target in targets
+            if not self.is_missing(get_dbfs_key(target, dbfs_path, head))]
+
+    def set_dbfs_folder_missing(self, targets: Sequence[Hashable], dbfs_path: str, head: str):
+        """
+        Records that a folder is missing from DBFS targets at a head (e.g. once it got deleted).
+        """
+        for target in targets:
+            self.set_missing(get_dbfs_key(target, dbfs_path, head))
+
+    def discard_dbfs_folder(self, targets: Sequence[Hashable], dbfs_path: str, head: str):
+        """
+        Forgets that a folder is missing from DBFS targets at a head, e.g. once files get copied
+        to it.
+        """
+        for target in targets:
+            self.discard(get_dbfs_key(target, dbfs_path, head))
+
+def get_git_key(api_base_url: str, repo: str, branch: str, path: str, head: str) \
+    -> Tuple[str, str, str, str, str, str]:
+    """
+    Gets the key of a folder of a repo/branch in GitHub, at the SHA of the head of the branch.
+    """
+    return ('git', api_base_url, repo, branch, path, head)
+
+def get_dbfs_key(target: Hashable, dbfs_path: str, head: str) -> Tuple[str, Hashable, str, str]:
+    """
+    Gets the key of a folder of a DBFS target (a Sink), at the SHA of the head of the branch
+    copied to it.
+    """
+    return ('dbfs', target, dbfs_path, head)
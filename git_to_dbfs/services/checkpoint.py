@@ -0,0 +1,90 @@
+"""
+Deadlines and checkpoints, so copies that don't fit in the time budget of an invocation can be
+continued by another invocation.
+"""
+
+import math
+import time
+from typing import Dict, Iterable, Optional
+
+class Deadline:
+    """
+    Point in time after which no new copies should be started, "seconds" from now (never if
+    None).
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.__at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """
+        Seconds left until the deadline.
+        """
+        return math.inf if self.__at is None else self.__at - time.monotonic()
+
+    def reached(self) -> bool:
+        """
+        Whether the deadline has been reached.
+        """
+        return self.remaining() <= 0
+
+    def within(self, seconds: Optional[float]) -> 'Deadline':
+        """
+        Gets a deadline "seconds" from now, or this one if it is earlier (or seconds is None).
+        """
+        if seconds is None:
+            return self
+        deadline = Deadline(seconds)
+        return deadline if deadline.remaining() < self.remaining() else self
+
+class Checkpoint:
+    """
+    Progress of the copy of a version folder:
+    - deleted: previous contents of the DBFS folder have been deleted.
+    - completed: names of the files already published to all DBFS targets.
+    - finished: the copy is done.
+    """
+
+    def __init__(self, deleted: bool = False, completed: Iterable[str] = (),
+        finished: bool = False):
+        self.deleted = deleted
+        self.completed = set(completed)
+        self.finished = finished
+
+    def plan(self, files: Dict[str, Optional[str]]):
+        """
+        Records the files that the copy will publish, by name, with their Git SHAs (if known).
+        If completed files are no longer planned (removed from Git), the copy gets rolled back
+        to the start, so the DBFS folder gets deleted again.
+        """
+        if any(name not in files for name in self.completed):
+            self.deleted = False
+            self.completed = set()
+
+    def upload(self, name: str):
+        """
+        Records that all the blocks of a file got uploaded, before the file gets published.
+        Files uploaded again (e.g. after failing verification) are no longer completed.
+        """
+        self.completed.discard(name)
+
+    def publish(self, name: str):
+        """
+        Records that a file got published to all DBFS targets.
+        """
+        self.completed.add(name)
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the checkpoint, e.g. to be sent in a continuation message.
+        """
+        return {'deleted': self.deleted, 'completed': sorted(self.completed),
+            'finished': self.finished}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Checkpoint':
+        """
+        Deserializes a checkpoint.
+        """
+        return cls(data.get('deleted', False), data.get('completed', []),
+            data.get('finished', False))
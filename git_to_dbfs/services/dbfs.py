@@ -4,21 +4,41 @@ More info: https://docs.databricks.com/dev-tools/api/latest/dbfs.html
 """
 
 import base64
+from typing import Optional, Tuple
 import requests
 
+from .breaker import DEFAULT_TIMEOUT
+from .sink import Sink
+from .limiter import AdaptiveLimiter, RateLimiter, acquire_token, get_limiter
+from .telemetry import BLOCKS, BYTES, DBFS_LATENCY, record, span, timed
+
 class DBFSException(Exception):
     """
     Exception when accessing DBFS API.
     """
 
-class DBFS:
+class DBFS(Sink):
     """
-    Class to access DBFS in Databricks
+    Class to access DBFS in Databricks.
+    Requests go through an adaptive concurrency limiter (shared by all clients of the same host
+    by default), which backs off and retries when DBFS throttles them, and through an optional
+    rate limiter with budgets per API. They time out after timeout (connect, read) seconds, and
+    fail right away while the circuit breaker of the host is open (see CircuitBreaker).
     """
 
-    def __init__(self, host: str, token: str):
+    # Largest block of data whose base64 encoding fits in the 1 MB limit of add-block
+    MAX_BLOCK_SIZE = 3 * 1024 * 1024 // 4
+
+    def __init__(self, host: str, token: str, session: requests.Session = None,
+        limiter: AdaptiveLimiter = None, rate_limiter: RateLimiter = None,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT):
         self.__host = host
         self.__headers = {'Authorization': f'Bearer {token}'}
+        self.__json_headers = {**self.__headers, 'Content-Type': 'application/json'}
+        self.__session = session or requests.Session()
+        self.__limiter = limiter or get_limiter(host)
+        self.__rate_limiter = rate_limiter
+        self.__timeout = timeout
 
     def list(self, path: str) -> dict:
         """
@@ -76,8 +96,12 @@ class DBFS:
 
         More info: https://docs.databricks.com/dev-tools/api/latest/dbfs.html#add-block
         """
-        base64_data = str(base64.b64encode(data), 'utf-8')
-        self.__post('add-block', data={'handle': handle, 'data': base64_data})
+        # Base64 gets encoded straight into the JSON body, as it has nothing to escape in JSON:
+        # encoding it through a str and json.dumps would copy the encoded block 3 more times
+        body = b''.join((b'{"handle": %d, "data": "' % handle, base64.b64encode(data), b'"}'))
+        self.__post('add-block', body=body)
+        record(BYTES, len(data))
+        record(BLOCKS, 1)
 
     def close(self, handle: int):
         """
@@ -109,15 +133,29 @@ class DBFS:
         self.__post('delete', data={'path': path, 'recursive': recursive})
 
     def __get(self, api: str, params: dict) -> requests.Response:
-        response = requests.get(f'{self.__host}/api/2.0/dbfs/{api}', headers=self.__headers,
-            params=params)
+        acquire_token(self.__rate_limiter, api)
+        with span(f'DBFS {api}'), timed(DBFS_LATENCY, api=api):
+            response = self.__limiter.call(api,
+                lambda: self.__session.get(f'{self.__host}/api/2.0/dbfs/{api}',
+                    headers=self.__headers, params=params, timeout=self.__timeout),
+                rate_limiter=self.__rate_limiter)
         if not response:
             raise DBFSException(response.status_code)
         return response
 
-    def __post(self, api: str, data: dict) -> requests.Response:
-        response = requests.post(f'{self.__host}/api/2.0/dbfs/{api}', headers=self.__headers,
-            json=data)
+    def __post(self, api: str, data: Optional[dict] = None,
+        body: Optional[bytes] = None) -> requests.Response:
+        # Data gets encoded as JSON, unless the body is already encoded
+        if body is None:
+            headers, payload = self.__headers, {'json': data}
+        else:
+            headers, payload = self.__json_headers, {'data': body}
+        acquire_token(self.__rate_limiter, api)
+        with span(f'DBFS {api}'), timed(DBFS_LATENCY, api=api):
+            response = self.__limiter.call(api,
+                lambda: self.__session.post(f'{self.__host}/api/2.0/dbfs/{api}',
+                    headers=headers, **payload, timeout=self.__timeout),
+                rate_limiter=self.__rate_limiter)
         if not response:
             raise DBFSException(response.status_code)
         return response
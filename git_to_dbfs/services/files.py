@@ -0,0 +1,206 @@
+"""
+Databricks Files API Wrapper.
+More info: https://docs.databricks.com/api/workspace/files
+"""
+
+from queue import Full, Queue
+from threading import Thread
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+
+from .breaker import DEFAULT_TIMEOUT
+from .dbfs import DBFSException
+from .limiter import AdaptiveLimiter, RateLimiter, acquire_token, get_limiter
+from .sink import Sink
+from .telemetry import BLOCKS, BYTES, DBFS_LATENCY, record, run_in_context, span, timed
+
+_CLOSE = object()
+_ABORT = object()
+
+class FileUpload:
+    """
+    Raw body of a file being uploaded with a single streamed request, sent by a dedicated thread
+    while blocks keep being added. At most max_blocks blocks wait to be sent.
+    """
+
+    def __init__(self, path: str, max_blocks: int = 2):
+        self.path = path
+        self.__blocks = Queue(max_blocks)
+        self.__response: Optional[requests.Response] = None
+        self.__error: Optional[Exception] = None
+        self.__thread: Optional[Thread] = None
+
+    def start(self, send):
+        """
+        Starts sending the request, with the body from "chunks".
+        """
+        self.__thread = Thread(target=run_in_context(self.__send), args=(send,), daemon=True)
+        self.__thread.start()
+
+    def chunks(self) -> Iterator[bytes]:
+        """
+        Body of the request. Aborted uploads stop the request with an error, so the incomplete
+        file is never published.
+        """
+        while True:
+            block = self.__blocks.get()
+            if block is _CLOSE:
+                return
+            if block is _ABORT:
+                raise IOError(f'Upload of "{self.path}" aborted')
+            yield block
+
+    def write(self, data: bytes):
+        """
+        Queues a copy of a block to be sent.
+        """
+        self.__put(bytes(data))
+
+    def finish(self, abort: bool = False) -> requests.Response:
+        """
+        Ends the body of the request, and waits for its response.
+        """
+        self.__put(_ABORT if abort else _CLOSE)
+        self.__thread.join()
+        return self.__get_result()
+
+    def __send(self, send):
+        try:
+            self.__response = send()
+        except Exception as ex: # pylint: disable=broad-except
+            self.__error = ex
+
+    def __put(self, block):
+        # The request may be over (e.g. rejected) before its whole body gets sent
+        while True:
+            try:
+                self.__blocks.put(block, timeout=0.1)
+                return
+            except Full as ex:
+                if not self.__thread.is_alive():
+                    self.__get_result()
+                    raise DBFSException(500) from ex
+
+    def __get_result(self) -> requests.Response:
+        if self.__error is not None:
+            raise self.__error
+        if not self.__response:
+            raise DBFSException(self.__response.status_code)
+        return self.__response
+
+class FilesSink(Sink):
+    """
+    Class to write files to Databricks workspaces with the Files API (e.g. to Unity Catalog
+    volumes), which takes the raw bytes of each file in a single streamed PUT request, instead of
+    base64 encoded blocks of up to 1 MB like DBFS API.
+    Requests go through the adaptive concurrency limiter of the host (uploads are never retried,
+    as their bodies can't be sent again) and an optional rate limiter, with timeouts, like DBFS.
+    """
+
+    def __init__(self, host: str, token: str, session: requests.Session = None,
+        limiter: AdaptiveLimiter = None, rate_limiter: RateLimiter = None,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT):
+        self.__host = host
+        self.__headers = {'Authorization': f'Bearer {token}'}
+        self.__session = session or requests.Session()
+        self.__limiter = limiter or get_limiter(host)
+        self.__rate_limiter = rate_limiter
+        self.__timeout = timeout
+
+    def list(self, path: str) -> dict:
+        """
+        Lists the contents of a directory (all its pages), in the format of DBFS list API.
+        """
+        files = []
+        params = {}
+        while True:
+            response = self.__request('GET', 'list-directory', f'directories{path}',
+                params=params).json()
+            files.extend({'path': x['path'], 'is_dir': x.get('is_directory', False),
+                'file_size': x.get('file_size', 0)} for x in response.get('contents', []))
+            if not response.get('next_page_token'):
+                return {'files': files}
+            params = {'page_token': response['next_page_token']}
+
+    def create(self, path: str, overwrite: bool) -> FileUpload:
+        """
+        Starts uploading a file, published once the upload gets closed.
+        """
+        upload = FileUpload(path)
+        upload.start(lambda: self.__request('PUT', 'upload', f'files{path}',
+            params={'overwrite': str(overwrite).lower()}, data=upload.chunks(),
+            headers={'Content-Type': 'application/octet-stream'}, max_retries=0, check=False))
+        return upload
+
+    def add_block(self, handle: FileUpload, data: bytes):
+        """
+        Appends a block of data to an upload.
+        """
+        handle.write(data)
+        record(BYTES, len(data))
+        record(BLOCKS, 1)
+
+    def close(self, handle: FileUpload):
+        """
+        Finishes an upload, publishing its file.
+        """
+        handle.finish()
+
+    def abort(self, handle: FileUpload):
+        """
+        Stops an upload without publishing its file.
+        """
+        try:
+            handle.finish(abort=True)
+        except (IOError, DBFSException):
+            pass
+
+    def delete(self, path: str, recursive: bool):
+        """
+        Deletes a file or directory. Directories get deleted by deleting all their files and
+        subdirectories first, if recursive. Missing paths are ignored.
+        """
+        try:
+            contents = self.list(path)['files']
+        except DBFSException as ex:
+            if str(ex) != '404':
+                raise
+            # Not a directory
+            self.__delete('files', path)
+            return
+
+        if recursive:
+            directories: List[str] = []
+            while contents:
+                entry = contents.pop()
+                if entry['is_dir']:
+                    directories.append(entry['path'].rstrip('/'))
+                    contents.extend(self.list(entry['path'])['files'])
+                else:
+                    self.__delete('files', entry['path'])
+            for directory in sorted(directories, key=len, reverse=True):
+                self.__delete('directories', directory)
+        self.__delete('directories', path)
+
+    def __delete(self, kind: str, path: str):
+        try:
+            self.__request('DELETE', f'delete-{kind}', f'{kind}{path}')
+        except DBFSException as ex:
+            if str(ex) != '404':
+                raise
+
+    def __request(self, method: str, api: str, resource: str, max_retries: int = None,
+        check: bool = True, headers: dict = None, **kwargs) -> requests.Response:
+        url = f'{self.__host}/api/2.0/fs/{quote(resource)}'
+        headers = {**self.__headers, **(headers or {})}
+        acquire_token(self.__rate_limiter, api)
+        with span(f'Files {api}'), timed(DBFS_LATENCY, api=f'files-{api}'):
+            response = self.__limiter.call(api,
+                lambda: self.__session.request(method, url, headers=headers,
+                    timeout=self.__timeout, **kwargs),
+                max_retries, self.__rate_limiter)
+        if check and not response:
+            raise DBFSException(response.status_code)
+        return response
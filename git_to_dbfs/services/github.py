@@ -3,16 +3,31 @@ GitHub Enterprise API Wrapper, helper methods and related classes.
 More info: https://docs.github.com/en/enterprise/2.21/user/rest
 """
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha1
 from hmac import HMAC, compare_digest
 from logging import Logger
 import re
-from typing import Callable
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple, \
+    Union
 import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
 
 import azure.functions as func
 
-from . import DBFS
+from . import DBFS, DBFSException
+from .breaker import DEFAULT_TIMEOUT
+from .cache import VersionCache, get_git_key
+from .sink import Sink
+from .checkpoint import Checkpoint, Deadline
+from .lfs import LFS_MEDIA_TYPE, LFS_POINTER_MAX_SIZE, LFSPointer, get_batch_requests, \
+    get_download_actions, get_lfs_url
+from .limiter import AdaptiveLimiter, RateLimiter, acquire_token, get_limiter
+from .telemetry import GITHUB_LATENCY, run_in_context, span, timed
+from .transfer import BufferPool, DBFSFanOut
+from .transform import Transform
+from .verify import get_folders, get_mismatched_files
 
 def validate_payload(req: func.HttpRequest, secret: str) -> bool:
     """
@@ -28,30 +43,174 @@ def validate_payload(req: func.HttpRequest, secret: str) -> bool:
         .hexdigest()
     return compare_digest(signature, expected_signature)
 
+# SHA of "before" commit for new branches, or of "after" commit for deleted branches
+NULL_SHA = '0' * 40
+
 class GitPath:
     """
     Git Path.
+    With recursive, copies of the folder include the files in its subfolders.
+    Head is the SHA of the head of the branch that copies are for (e.g. after a push), if known.
     """
-    def __init__(self, repo: str, path: str, branch: str):
+    def __init__(self, repo: str, path: str, branch: str, recursive: bool = False,
+        head: Optional[str] = None):
         self.repo = repo
         self.path = path
         self.branch = branch
         self.ref = f'refs/heads/{branch}'
+        self.recursive = recursive
+        self.head = head
+
+class GitFile:
+    """
+    File to copy from a folder: its path relative to the folder, and where to download it from
+    (with its own headers, e.g. for objects in Git LFS). Small files already downloaded to detect
+    LFS pointers keep their content, so they don't get downloaded again.
+    """
+    def __init__(self, name: str, download_url: str, size: Optional[int] = None,
+        content: Optional[bytes] = None, headers: Optional[dict] = None,
+        sha: Optional[str] = None):
+        self.name = name
+        self.download_url = download_url
+        self.size = size
+        self.sha = sha
+        self.content = content
+        self.headers = headers
+
+def get_file_priority(file: GitFile) -> Tuple[bool, int]:
+    """
+    Gets the sort key of a file to copy: smaller files first (files of unknown size last), so
+    many files get usable early and big ones don't hold up the small ones behind them.
+    """
+    return file.size is None, file.size or 0
 
 class GitHubException(Exception):
     """
     Exception when accessing GitHub Enterprise API.
     """
 
+def get_file_name(download_url: str) -> str:
+    """
+    Gets the name of a file from its download URL.
+    """
+    return download_url.split('?')[0].split('/')[-1]
+
+def get_folder_files(git_path: GitPath, folders: List[Tuple[str, List[dict]]]) \
+    -> Tuple[List[GitFile], List[Tuple[str, GitPath]]]:
+    """
+    Gets the files in the contents of some folders of a copy of git_path, by their prefix
+    relative to the copied folder ('' for the copied folder itself), named relative to the
+    copied folder, and the subfolders to list next if git_path is recursive, with their prefixes.
+    """
+    files = []
+    subfolders = []
+    for prefix, contents in folders:
+        for entry in contents:
+            if entry.get('type') == 'dir' or not entry.get('download_url'):
+                if git_path.recursive:
+                    subfolder = f'{prefix}{entry["path"].split("/")[-1]}'
+                    subfolders.append((f'{subfolder}/',
+                        GitPath(git_path.repo, f'{git_path.path}/{subfolder}', git_path.branch)))
+            else:
+                files.append(GitFile(f'{prefix}{get_file_name(entry["download_url"])}',
+                    entry['download_url'], entry.get('size'), sha=entry.get('sha')))
+    return files, subfolders
+
+def get_lfs_candidates(files: List[GitFile]) -> List[GitFile]:
+    """
+    Gets the files small enough to be LFS pointers, which get downloaded to find out.
+    """
+    return [file for file in files
+        if file.size is not None and file.size < LFS_POINTER_MAX_SIZE]
+
+def get_lfs_pointers(candidates: List[GitFile]) -> Dict[GitFile, LFSPointer]:
+    """
+    Gets the LFS pointers in the downloaded contents of candidate files.
+    """
+    pointers = {file: LFSPointer.parse(file.content) for file in candidates}
+    return {file: pointer for file, pointer in pointers.items() if pointer}
+
+def set_lfs_downloads(pointers: Dict[GitFile, LFSPointer],
+    actions: Dict[str, Tuple[str, dict]], logger: Logger):
+    """
+    Makes the files of LFS pointers get downloaded from the LFS server with the download actions
+    of their objects (see GitHub.lfs_batch), with the size of the objects.
+    Raises a GitHubException (404) if any object is missing.
+    """
+    for file, pointer in pointers.items():
+        if pointer.oid not in actions:
+            logger.error('LFS object of "%s" not found', file.name)
+            raise GitHubException(404)
+        file.download_url, file.headers = actions[pointer.oid]
+        file.size = pointer.size
+        file.content = None
+
+def check_missing_folder(version_cache: Optional[VersionCache], api_base_url: str,
+    git_path: GitPath, logger: Logger) -> Tuple[str, str, str, str, str, str]:
+    """
+    Gets the key of a GitHub folder in a version cache, and raises a GitHubException (404) like
+    its last listing did, without a request, if the folder is known to be missing at its head.
+    """
+    key = get_git_key(api_base_url, git_path.repo, git_path.branch, git_path.path,
+        git_path.head)
+    if version_cache and version_cache.is_missing(key):
+        logger.info('GitHub folder "%s" is known to be missing', git_path.path)
+        raise GitHubException(404)
+    return key
+
+def record_missing_folder(version_cache: Optional[VersionCache], key: Hashable,
+    ex: GitHubException):
+    """
+    Records that a GitHub folder is missing in a version cache, if its listing got a 404.
+    """
+    if version_cache and str(ex) == '404':
+        version_cache.set_missing(key)
+
+def get_targets_to_delete(version_cache: Optional[VersionCache], targets: List[Any],
+    dbfs_path: str, head: str, logger: Logger) -> List[Any]:
+    """
+    Gets the DBFS targets where a folder missing from GitHub still has to be deleted: all of
+    them, except those where it is known to be missing since its last deletion at the same head.
+    """
+    if not version_cache:
+        return targets
+    targets = version_cache.get_dbfs_targets(targets, dbfs_path, head)
+    if not targets:
+        logger.info('DBFS folder "%s" is known to be missing', dbfs_path)
+    return targets
+
 class GitHub:
     """
     Class to access GitHub Enterprise.
+    Requests go through an adaptive concurrency limiter, an optional rate limiter and the circuit
+    breaker of the API, and time out after timeout (connect, read) seconds.
     """
 
-    def __init__(self, api_base_url: str, token: str, logger: Logger):
+    # Most changed files listed by the Compare API
+    MAX_COMPARE_FILES = 300
+
+    # Times that a broken download gets resumed from the last byte received
+    MAX_RESUMES = 3
+
+    # Times that files failing verification get copied again
+    MAX_REPAIRS = 2
+
+    def __init__(self, api_base_url: str, token: str, logger: Logger,
+        session: requests.Session = None, block_size: int = DBFS.MAX_BLOCK_SIZE,
+        max_blocks: int = 8, max_pending_files: int = 4, limiter: AdaptiveLimiter = None,
+        rate_limiter: RateLimiter = None, timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        version_cache: Optional[VersionCache] = None):
         self.__api_base_url = api_base_url
+        self.__timeout = timeout
+        self.__version_cache = version_cache
         self.__headers = {'Authorization': f'Bearer {token}'}
         self.__logger = logger
+        self.__session = session or requests.Session()
+        self.__limiter = limiter or get_limiter(api_base_url)
+        self.__rate_limiter = rate_limiter
+        self.__block_size = block_size
+        self.__max_blocks = max_blocks
+        self.__max_pending_files = max_pending_files
 
     def repos_content(self, path: GitPath) -> dict:
         """
@@ -63,54 +222,429 @@ class GitHub:
         return self.__get(f'repos/{path.repo}/contents/{path.path}', params={'ref': path.branch})\
             .json()
 
-    def download_file(self, download_url: str, got_chunk: Callable[[bytes], None]):
+    def compare(self, repo: str, base: str, head: str) -> dict:
+        """
+        Compares two commits. Lists up to MAX_COMPARE_FILES changed files.
+
+        More info:
+        https://docs.github.com/en/enterprise/2.21/user/rest/reference/repos#compare-two-commits
+        """
+        return self.__get(f'repos/{repo}/compare/{base}...{head}', params={}).json()
+
+    def get_tree(self, repo: str, tree_sha: str) -> dict:
+        """
+        Gets a tree (e.g. of a commit) with all its subtrees. Lists up to 100,000 entries, and
+        sets "truncated" if there are more.
+
+        More info:
+        https://docs.github.com/en/enterprise/2.21/user/rest/reference/git#get-a-tree
+        """
+        return self.__get(f'repos/{repo}/git/trees/{tree_sha}', params={'recursive': 1}).json()
+
+    def get_changed_files(self, repo: str, before: str, after: str) -> List[str]:
         """
-        Downloads a file in chunks.
+        Gets the paths of all files added, removed, modified or renamed between two commits, with
+        one request to the Compare API. If there are too many files for the Compare API, or there
+        is no "before" commit (new branch), the recursive trees of both commits get compared
+        instead.
         """
-        with requests.get(download_url, headers=self.__headers, stream=True) as response:
+        if before != NULL_SHA:
+            comparison = self.compare(repo, before, after)
+            files = comparison.get('files', [])
+            if len(files) < self.MAX_COMPARE_FILES:
+                return sorted({path
+                    for file in files
+                    for path in (file['filename'], file.get('previous_filename'))
+                    if path})
+
+        self.__logger.info('Comparing trees of commits "%s" and "%s"', before, after)
+        before_blobs = self.__get_blobs(repo, before) if before != NULL_SHA else {}
+        after_blobs = self.__get_blobs(repo, after)
+        return sorted(path
+            for path in before_blobs.keys() | after_blobs.keys()
+            if before_blobs.get(path) != after_blobs.get(path))
+
+    def lfs_batch(self, repo: str, pointers: List[LFSPointer]) -> Dict[str, Tuple[str, dict]]:
+        """
+        Gets the URL and headers to download every object of some LFS pointers, with one request
+        to the batch API of the LFS server of the repo per 100 objects.
+
+        More info: https://github.com/git-lfs/git-lfs/blob/main/docs/api/batch.md
+        """
+        url = f'{get_lfs_url(self.__api_base_url, repo)}/objects/batch'
+        headers = {**self.__headers, 'Accept': LFS_MEDIA_TYPE, 'Content-Type': LFS_MEDIA_TYPE}
+        actions = {}
+        for body in get_batch_requests(pointers):
+            acquire_token(self.__rate_limiter, 'lfs-batch')
+            with span('GitHub lfs-batch', path=repo), timed(GITHUB_LATENCY, api='lfs-batch'):
+                response = self.__limiter.call('lfs-batch',
+                    lambda body=body: self.__session.post(url, headers=headers, json=body,
+                        timeout=self.__timeout),
+                    rate_limiter=self.__rate_limiter)
             if not response:
                 raise GitHubException(response.status_code)
+            actions.update(get_download_actions(response.json()))
+        return actions
+
+    def download_file(self, download_url: str, got_chunk: Callable[[bytes], None],
+        headers: Optional[dict] = None,
+        read_into: Optional[Callable[[Callable[[memoryview], int]], None]] = None):
+        """
+        Downloads a file in chunks, with the given headers instead of the GitHub token if set.
+        With read_into (e.g. DBFSFanOut.read_from), the response stream gets read into the
+        caller's buffers with a readinto function instead, without a bytes object per chunk
+        (chunks still go to got_chunk when a server ignores the Range of a resumed download, or
+        compresses the download even though it was asked not to).
+        If the connection breaks, the download gets resumed from the last byte received with a
+        Range request (up to MAX_RESUMES times), so chunks are never repeated.
+        """
+        headers = self.__headers if headers is None else headers
+        if read_into:
+            # Streams can only be read into buffers as is: decoding them (e.g. gzip) with
+            # urllib3 1.x readinto fails once decoded data doesn't fit in the view
+            headers = {**headers, 'Accept-Encoding': 'identity'}
+        received = 0
+        resumes = 0
+        response = None
+
+        def readinto(view: memoryview) -> int:
+            # Errors of the stream are raised like those of iter_content, so they get resumed
+            nonlocal received
+            try:
+                count = response.raw.readinto(view)
+            except ProtocolError as ex:
+                raise requests.exceptions.ChunkedEncodingError(ex) from ex
+            except ReadTimeoutError as ex:
+                raise requests.exceptions.ConnectionError(ex) from ex
+            received += count
+            return count
+
+        while True:
+            range_headers = {'Range': f'bytes={received}-'} if received else {}
+            try:
+                acquire_token(self.__rate_limiter, 'download')
+                with span('GitHub download', url=download_url.split('?')[0]), \
+                    timed(GITHUB_LATENCY, api='download'), \
+                    self.__limiter.call('download',
+                        lambda: self.__session.get(download_url,
+                            headers={**headers, **range_headers}, stream=True,
+                            timeout=self.__timeout),
+                        rate_limiter=self.__rate_limiter) as response:
+                    if not response:
+                        raise GitHubException(response.status_code)
+
+                    # Servers ignoring the range send the whole file again
+                    skip = received if response.status_code != 206 else 0
+                    encoding = response.headers.get('Content-Encoding', 'identity')
+                    length = response.headers.get('Content-Length')
+                    expected = int(length) + received - skip \
+                        if length and encoding == 'identity' else None
+                    if read_into and not skip and encoding == 'identity':
+                        read_into(readinto)
+                    else:
+                        for chunk in response.iter_content(chunk_size=8192):
+                            if skip:
+                                skipped = min(skip, len(chunk))
+                                chunk = chunk[skipped:]
+                                skip -= skipped
+                                if not chunk:
+                                    continue
+                            received += len(chunk)
+                            got_chunk(chunk)
 
-            for chunk in response.iter_content(chunk_size=8192):
-                got_chunk(chunk)
+                    # urllib3 1.x ends bodies shorter than their Content-Length without errors
+                    if expected is not None and received < expected:
+                        raise requests.exceptions.ChunkedEncodingError(
+                            f'Connection broken: {received} of {expected} bytes received')
+                return
+            except (requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ConnectionError) as ex:
+                if resumes >= self.MAX_RESUMES:
+                    raise
+                resumes += 1
+                self.__logger.warning('Download of "%s" broken after %d bytes, resuming: %s',
+                    download_url.split('?')[0], received, ex)
 
-    def copy_folder_to_dbfs(self, git_path: GitPath, dbfs: DBFS, dbfs_path: str):
+    def copy_folder_to_dbfs(self, git_path: GitPath, dbfs: Union[Sink, Sequence[Sink]],
+        dbfs_path: str, checkpoint: Optional[Checkpoint] = None,
+        deadline: Optional[Deadline] = None, transform: Optional[Transform] = None) -> int:
         """
-        Copy all files in a folder to a DBFS folder.
+        Copy all files in a folder to a DBFS folder in one or many DBFS targets (e.g. Databricks
+        workspaces), downloading each file once.
         All previous contents of DBFS folder will be deleted.
+        Subfolders are ignored, unless git_path is recursive.
+        Progress is tracked in checkpoint: once the deadline is reached no new files get started,
+        and copying again with that checkpoint continues the copy (see Checkpoint).
+        Returns the number of bytes copied.
         """
+        targets = [dbfs] if isinstance(dbfs, Sink) else list(dbfs)
+        checkpoint = checkpoint or Checkpoint()
+        # Entries of the version cache only apply to copies for a known head
+        version_cache = self.__version_cache if git_path.head else None
+        errors: List[DBFSException] = []
         contents = None
+        size = 0
         try:
-            contents = self.repos_content(git_path)
+            contents = self.__get_folder_contents(git_path, version_cache)
+            if version_cache:
+                version_cache.discard_dbfs_folder(targets, dbfs_path, git_path.head)
 
-            self.__logger.info('Deleting all files in DBFS folder "%s"', dbfs_path)
-            dbfs.delete(dbfs_path, True)
+            # Planning first, as copies planned without files they published get rolled back
+            files = self.__list_files(git_path, contents)
+            checkpoint.plan({file.name: file.sha for file in files})
+            if not checkpoint.deleted:
+                targets = self.__delete_dbfs_folder(targets, dbfs_path, errors)
+                checkpoint.deleted = True
 
-            download_urls = [x['download_url'] for x in contents]
-            for download_url in download_urls:
-                self.__copy_file_to_dbfs(download_url, dbfs, dbfs_path)
+            files = self.__resolve_lfs_files(git_path, [file
+                for file in files if file.name not in checkpoint.completed])
+            files.sort(key=get_file_priority)
+            copied: Dict[str, Tuple[GitFile, Optional[Transform], int]] = {}
+            size, targets = self.__copy_files_to_dbfs(files, targets, dbfs_path, errors,
+                checkpoint, deadline, transform, copied)
+            size += self.__verify_files(copied, targets, dbfs_path, errors, checkpoint)
 
         except GitHubException as ex:
             if str(ex) == '404' and not contents:
                 # {base_path}/{version} is missing after the changes
-                self.__logger.info('Deleting all files in DBFS folder "%s"', dbfs_path)
-                dbfs.delete(dbfs_path, True)
+                self.__delete_missing_dbfs_folder(targets, dbfs_path, errors, git_path.head,
+                    version_cache)
+                checkpoint.deleted = checkpoint.finished = True
             else:
                 raise
 
-    def __copy_file_to_dbfs(self, download_url: str, dbfs: DBFS, dbfs_path: str):
-        file_name = download_url.split('?')[0].split('/')[-1]
-        dbfs_file_path = f'{dbfs_path}/{file_name}'
+        if errors:
+            raise errors[0]
+        return size
+
+    def __list_files(self, git_path: GitPath, contents: List[dict]) -> List[GitFile]:
+        files = []
+        folders = [('', contents)]
+        with ThreadPoolExecutor(max_workers=self.__max_pending_files) as executor:
+            while folders:
+                folder_files, subfolders = get_folder_files(git_path, folders)
+                files.extend(folder_files)
+                futures = [executor.submit(run_in_context(self.repos_content), path)
+                    for _, path in subfolders]
+                folders = [(prefix, future.result())
+                    for (prefix, _), future in zip(subfolders, futures)]
+        return files
+
+    def __resolve_lfs_files(self, git_path: GitPath, files: List[GitFile]) -> List[GitFile]:
+        # Small files get downloaded to find LFS pointers, which get resolved to their objects
+        candidates = get_lfs_candidates(files)
+        if not candidates:
+            return files
+
+        with ThreadPoolExecutor(max_workers=self.__max_pending_files) as executor:
+            futures = [executor.submit(run_in_context(self.__download_content), file.download_url)
+                for file in candidates]
+            for file, future in zip(candidates, futures):
+                file.content = future.result()
+
+        pointers = get_lfs_pointers(candidates)
+        if pointers:
+            self.__logger.info('Resolving %d LFS objects in "%s"', len(pointers), git_path.path)
+            set_lfs_downloads(pointers, self.lfs_batch(git_path.repo, list(pointers.values())),
+                self.__logger)
+        return files
+
+    def __download_content(self, download_url: str) -> bytes:
+        chunks = []
+        self.download_file(download_url, chunks.append)
+        return b''.join(chunks)
+
+    def __get_folder_contents(self, git_path: GitPath,
+        version_cache: Optional[VersionCache]) -> List[dict]:
+        # Folders known to be missing fail like their last listing did, without a request
+        key = check_missing_folder(version_cache, self.__api_base_url, git_path, self.__logger)
+        try:
+            return self.repos_content(git_path)
+        except GitHubException as ex:
+            record_missing_folder(version_cache, key, ex)
+            raise
+
+    def __delete_missing_dbfs_folder(self, targets: List[Sink], dbfs_path: str,
+        errors: List[DBFSException], head: Optional[str], version_cache: Optional[VersionCache]):
+        targets = get_targets_to_delete(version_cache, targets, dbfs_path, head, self.__logger)
+        if not targets:
+            return
+        targets = self.__delete_dbfs_folder(targets, dbfs_path, errors)
+        if version_cache:
+            version_cache.set_dbfs_folder_missing(targets, dbfs_path, head)
+
+    def __delete_dbfs_folder(self, targets: List[Sink], dbfs_path: str,
+        errors: List[DBFSException]) -> List[Sink]:
+        self.__logger.info('Deleting all files in DBFS folder "%s"', dbfs_path)
+
+        succeeded_targets = []
+        for target in targets:
+            try:
+                target.delete(dbfs_path, True)
+                succeeded_targets.append(target)
+            except DBFSException as ex:
+                errors.append(ex)
+        return succeeded_targets
 
-        self.__logger.info('Copying GitHub file "%s" to DBFS "%s"', download_url, dbfs_file_path)
+    def __copy_files_to_dbfs(self, files: List[GitFile], targets: List[Sink],
+        dbfs_path: str, errors: List[DBFSException], checkpoint: Checkpoint,
+        deadline: Optional[Deadline], transform: Optional[Transform],
+        copied: Dict[str, Tuple[GitFile, Optional[Transform], int]]) -> Tuple[int, List[Sink]]:
+        # Copied files get recorded by DBFS name, with their transform and expected size
+        pool = BufferPool(self.__max_blocks, self.__block_size)
+        pending_files = deque()
+        size = 0
+        checkpoint.finished = True
+        try:
+            for file in files:
+                if not targets:
+                    break
+                if deadline and deadline.reached():
+                    self.__logger.warning('Deadline reached, stopping copy to DBFS "%s"',
+                        dbfs_path)
+                    checkpoint.finished = False
+                    break
+                file_transform = transform if transform and transform.applies(file.name) \
+                    else None
+                name = file_transform.rename(file.name) if file_transform else file.name
+                pending_files.append((file.name, self.__copy_file_to_dbfs(file, targets,
+                    f'{dbfs_path}/{name}', pool, file_transform)))
+                checkpoint.upload(file.name)
+                size += pending_files[-1][1].size
+                copied[name] = (file, file_transform,
+                    self.__get_expected_size(file, file_transform, pending_files[-1][1]))
+                if len(pending_files) >= self.__max_pending_files:
+                    targets = self.__wait_for_file(*pending_files.popleft(), targets, errors,
+                        checkpoint)
+        finally:
+            while pending_files:
+                targets = self.__wait_for_file(*pending_files.popleft(), targets, errors,
+                    checkpoint)
+        return size, targets
+
+    def __verify_files(self, copied: Dict[str, Tuple[GitFile, Optional[Transform], int]],
+        targets: List[Sink], dbfs_path: str, errors: List[DBFSException],
+        checkpoint: Checkpoint) -> int:
+        # Only published files get verified, and copied again to the targets where they mismatch
+        sizes = {name: size for name, (file, _, size) in copied.items()
+            if file.name in checkpoint.completed}
+        size = 0
+        for repair in range(self.MAX_REPAIRS + 1):
+            mismatched, targets = self.__get_mismatched_files(sizes, targets, dbfs_path, errors)
+            if not mismatched:
+                break
+            if repair == self.MAX_REPAIRS:
+                for name in mismatched:
+                    self.__logger.error('DBFS "%s/%s" still mismatched after %d copies',
+                        dbfs_path, name, self.MAX_REPAIRS + 1)
+                    checkpoint.upload(copied[name][0].name)
+                errors.append(DBFSException(500))
+                break
+
+            pool = BufferPool(self.__max_blocks, self.__block_size)
+            for name, file_targets in mismatched.items():
+                file, file_transform, _ = copied[name]
+                self.__logger.warning('Size of DBFS "%s/%s" mismatched, copying it again',
+                    dbfs_path, name)
+                checkpoint.upload(file.name)
+                fan_out = self.__copy_file_to_dbfs(file, file_targets, f'{dbfs_path}/{name}',
+                    pool, file_transform)
+                size += fan_out.size
+                sizes[name] = self.__get_expected_size(file, file_transform, fan_out)
+                succeeded_targets = self.__wait_for_file(file.name, fan_out, file_targets, errors,
+                    checkpoint)
+                targets = [target for target in targets
+                    if target in succeeded_targets or target not in file_targets]
+        return size
+
+    def __get_mismatched_files(self, sizes: Dict[str, int], targets: List[Sink], dbfs_path: str,
+        errors: List[DBFSException]) -> Tuple[Dict[str, List[Sink]], List[Sink]]:
+        # One list request per folder and target, instead of one get-status request per file
+        folders = get_folders(dbfs_path, sizes)
+        listings = [(target, folder) for target in targets for folder in folders]
+        with ThreadPoolExecutor(max_workers=self.__max_pending_files) as executor:
+            futures = [executor.submit(run_in_context(target.list), folder)
+                for target, folder in listings]
+
+        mismatched: Dict[str, List[Sink]] = {}
+        failed_targets: List[Sink] = []
+        for (target, folder), future in zip(listings, futures):
+            try:
+                listing = future.result()
+            except DBFSException as ex:
+                if str(ex) != '404':
+                    if target not in failed_targets:
+                        self.__logger.error('Failed to verify DBFS folder "%s": %s', folder, ex)
+                        errors.append(ex)
+                        failed_targets.append(target)
+                    continue
+                listing = None
+            for name in get_mismatched_files(folders[folder], listing, sizes):
+                mismatched.setdefault(name, []).append(target)
+
+        targets = [target for target in targets if target not in failed_targets]
+        mismatched = {name: [target for target in file_targets if target in targets]
+            for name, file_targets in mismatched.items()}
+        return {name: x for name, x in mismatched.items() if x}, targets
+
+    @staticmethod
+    def __get_expected_size(file: GitFile, transform: Optional[Transform],
+        fan_out: DBFSFanOut) -> int:
+        # Size in Git if known, as downloads may end early, or bytes streamed if transformed
+        return file.size if file.size is not None and transform is None else fan_out.size
+
+    def __copy_file_to_dbfs(self, file: GitFile, targets: List[Sink], dbfs_file_path: str,
+        pool: BufferPool, transform: Optional[Transform] = None) -> DBFSFanOut:
+        self.__logger.info('Copying GitHub file "%s" to DBFS "%s"', file.download_url,
+            dbfs_file_path)
+
+        fan_out = DBFSFanOut(targets, dbfs_file_path, pool)
+        stream = transform.open(fan_out.write) if transform else None
+        write = stream.write if stream else fan_out.write
+        try:
+            if file.content is not None:
+                write(file.content)
+            else:
+                # Untransformed downloads get read straight into the blocks of the pool
+                self.download_file(file.download_url, write, file.headers,
+                    None if stream else fan_out.read_from)
+            if stream:
+                stream.close()
+        except Exception:
+            fan_out.close(abort=True)
+            raise
 
-        handle = dbfs.create(dbfs_file_path, True)
-        self.download_file(download_url, lambda c, h=handle: dbfs.add_block(h, c))
-        dbfs.close(handle)
+        fan_out.finish()
+        return fan_out
+
+    def __wait_for_file(self, name: str, fan_out: DBFSFanOut, targets: List[Sink],
+        errors: List[DBFSException], checkpoint: Checkpoint) -> List[Sink]:
+        failed_writers = fan_out.wait()
+        if not failed_writers:
+            checkpoint.publish(name)
+        for writer in failed_writers:
+            self.__logger.error('Failed to copy file to DBFS "%s": %s', fan_out.path, writer.error)
+            errors.append(writer.error)
+
+        failed_targets = [writer.dbfs for writer in failed_writers]
+        return [target for target in targets if target not in failed_targets]
+
+    def __get_blobs(self, repo: str, commit_sha: str) -> Dict[str, str]:
+        # SHA of every file in the tree of a commit
+        tree = self.get_tree(repo, commit_sha)
+        if tree.get('truncated'):
+            self.__logger.warning('Tree of commit "%s" is truncated, changes may be missed',
+                commit_sha)
+        return {x['path']: x['sha'] for x in tree['tree'] if x['type'] == 'blob'}
 
     def __get(self, api: str, params: dict) -> requests.Response:
-        response = requests.get(f'{self.__api_base_url}/{api}', headers=self.__headers,
-            params=params)
+        api_name = api.split('/')[3] if api.startswith('repos/') else api
+        acquire_token(self.__rate_limiter, api_name)
+        with span(f'GitHub {api_name}', path=api), timed(GITHUB_LATENCY, api=api_name):
+            response = self.__limiter.call(api_name,
+                lambda: self.__session.get(f'{self.__api_base_url}/{api}',
+                    headers=self.__headers, params=params, timeout=self.__timeout),
+                rate_limiter=self.__rate_limiter)
         if not response:
             raise GitHubException(response.status_code)
         return response
@@ -118,25 +652,71 @@ class GitHub:
 class GitPushNotification:
     """
     Class that represents a "Git push to a repository" notification from a GitHub Webhook.
+    Notifications list up to MAX_COMMITS commits, and list no files at all for commits too large
+    for GitHub to list their files in time. When truncated, all changed files can be taken from
+    GitHub into "changed_files" (see GitHub.get_changed_files).
     """
 
+    MAX_COMMITS = 20
+
     def __init__(self, notification: dict):
         self.ref = notification.get('ref')
         repo = notification.get('repository')
         self.repo = repo.get('full_name') if repo else None
         self.commits = notification.get('commits')
+        self.before = notification.get('before')
+        self.after = notification.get('after')
+        self.size = notification.get('size', notification.get('distinct_size'))
+        self.changed_files: Optional[List[str]] = None
 
         if not self.ref or not self.repo or not self.commits:
             raise AttributeError
 
-    def get_modified_files(self, git_path: GitPath):
+    @property
+    def is_truncated(self) -> bool:
+        """
+        Whether the commits in the notification may not include all changed files: GitHub
+        listed as many commits as it lists at most, fewer commits than pushed ("size" is only
+        set by the Events API, not by webhooks), or a commit without any file.
+        Pushes deleting a branch are never truncated, as there are no files to copy.
         """
-        Get all modified files under a specific repo/branch/path.
+        if not self.after or self.after == NULL_SHA or not self.before:
+            return False
+        return len(self.commits) >= self.MAX_COMMITS or \
+            (self.size is not None and self.size > len(self.commits)) or \
+            any(not (commit.get('added') or commit.get('removed') or commit.get('modified'))
+                for commit in self.commits)
+
+    def to_dict(self) -> dict:
+        """
+        Gets the payload of a truncated notification without the files of its commits (they get
+        taken from GitHub when it gets completed), e.g. to complete it in a continuation.
+        """
+        return {
+            'ref': self.ref,
+            'repository': {'full_name': self.repo},
+            'before': self.before,
+            'after': self.after,
+            'size': self.size,
+            'commits': [{'added': [], 'removed': [], 'modified': []} for _ in self.commits]
+        }
+
+    def get_modified_files(self, git_path: GitPath, removed: bool = True) -> Iterator[str]:
+        """
+        Get all modified files under a specific repo/branch/path (without the removed ones, if
+        not removed).
+        Files are streamed as they are found in the commits, without building intermediate lists,
+        or taken from "changed_files" if set (which may include removed files in any case).
         """
         if self.repo != git_path.repo or self.ref != git_path.ref:
-            return []
+            return iter(())
+
+        if self.changed_files is not None:
+            return (file for file in self.changed_files if file.startswith(git_path.path))
 
-        return [file
+        return (file
             for commit in self.commits
-            for file in commit['added'] + commit['removed'] + commit['modified']
-            if file.startswith(git_path.path)]
+            for files in ((commit['added'], commit['removed'], commit['modified']) if removed
+                else (commit['added'], commit['modified']))
+            for file in files
+            if file.startswith(git_path.path))
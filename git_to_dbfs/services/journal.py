@@ -0,0 +1,221 @@
+"""
+Write-ahead journal of the copies of version folders, so copies interrupted by a crash of the
+worker get finished by another invocation without copying again the files they published.
+"""
+
+from contextlib import contextmanager
+import json
+import sqlite3
+from threading import Lock
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import uuid
+
+from .checkpoint import Checkpoint
+
+PLANNED = 'planned'
+UPLOADED = 'uploaded'
+PUBLISHED = 'published'
+
+# Seconds that copies stay claimed by their journal without progress, as long as the longest
+# invocations (functionTimeout in host.json)
+DEFAULT_LEASE = 600
+
+class SyncJournal:
+    """
+    Journal of the copies in progress on a host, in a local SQLite database (in WAL mode, shared
+    by all the processes on the host).
+    Every copy is identified by a key, and records the journal copying it (by a random id, as
+    workers restarted after a crash often get the same PID) with a lease that gets renewed for
+    lease seconds whenever the copy makes progress, whether its DBFS folder got deleted, and the
+    state of each of its files by name and Git SHA: planned, uploaded (all its blocks sent) or
+    published. Copies are forgotten once finished, so copies of other journals whose lease
+    expired were interrupted, and get recovered.
+    """
+
+    def __init__(self, path: str, lease: float = DEFAULT_LEASE):
+        self.path = path
+        self.lease = lease
+        self.instance = uuid.uuid4().hex
+        self.__lock = Lock()
+        self.__connection = sqlite3.connect(path, timeout=30, check_same_thread=False,
+            isolation_level=None)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__connection.executescript('''
+            CREATE TABLE IF NOT EXISTS copies (
+                key TEXT PRIMARY KEY, owner TEXT, lease REAL, deleted INTEGER, data TEXT);
+            CREATE TABLE IF NOT EXISTS files (
+                key TEXT, name TEXT, sha TEXT, state TEXT, PRIMARY KEY (key, name));
+        ''')
+
+    def checkpoint(self, key: str, data: dict,
+        checkpoint: Optional[Checkpoint] = None) -> 'JournaledCheckpoint':
+        """
+        Claims a copy for this journal, and gets its checkpoint: the given one (e.g. from a
+        continuation message), or the one in the journal, or a new one. Data (e.g. what to copy)
+        gets stored along with the copy, for its recovery.
+        """
+        with self.__transaction() as cursor:
+            if isinstance(checkpoint, JournaledCheckpoint) and checkpoint.key == key:
+                self.__claim(cursor, key)
+                return checkpoint
+            if checkpoint is None:
+                checkpoint = self.__load(cursor, key)
+            else:
+                cursor.execute('DELETE FROM files WHERE key = ?', (key,))
+                cursor.executemany('INSERT INTO files VALUES (?, ?, NULL, ?)',
+                    [(key, name, PUBLISHED) for name in checkpoint.completed])
+            cursor.execute('INSERT OR REPLACE INTO copies VALUES (?, ?, ?, ?, ?)',
+                (key, self.instance, time.time() + self.lease, int(checkpoint.deleted),
+                    json.dumps(data)))
+        return JournaledCheckpoint(self, key, checkpoint.deleted, checkpoint.completed)
+
+    def recover(self) -> List[Tuple[str, dict, 'JournaledCheckpoint']]:
+        """
+        Claims the copies of other journals whose lease expired (e.g. of processes that are gone),
+        and gets their keys, data and checkpoints.
+        """
+        recovered = []
+        with self.__transaction() as cursor:
+            copies = cursor.execute('SELECT key, data FROM copies WHERE owner != ? AND lease < ?',
+                (self.instance, time.time())).fetchall()
+            for key, data in copies:
+                self.__claim(cursor, key)
+                checkpoint = self.__load(cursor, key)
+                recovered.append((key, json.loads(data),
+                    JournaledCheckpoint(self, key, checkpoint.deleted, checkpoint.completed)))
+        return recovered
+
+    def forget(self, keys: Iterable[str]):
+        """
+        Forgets copies, e.g. once finished.
+        """
+        keys = [(key,) for key in keys]
+        with self.__transaction() as cursor:
+            cursor.executemany('DELETE FROM copies WHERE key = ?', keys)
+            cursor.executemany('DELETE FROM files WHERE key = ?', keys)
+
+    def get_files(self, key: str) -> Dict[str, Tuple[Optional[str], str]]:
+        """
+        Gets the Git SHA and state of every file of a copy, by name.
+        """
+        with self.__lock:
+            rows = self.__connection.execute('SELECT name, sha, state FROM files WHERE key = ?',
+                (key,)).fetchall()
+        return {name: (sha, state) for name, sha, state in rows}
+
+    def set_deleted(self, key: str, deleted: bool):
+        """
+        Records whether the DBFS folder of a copy got deleted.
+        """
+        with self.__transaction() as cursor:
+            cursor.execute('UPDATE copies SET deleted = ? WHERE key = ?', (int(deleted), key))
+            self.__claim(cursor, key)
+
+    def plan(self, key: str, files: Dict[str, Optional[str]]) -> Tuple[bool, List[str]]:
+        """
+        Records the files that a copy will publish, and gets which files were already published
+        with the same SHA. If files that got published are no longer planned (removed from Git),
+        the copy gets rolled back to the start, so the DBFS folder gets deleted again.
+        Returns whether the copy got rolled back, and the names of the published files.
+        """
+        with self.__transaction() as cursor:
+            published = dict(cursor.execute(
+                'SELECT name, sha FROM files WHERE key = ? AND state = ?',
+                (key, PUBLISHED)).fetchall())
+            rolled_back = any(name not in files for name in published)
+            if rolled_back:
+                published = {}
+                cursor.execute('UPDATE copies SET deleted = 0 WHERE key = ?', (key,))
+            completed = [name for name, sha in published.items()
+                if sha is None or files[name] is None or sha == files[name]]
+
+            cursor.execute('DELETE FROM files WHERE key = ?', (key,))
+            cursor.executemany('INSERT INTO files VALUES (?, ?, ?, ?)', [
+                (key, name, sha or published.get(name),
+                    PUBLISHED if name in completed else PLANNED)
+                for name, sha in files.items()])
+            self.__claim(cursor, key)
+        return rolled_back, completed
+
+    def set_state(self, key: str, name: str, state: str):
+        """
+        Records the state of a file of a copy.
+        """
+        with self.__transaction() as cursor:
+            cursor.execute('UPDATE files SET state = ? WHERE key = ? AND name = ?',
+                (state, key, name))
+            self.__claim(cursor, key)
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self.__connection.close()
+
+    @contextmanager
+    def __transaction(self) -> Iterator[sqlite3.Cursor]:
+        # Immediate transactions, so processes never read stale data before writing
+        with self.__lock:
+            cursor = self.__connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+
+    def __claim(self, cursor: sqlite3.Cursor, key: str):
+        # Copies stay claimed for lease seconds since their last progress
+        cursor.execute('UPDATE copies SET owner = ?, lease = ? WHERE key = ?',
+            (self.instance, time.time() + self.lease, key))
+
+    @staticmethod
+    def __load(cursor: sqlite3.Cursor, key: str) -> Checkpoint:
+        row = cursor.execute('SELECT deleted FROM copies WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return Checkpoint()
+        completed = [name for name, in cursor.execute(
+            'SELECT name FROM files WHERE key = ? AND state = ?', (key, PUBLISHED))]
+        return Checkpoint(bool(row[0]), completed)
+
+class JournaledCheckpoint(Checkpoint):
+    """
+    Checkpoint of a copy that records its progress in a journal as it happens.
+    """
+
+    def __init__(self, journal: SyncJournal, key: str, deleted: bool = False,
+        completed: Iterable[str] = ()):
+        self.journal = journal
+        self.key = key
+        self.__deleted = deleted
+        super().__init__(deleted, completed)
+
+    @property
+    def deleted(self) -> bool:
+        """
+        Whether the previous contents of the DBFS folder have been deleted.
+        """
+        return self.__deleted
+
+    @deleted.setter
+    def deleted(self, deleted: bool):
+        if deleted != self.__deleted:
+            self.journal.set_deleted(self.key, deleted)
+        self.__deleted = deleted
+
+    def plan(self, files: Dict[str, Optional[str]]):
+        rolled_back, completed = self.journal.plan(self.key, files)
+        if rolled_back:
+            self.__deleted = False
+        self.completed = set(completed)
+
+    def upload(self, name: str):
+        self.journal.set_state(self.key, name, UPLOADED)
+        super().upload(name)
+
+    def publish(self, name: str):
+        self.journal.set_state(self.key, name, PUBLISHED)
+        super().publish(name)
@@ -0,0 +1,74 @@
+"""
+Git LFS helper methods: detection of pointer files and requests to the batch API.
+More info: https://github.com/git-lfs/git-lfs/blob/main/docs/api/batch.md
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Pointer files are always smaller than this
+LFS_POINTER_MAX_SIZE = 1024
+
+# Most objects in a request to the batch API
+LFS_BATCH_SIZE = 100
+
+LFS_MEDIA_TYPE = 'application/vnd.git-lfs+json'
+
+_POINTER = re.compile(
+    rb'^version https://git-lfs\.github\.com/spec/v1\n'
+    rb'(?:[a-z0-9.-]+ [^\n]*\n)*?'
+    rb'oid sha256:(?P<oid>[0-9a-f]{64})\n'
+    rb'size (?P<size>[0-9]+)\n'
+    rb'(?:[a-z0-9.-]+ [^\n]*\n)*$')
+
+class LFSPointer:
+    """
+    Pointer file committed in place of a file tracked by Git LFS.
+    """
+
+    def __init__(self, oid: str, size: int):
+        self.oid = oid
+        self.size = size
+
+    @classmethod
+    def parse(cls, content: bytes) -> Optional['LFSPointer']:
+        """
+        Parses the content of a file, if it is a pointer file (None otherwise).
+        """
+        if len(content) >= LFS_POINTER_MAX_SIZE:
+            return None
+        match = _POINTER.match(content)
+        if not match:
+            return None
+        return cls(match.group('oid').decode(), int(match.group('size')))
+
+def get_lfs_url(api_base_url: str, repo: str) -> str:
+    """
+    Gets the URL of the LFS server of a repo, from the URL of GitHub API:
+    "https://github.com/{repo}.git/info/lfs" for "https://api.github.com", and
+    "https://{host}/{repo}.git/info/lfs" for GitHub Enterprise ("https://{host}/api/v3").
+    """
+    base_url = re.sub('/api/v3/?$', '', api_base_url.rstrip('/'))
+    base_url = base_url.replace('://api.github.com', '://github.com')
+    return f'{base_url}/{repo}.git/info/lfs'
+
+def get_batch_requests(pointers: List[LFSPointer]) -> List[dict]:
+    """
+    Gets the bodies of the requests to the batch API to download objects, LFS_BATCH_SIZE objects
+    per request.
+    """
+    objects = list({pointer.oid: {'oid': pointer.oid, 'size': pointer.size}
+        for pointer in pointers}.values())
+    return [{'operation': 'download', 'transfers': ['basic'],
+            'objects': objects[offset:offset + LFS_BATCH_SIZE]}
+        for offset in range(0, len(objects), LFS_BATCH_SIZE)]
+
+def get_download_actions(response: dict) -> Dict[str, Tuple[str, dict]]:
+    """
+    Gets the URL and headers to download every object in a response of the batch API.
+    Objects with errors (e.g. missing from the LFS server) are left out.
+    """
+    return {x['oid']: (x['actions']['download']['href'],
+            x['actions']['download'].get('header', {}))
+        for x in response.get('objects', [])
+        if 'download' in x.get('actions', {})}
@@ -0,0 +1,268 @@
+"""
+Adaptive concurrency limits and rate limits for requests to GitHub and DBFS.
+"""
+
+from contextlib import contextmanager
+from hashlib import sha1
+import json
+import os
+from random import random
+from threading import Condition, Lock
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .breaker import CircuitBreaker, get_breaker
+from .telemetry import CONCURRENCY_LIMIT, RETRIES, record
+
+class AdaptiveLimiter:
+    """
+    Limits the number of in-flight requests to an endpoint with AIMD (additive increase,
+    multiplicative decrease), like TCP congestion control:
+    - While the latency of every API stays within latency_tolerance times its lowest latency,
+      the limit grows by about one request per limit requests that succeed while the limit was
+      reached (so it doesn't grow while there are few requests).
+    - On a throttling response (429 or 503) or a connection error, the limit gets multiplied by
+      backoff (once per round of requests), and throttled requests get retried after their
+      "Retry-After" or an exponential delay, up to max_retries times.
+    The limit is recorded in "git_to_dbfs/concurrency_limit" metric, tagged with the limiter name.
+    With a circuit breaker, requests fail right away with CircuitOpenException while the circuit
+    of the endpoint is open, and the outcome of every request gets recorded in the breaker.
+    """
+
+    THROTTLING_STATUS_CODES = (429, 503)
+
+    def __init__(self, name: str, initial_limit: int = 16, min_limit: int = 1,
+        max_limit: int = 128, backoff: float = 0.5, latency_tolerance: float = 2.0,
+        max_retries: int = 3, retry_delay: float = 0.25, max_retry_delay: float = 10,
+        breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.breaker = breaker
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.__limit = float(initial_limit)
+        self.__in_flight = 0
+        self.__min_latencies: Dict[str, float] = {}
+        self.__last_decrease = 0.0
+        self.__condition = Condition()
+
+    @property
+    def limit(self) -> int:
+        """
+        Current maximum number of in-flight requests.
+        """
+        return int(self.__limit)
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Current number of in-flight requests.
+        """
+        return self.__in_flight
+
+    def call(self, api: str, send: Callable[[], requests.Response],
+        max_retries: Optional[int] = None, rate_limiter: Optional['RateLimiter'] = None) \
+        -> requests.Response:
+        """
+        Sends a request once there is room for it under the limit, retrying it while throttled
+        (up to max_retries times, if set, e.g. 0 for requests that can't be sent again).
+        With a rate limiter, retries wait for a token of the API before waiting for room, like
+        the first attempt does before the call (see acquire_token).
+        Returns the last response.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            trial = self.breaker.check() if self.breaker else False
+            response = self.__send(api, send, trial)
+            if response.status_code not in self.THROTTLING_STATUS_CODES or \
+                attempt >= max_retries:
+                return response
+
+            response.close()
+            attempt += 1
+            record(RETRIES, 1, api=api)
+            time.sleep(self.__get_retry_delay(response, attempt))
+            acquire_token(rate_limiter, api)
+
+    def __send(self, api: str, send: Callable[[], requests.Response],
+        trial: bool) -> requests.Response:
+        with self.__condition:
+            while self.__in_flight >= int(self.__limit):
+                self.__condition.wait()
+            self.__in_flight += 1
+            limited = self.__in_flight >= int(self.__limit)
+
+        start = time.perf_counter()
+        response = None
+        try:
+            response = send()
+            return response
+        finally:
+            latency = time.perf_counter() - start
+            if self.breaker:
+                self.breaker.record(response is not None and
+                    not self.breaker.is_failure(response.status_code), trial)
+            with self.__condition:
+                self.__in_flight -= 1
+                if response is None or response.status_code in self.THROTTLING_STATUS_CODES:
+                    self.__decrease(start)
+                else:
+                    self.__increase(api, latency, limited)
+                self.__condition.notify_all()
+
+    def __increase(self, api: str, latency: float, limited: bool):
+        min_latency = self.__min_latencies.get(api)
+        if min_latency is None or latency < min_latency:
+            self.__min_latencies[api] = min_latency = latency
+
+        if limited and latency <= min_latency * self.latency_tolerance and \
+            self.__limit < self.max_limit:
+            self.__limit = min(self.max_limit, self.__limit + 1 / self.__limit)
+            record(CONCURRENCY_LIMIT, self.limit, limiter=self.name)
+
+    def __decrease(self, start: float):
+        # Requests sent before the last decrease were sent under the old limit
+        if start < self.__last_decrease:
+            return
+        self.__last_decrease = time.perf_counter()
+        self.__limit = max(self.min_limit, self.__limit * self.backoff)
+        record(CONCURRENCY_LIMIT, self.limit, limiter=self.name)
+
+    def __get_retry_delay(self, response: requests.Response, attempt: int) -> float:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(self.max_retry_delay, float(retry_after))
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempt - 1))
+        return delay * (0.5 + random() / 2)
+
+_LIMITERS: Dict[str, AdaptiveLimiter] = {}
+_LIMITERS_LOCK = Lock()
+
+def get_limiter(endpoint: str) -> AdaptiveLimiter:
+    """
+    Gets the limiter of an endpoint (e.g. a Databricks host), shared by all clients of that
+    endpoint in the process, with the circuit breaker of the endpoint.
+    """
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(endpoint)
+        if limiter is None:
+            limiter = _LIMITERS[endpoint] = AdaptiveLimiter(endpoint,
+                breaker=get_breaker(endpoint))
+        return limiter
+
+class RateLimiter:
+    """
+    Token buckets that limit the rate of requests to an endpoint, with a budget per API, e.g.
+    "add-block=20/40,list=5,*=30": up to 20 add-block requests per second with bursts of up to
+    40, 5 list requests per second, and 30 requests per second for every other API. Without
+    "*", other APIs are not limited.
+    With state_path, buckets are kept in that file and shared by all processes using it, under
+    an exclusive file lock. Otherwise they are shared by the threads of this process only.
+    """
+
+    def __init__(self, budgets: str, state_path: Optional[str] = None):
+        self.budgets: Dict[str, Tuple[float, float]] = {}
+        for budget in budgets.split(','):
+            api, rate = budget.strip().split('=')
+            rate, _, burst = rate.partition('/')
+            self.budgets[api.strip()] = (float(rate), float(burst or rate))
+        if state_path and fcntl is None:
+            raise ImportError('fcntl is required to share rate limits across processes')
+        self.state_path = state_path
+        self.__buckets: Dict[str, List[float]] = {}
+        self.__lock = Lock()
+
+    def acquire(self, api: str):
+        """
+        Waits until there is a token for a request to an API, and takes it.
+        """
+        wait = self.try_acquire(api)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire(api)
+
+    def try_acquire(self, api: str) -> float:
+        """
+        Takes a token for a request to an API if there is any, and returns 0. Otherwise returns
+        the seconds to wait for the next token.
+        """
+        bucket = api if api in self.budgets else '*'
+        if bucket not in self.budgets:
+            return 0
+        rate, burst = self.budgets[bucket]
+
+        with self.__lock, self.__open_buckets() as buckets:
+            now = time.time()
+            tokens, last = buckets.get(bucket, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - last) * rate)
+            if tokens >= 1:
+                buckets[bucket] = [tokens - 1, now]
+                return 0
+            buckets[bucket] = [tokens, now]
+            return (1 - tokens) / rate
+
+    @contextmanager
+    def __open_buckets(self) -> Iterator[Dict[str, List[float]]]:
+        if not self.state_path:
+            yield self.__buckets
+            return
+
+        with open(self.state_path, 'a+', encoding='utf-8') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                content = file.read()
+                buckets = json.loads(content) if content else {}
+                yield buckets
+                file.seek(0)
+                file.truncate()
+                file.write(json.dumps(buckets))
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+_RATE_LIMITERS: Dict[Tuple[str, str, Optional[str]], RateLimiter] = {}
+
+def get_rate_limiter(endpoint: str, budgets: Optional[str], state_dir: Optional[str] = None) \
+    -> Optional[RateLimiter]:
+    """
+    Gets the rate limiter of an endpoint with some budgets (see RateLimiter), shared by all
+    clients of that endpoint in the process, or None if there are no budgets.
+    With state_dir, the rate limiter is shared with other processes through a file in that
+    folder.
+    """
+    if not budgets:
+        return None
+
+    key = (endpoint, budgets, state_dir)
+    with _LIMITERS_LOCK:
+        rate_limiter = _RATE_LIMITERS.get(key)
+        if rate_limiter is None:
+            state_path = None
+            if state_dir:
+                os.makedirs(state_dir, exist_ok=True)
+                state_path = os.path.join(state_dir,
+                    f'{sha1(endpoint.encode()).hexdigest()}.json')
+            rate_limiter = _RATE_LIMITERS[key] = RateLimiter(budgets, state_path)
+        return rate_limiter
+
+def acquire_token(rate_limiter: Optional[RateLimiter], api: str):
+    """
+    Waits for a token of an API, if there is a rate limiter. Requests take it before being
+    timed and before waiting for room under their AdaptiveLimiter, so the wait doesn't hold an
+    in-flight slot nor count as latency.
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire(api)
@@ -0,0 +1,85 @@
+"""
+Local filesystem sink, e.g. to benchmark copies without a Databricks workspace.
+"""
+
+import os
+import shutil
+from typing import BinaryIO, Tuple
+import uuid
+
+from .dbfs import DBFSException
+from .sink import Sink
+from .telemetry import BLOCKS, BYTES, record
+
+class LocalSink(Sink):
+    """
+    Class to write files to a local folder: DBFS paths (e.g. "/mnt/data/v1/file.csv") are taken
+    relative to root. Files are written to temporary files next to them, and renamed once closed.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def list(self, path: str) -> dict:
+        """
+        Lists the contents of a directory, in the format of DBFS list API.
+        """
+        try:
+            entries = list(os.scandir(self.__get_local_path(path)))
+        except (FileNotFoundError, NotADirectoryError) as ex:
+            raise DBFSException(404) from ex
+        return {'files': [
+            {'path': f'{path.rstrip("/")}/{entry.name}', 'is_dir': entry.is_dir(),
+                'file_size': 0 if entry.is_dir() else entry.stat().st_size}
+            for entry in entries if not entry.name.endswith('.tmp')]}
+
+    def create(self, path: str, overwrite: bool) -> Tuple[BinaryIO, str, str]:
+        """
+        Opens a temporary file to write to a file.
+        """
+        local_path = self.__get_local_path(path)
+        if not overwrite and os.path.exists(local_path):
+            raise DBFSException(409)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        temp_path = f'{local_path}.{uuid.uuid4().hex}.tmp'
+        return open(temp_path, 'wb'), temp_path, local_path # pylint: disable=consider-using-with
+
+    def add_block(self, handle: Tuple[BinaryIO, str, str], data: bytes):
+        """
+        Appends a block of data to a file.
+        """
+        handle[0].write(data)
+        record(BYTES, len(data))
+        record(BLOCKS, 1)
+
+    def close(self, handle: Tuple[BinaryIO, str, str]):
+        """
+        Closes a file, publishing it.
+        """
+        file, temp_path, local_path = handle
+        file.close()
+        os.replace(temp_path, local_path)
+
+    def abort(self, handle: Tuple[BinaryIO, str, str]):
+        """
+        Discards a file.
+        """
+        file, temp_path, _ = handle
+        file.close()
+        os.remove(temp_path)
+
+    def delete(self, path: str, recursive: bool):
+        """
+        Deletes a file or directory. Missing paths are ignored.
+        """
+        local_path = self.__get_local_path(path)
+        if os.path.isdir(local_path):
+            if recursive:
+                shutil.rmtree(local_path)
+            else:
+                os.rmdir(local_path)
+        elif os.path.exists(local_path):
+            os.remove(local_path)
+
+    def __get_local_path(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip('/'))
@@ -0,0 +1,149 @@
+"""
+Opt-in profiling of single invocations, with cProfile and tracemalloc.
+
+The profiler of the current invocation is kept in a context variable, so threads started with
+"telemetry.run_in_context" get profiled too. Only one invocation per process gets profiled at a
+time, as both profilers are process-wide resources.
+"""
+
+from contextlib import contextmanager
+import contextvars
+import cProfile
+from datetime import datetime, timezone
+import io
+from logging import Logger
+import os
+import pstats
+import tempfile
+from threading import Lock, local
+import tracemalloc
+from typing import Callable, Iterator, List, Mapping, Optional
+import uuid
+
+PROFILE_HEADER = 'X-Git-To-Dbfs-Profile'
+
+_PROFILER: contextvars.ContextVar = contextvars.ContextVar('git_to_dbfs_profiler', default=None)
+_LOCK = Lock()
+
+class InvocationProfiler:
+    """
+    Profiles the calling thread and every thread it starts in context, and traces memory
+    allocations, writing to "directory":
+    - {name}.prof: cProfile stats of all profiled threads (see "pstats" or "snakeviz").
+    - {name}.txt: top functions by cumulative time and top allocations by line.
+    """
+
+    def __init__(self, directory: str, top: int = 30):
+        self.directory = directory
+        self.top = top
+        self.name = (f'{datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")}_'
+            f'{uuid.uuid4().hex[:8]}')
+        self.__profiles: List[cProfile.Profile] = []
+        self.__lock = Lock()
+        self.__thread = local()
+
+    def run(self, function: Callable, *args, **kwargs):
+        """
+        Runs a function with a profiler of its own (cProfile only profiles one thread), unless
+        its thread is already being profiled.
+        """
+        if getattr(self.__thread, 'profiled', False):
+            return function(*args, **kwargs)
+
+        thread_profile = cProfile.Profile()
+        with self.__lock:
+            self.__profiles.append(thread_profile)
+        self.__thread.profiled = True
+        thread_profile.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            thread_profile.disable()
+            self.__thread.profiled = False
+
+    @contextmanager
+    def profiling(self) -> Iterator['InvocationProfiler']:
+        """
+        Profiles a block of code, and writes the artifacts when done.
+        """
+        thread_profile = cProfile.Profile()
+        self.__profiles.append(thread_profile)
+        self.__thread.profiled = True
+        token = _PROFILER.set(self)
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        thread_profile.enable()
+        try:
+            yield self
+        finally:
+            thread_profile.disable()
+            self.__thread.profiled = False
+            _PROFILER.reset(token)
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            self.__write(snapshot, peak)
+
+    def __write(self, snapshot: tracemalloc.Snapshot, peak: int):
+        os.makedirs(self.directory, exist_ok=True)
+        with self.__lock:
+            stats = pstats.Stats(*self.__profiles)
+        stats.dump_stats(os.path.join(self.directory, f'{self.name}.prof'))
+
+        report = io.StringIO()
+        report.write(f'Profiled threads: {len(self.__profiles)}\n')
+        report.write(f'Peak traced memory: {peak / 1024 / 1024:.1f} MB\n\n')
+        stats.stream = report
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        report.write(f'Top {self.top} allocations:\n')
+        for statistic in snapshot.statistics('lineno')[:self.top]:
+            report.write(f'{statistic}\n')
+        with open(os.path.join(self.directory, f'{self.name}.txt'), 'w', encoding='utf-8') as file:
+            file.write(report.getvalue())
+
+def is_profiling_requested(setting: Optional[str], headers: Mapping[str, str]) -> bool:
+    """
+    Checks the "Profiling" setting: "true" profiles every invocation, "header" only those with
+    a "X-Git-To-Dbfs-Profile: true" header. Anything else disables profiling.
+    """
+    setting = (setting or '').lower()
+    if setting == 'true':
+        return True
+    return setting == 'header' and (headers.get(PROFILE_HEADER) or '').lower() == 'true'
+
+@contextmanager
+def profile(setting: Optional[str], headers: Mapping[str, str], directory: Optional[str],
+    logger: Logger) -> Iterator[Optional[InvocationProfiler]]:
+    """
+    Profiles a block of code if requested (see "is_profiling_requested"), writing the artifacts
+    to a directory (a "git_to_dbfs_profiles" temporary directory by default).
+    """
+    if not is_profiling_requested(setting, headers):
+        yield None
+        return
+
+    if not _LOCK.acquire(blocking=False): # pylint: disable=consider-using-with
+        logger.warning('Not profiling: Another invocation is being profiled')
+        yield None
+        return
+
+    try:
+        profiler = InvocationProfiler(directory or
+            os.path.join(tempfile.gettempdir(), 'git_to_dbfs_profiles'))
+        with profiler.profiling():
+            yield profiler
+        logger.info('Profile written to %s',
+            os.path.join(profiler.directory, f'{profiler.name}.prof'))
+    finally:
+        _LOCK.release()
+
+def run_profiled(function: Callable, *args, **kwargs):
+    """
+    Runs a function with the profiler of the current invocation, if any.
+    """
+    profiler = _PROFILER.get()
+    if profiler is None:
+        return function(*args, **kwargs)
+    return profiler.run(function, *args, **kwargs)
@@ -0,0 +1,53 @@
+"""
+Interface of the destinations that files get copied to.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any
+
+class Sink(ABC):
+    """
+    Destination of copied files: DBFS (see DBFS), Databricks Files API (see FilesSink) or a
+    local folder (see LocalSink).
+    Files get written as streams: "create" opens a stream, "add_block" appends blocks to it and
+    "close" publishes the file. Streams that get aborted (or never closed) are never published.
+    Errors are raised as DBFSException with the status code of the failure (404 for missing
+    paths), so copies handle every sink the same way.
+    """
+
+    @abstractmethod
+    def list(self, path: str) -> dict:
+        """
+        Lists the contents of a directory, in the format of DBFS list API:
+        {"files": [{"path": "/a/b.csv", "is_dir": false, "file_size": 261}]}
+        """
+
+    @abstractmethod
+    def create(self, path: str, overwrite: bool) -> Any:
+        """
+        Opens a stream to write to a file, and returns its handle.
+        """
+
+    @abstractmethod
+    def add_block(self, handle: Any, data: bytes):
+        """
+        Appends a block of data to a stream. The data may be reused by the caller once this
+        returns.
+        """
+
+    @abstractmethod
+    def close(self, handle: Any):
+        """
+        Closes a stream, publishing its file.
+        """
+
+    def abort(self, handle: Any):
+        """
+        Discards a stream without publishing its file.
+        """
+
+    @abstractmethod
+    def delete(self, path: str, recursive: bool):
+        """
+        Deletes a file or directory (and all its contents, with recursive).
+        """
@@ -0,0 +1,150 @@
+"""
+Tracing spans and transfer metrics sent to Azure Application Insights.
+
+Spans go to the tracer of the current invocation (see "start_tracing"), which is kept in a
+context variable, so code running in other threads or tasks must be started with a copy of the
+current context (see "run_in_context").
+Metrics are only recorded after "enable_metrics" gets called.
+"""
+
+from contextlib import contextmanager
+import contextvars
+import time
+from typing import Callable, Iterator, Optional
+
+from opencensus.ext.azure.metrics_exporter import new_metrics_exporter
+from opencensus.ext.azure.trace_exporter import AzureExporter
+from opencensus.stats import aggregation, measure, stats, view
+from opencensus.tags import tag_key, tag_map, tag_value
+from opencensus.trace.samplers import AlwaysOnSampler, ProbabilitySampler
+from opencensus.trace.tracer import Tracer
+
+from .profiling import run_profiled
+
+BYTES = measure.MeasureInt('git_to_dbfs/bytes', 'Bytes uploaded to DBFS', 'By')
+BLOCKS = measure.MeasureInt('git_to_dbfs/blocks', 'Blocks uploaded to DBFS', '1')
+RETRIES = measure.MeasureInt('git_to_dbfs/retries', 'Requests retried', '1')
+GITHUB_LATENCY = measure.MeasureFloat('git_to_dbfs/github_latency', 'GitHub request latency',
+    'ms')
+DBFS_LATENCY = measure.MeasureFloat('git_to_dbfs/dbfs_latency', 'DBFS request latency', 'ms')
+CONCURRENCY_LIMIT = measure.MeasureInt('git_to_dbfs/concurrency_limit',
+    'Limit of in-flight requests to an endpoint', '1')
+VERSION_THROUGHPUT = measure.MeasureFloat('git_to_dbfs/version_throughput',
+    'Throughput of the copy of a version folder', 'MBy/s')
+
+API = tag_key.TagKey('api')
+LIMITER = tag_key.TagKey('limiter')
+VERSION = tag_key.TagKey('version')
+
+LATENCY_BOUNDARIES = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+THROUGHPUT_BOUNDARIES = [0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200]
+
+VIEWS = [
+    view.View('git_to_dbfs/bytes', 'Bytes uploaded to DBFS', [], BYTES,
+        aggregation.SumAggregation()),
+    view.View('git_to_dbfs/blocks', 'Blocks uploaded to DBFS', [], BLOCKS,
+        aggregation.CountAggregation()),
+    view.View('git_to_dbfs/retries', 'Requests retried', [API], RETRIES,
+        aggregation.CountAggregation()),
+    view.View('git_to_dbfs/github_latency', 'GitHub request latency', [API], GITHUB_LATENCY,
+        aggregation.DistributionAggregation(LATENCY_BOUNDARIES)),
+    view.View('git_to_dbfs/dbfs_latency', 'DBFS request latency', [API], DBFS_LATENCY,
+        aggregation.DistributionAggregation(LATENCY_BOUNDARIES)),
+    view.View('git_to_dbfs/concurrency_limit', 'Limit of in-flight requests', [LIMITER],
+        CONCURRENCY_LIMIT, aggregation.LastValueAggregation()),
+    view.View('git_to_dbfs/version_throughput', 'Throughput per version', [VERSION],
+        VERSION_THROUGHPUT, aggregation.DistributionAggregation(THROUGHPUT_BOUNDARIES))
+]
+
+_TRACER: contextvars.ContextVar = contextvars.ContextVar('git_to_dbfs_tracer', default=None)
+_METRICS = {'enabled': False}
+_EXPORTERS = {}
+
+def get_sampler(sampling_rate: Optional[str]):
+    """
+    Gets the sampler for a sampling rate between 0 and 1 (always sample if not set).
+    """
+    rate = float(sampling_rate) if sampling_rate else 1.0
+    return AlwaysOnSampler() if rate >= 1 else ProbabilitySampler(rate)
+
+def start_tracing(connection_string: Optional[str], sampling_rate: Optional[str] = None) \
+    -> Optional[Tracer]:
+    """
+    Creates the tracer of the current invocation. The exporter is shared by all invocations.
+    """
+    if not connection_string:
+        return None
+
+    exporter = _EXPORTERS.get(connection_string)
+    if exporter is None:
+        exporter = _EXPORTERS[connection_string] = AzureExporter(
+            connection_string=connection_string)
+
+    tracer = Tracer(exporter=exporter, sampler=get_sampler(sampling_rate))
+    _TRACER.set(tracer)
+    return tracer
+
+def enable_metrics(connection_string: Optional[str]):
+    """
+    Registers all metric views and exports them to Azure Application Insights, once per process.
+    """
+    if _METRICS['enabled'] or not connection_string:
+        return
+
+    view_manager = stats.stats.view_manager
+    for metric_view in VIEWS:
+        view_manager.register_view(metric_view)
+    view_manager.register_exporter(new_metrics_exporter(connection_string=connection_string))
+    _METRICS['enabled'] = True
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[None]:
+    """
+    Traces a span in the tracer of the current invocation, if any.
+    """
+    tracer = _TRACER.get()
+    if tracer is None:
+        yield
+        return
+
+    with tracer.span(name=name) as current_span:
+        for key, value in attributes.items():
+            current_span.add_attribute(key, value)
+        yield
+
+def record(metric: measure.BaseMeasure, value, **tags):
+    """
+    Records a value of a metric, if metrics are enabled.
+    """
+    if not _METRICS['enabled']:
+        return
+
+    measurement_map = stats.stats.stats_recorder.new_measurement_map()
+    if isinstance(metric, measure.MeasureInt):
+        measurement_map.measure_int_put(metric, value)
+    else:
+        measurement_map.measure_float_put(metric, value)
+
+    metric_tags = tag_map.TagMap()
+    for key, tag in tags.items():
+        metric_tags.insert(tag_key.TagKey(key), tag_value.TagValue(str(tag)))
+    measurement_map.record(metric_tags)
+
+@contextmanager
+def timed(metric: measure.BaseMeasure, **tags) -> Iterator[None]:
+    """
+    Records the milliseconds spent in a block of code.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(metric, (time.perf_counter() - start) * 1000, **tags)
+
+def run_in_context(function: Callable) -> Callable:
+    """
+    Wraps a function to run in a copy of the current context (tracer and profiler), e.g. in a
+    thread.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(run_profiled, function, *args, **kwargs)
@@ -0,0 +1,229 @@
+"""
+Helper classes to transfer files to DBFS.
+"""
+
+from queue import Queue
+from threading import Lock, Thread
+from typing import Callable, List, Optional
+
+from .sink import Sink
+from .telemetry import run_in_context
+
+_CLOSE = object()
+_ABORT = object()
+
+class BufferPool:
+    """
+    Pool of preallocated buffers that get reused for all blocks of a transfer.
+    Acquiring a buffer waits while all of them are in use, so memory is capped at
+    count * size bytes.
+    """
+
+    def __init__(self, count: int, size: int):
+        self.size = size
+        self.__buffers = Queue()
+        for _ in range(count):
+            self.__buffers.put(bytearray(size))
+
+    def acquire(self) -> bytearray:
+        """
+        Gets a free buffer, waiting for one if all of them are in use.
+        """
+        return self.__buffers.get()
+
+    def release(self, buffer: bytearray):
+        """
+        Gives a buffer back to the pool.
+        """
+        self.__buffers.put(buffer)
+
+    def available(self) -> int:
+        """
+        Gets the number of free buffers.
+        """
+        return self.__buffers.qsize()
+
+class Block:
+    """
+    Block of data in a pooled buffer, shared by all the writers of a file. The buffer goes back
+    to the pool once every writer has released the block.
+    """
+
+    def __init__(self, pool: BufferPool, buffer: bytearray, length: int, writers: int):
+        self.data = memoryview(buffer)[:length]
+        self.__pool = pool
+        self.__buffer = buffer
+        self.__writers = writers
+        self.__lock = Lock()
+
+    def release(self):
+        """
+        Releases the block for one of its writers.
+        """
+        with self.__lock:
+            self.__writers -= 1
+            if self.__writers:
+                return
+        self.__pool.release(self.__buffer)
+
+class DBFSFileWriter:
+    """
+    Uploads a file to DBFS (or any other sink) from a dedicated thread, while the file keeps
+    being downloaded.
+    After a failure, blocks are released without being uploaded, so the download never waits for
+    a failed target.
+    """
+
+    def __init__(self, dbfs: Sink, path: str):
+        self.dbfs = dbfs
+        self.path = path
+        self.error: Optional[Exception] = None
+        self.__blocks = Queue()
+        self.__thread = Thread(target=run_in_context(self.__run), daemon=True)
+        self.__thread.start()
+
+    def write(self, block: Block):
+        """
+        Queues a block to be appended to the file.
+        """
+        self.__blocks.put(block)
+
+    def finish(self, abort: bool = False):
+        """
+        Signals that no more blocks will be written. Once all queued blocks are written, the file
+        gets closed or, if aborted, left unclosed so incomplete contents never get published.
+        """
+        self.__blocks.put(_ABORT if abort else _CLOSE)
+
+    def wait(self) -> Optional[Exception]:
+        """
+        Waits for the writer to finish.
+        Returns the error that stopped the writer, if any.
+        """
+        self.__thread.join()
+        return self.error
+
+    def __run(self):
+        block = None
+        handle = None
+        try:
+            handle = self.dbfs.create(self.path, True)
+            block = self.__blocks.get()
+            while block is not _CLOSE and block is not _ABORT:
+                try:
+                    self.dbfs.add_block(handle, block.data)
+                finally:
+                    block.release()
+                block = self.__blocks.get()
+            if block is _CLOSE:
+                self.dbfs.close(handle)
+            else:
+                self.dbfs.abort(handle)
+        except Exception as ex: # pylint: disable=broad-except
+            self.error = ex
+            while block is not _CLOSE and block is not _ABORT:
+                block = self.__blocks.get()
+                if isinstance(block, Block):
+                    block.release()
+            if handle is not None:
+                self.__abort(handle)
+
+    def __abort(self, handle):
+        try:
+            self.dbfs.abort(handle)
+        except Exception: # pylint: disable=broad-except
+            pass
+
+class DBFSFanOut:
+    """
+    Cuts the chunks of a file into blocks of pooled buffers and tees them to one DBFSFileWriter
+    per DBFS target, so the file is downloaded once regardless of the number of targets.
+    Files can also be read straight into the pooled buffers (see read_from), so blocks get
+    assembled without any intermediate bytes objects.
+    A slow target holds on to its blocks, so the download only waits for it once all buffers in
+    the pool are in use.
+    """
+
+    def __init__(self, targets: List[Sink], path: str, pool: BufferPool):
+        self.path = path
+        self.size = 0
+        self.__pool = pool
+        self.__writers = [DBFSFileWriter(target, path) for target in targets]
+        self.__buffer: Optional[bytearray] = None
+        self.__length = 0
+
+    def write(self, chunk: bytes):
+        """
+        Appends a chunk of data to the file in all targets.
+        """
+        view = memoryview(chunk)
+        self.size += len(view)
+        while view:
+            if self.__buffer is None:
+                self.__buffer = self.__pool.acquire()
+                self.__length = 0
+            size = min(len(view), self.__pool.size - self.__length)
+            self.__buffer[self.__length:self.__length + size] = view[:size]
+            self.__length += size
+            view = view[size:]
+            if self.__length == self.__pool.size:
+                self.__flush()
+
+    def read_from(self, readinto: Callable[[memoryview], int]):
+        """
+        Appends the rest of a stream to the file in all targets, reading it straight into pooled
+        buffers with readinto (e.g. of a download stream): it fills as much of a view as it can,
+        and returns the number of bytes read (0 at the end of the stream).
+        """
+        while True:
+            if self.__buffer is None:
+                self.__buffer = self.__pool.acquire()
+                self.__length = 0
+            count = readinto(memoryview(self.__buffer)[self.__length:])
+            if not count:
+                break
+            self.size += count
+            self.__length += count
+            if self.__length == self.__pool.size:
+                self.__flush()
+
+        if not self.__length:
+            self.__pool.release(self.__buffer)
+            self.__buffer = None
+
+    def finish(self, abort: bool = False):
+        """
+        Signals all targets that the file is complete (or aborted).
+        """
+        if abort:
+            if self.__buffer is not None:
+                self.__pool.release(self.__buffer)
+                self.__buffer = None
+        elif self.__buffer is not None:
+            self.__flush()
+
+        for writer in self.__writers:
+            writer.finish(abort)
+
+    def wait(self) -> List[DBFSFileWriter]:
+        """
+        Waits for all targets to finish and returns the writers that failed.
+        """
+        return [writer for writer in self.__writers if writer.wait() is not None]
+
+    def close(self, abort: bool = False) -> List[DBFSFileWriter]:
+        """
+        Finishes the file and waits for all targets. Returns the writers that failed.
+        """
+        self.finish(abort)
+        return self.wait()
+
+    def __flush(self):
+        if not self.__writers:
+            self.__pool.release(self.__buffer)
+            self.__buffer = None
+            return
+        block = Block(self.__pool, self.__buffer, self.__length, len(self.__writers))
+        self.__buffer = None
+        for writer in self.__writers:
+            writer.write(block)
@@ -0,0 +1,203 @@
+"""
+Transforms applied to CSV files while they get copied, e.g. to speed up downstream Spark jobs.
+"""
+
+from abc import ABC, abstractmethod
+import io
+from typing import Callable, List, Optional
+import zlib
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = None
+
+TRANSFORMS = ['none', 'gzip', 'parquet']
+
+class TransformStream(ABC):
+    """
+    Stream that transforms the chunks of a file, and writes the result to the next stage.
+    """
+
+    @abstractmethod
+    def write(self, chunk: bytes):
+        """
+        Transforms a chunk of the file.
+        """
+
+    @abstractmethod
+    def close(self):
+        """
+        Writes the rest of the transformed file.
+        """
+
+class Transform(ABC):
+    """
+    Transform of the CSV files of a copy: every CSV file gets streamed through a TransformStream
+    before being cut into blocks, and gets a new name (e.g. "file1.csv.gz"). Other files are
+    copied as they are.
+    """
+
+    def applies(self, name: str) -> bool:
+        """
+        Whether a file gets transformed.
+        """
+        return name.lower().endswith('.csv')
+
+    @abstractmethod
+    def rename(self, name: str) -> str:
+        """
+        Gets the name of a transformed file.
+        """
+
+    @abstractmethod
+    def open(self, write: Callable[[bytes], None]) -> TransformStream:
+        """
+        Opens a stream that writes the transformed file to write.
+        """
+
+class GzipTransform(Transform):
+    """
+    Compresses CSV files with gzip, which Spark reads transparently.
+    """
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def rename(self, name: str) -> str:
+        return f'{name}.gz'
+
+    def open(self, write: Callable[[bytes], None]) -> TransformStream:
+        return GzipStream(write, self.level)
+
+class GzipStream(TransformStream):
+    """
+    Compresses a file with gzip as its chunks arrive.
+    """
+
+    def __init__(self, write: Callable[[bytes], None], level: int):
+        self.__write = write
+        self.__compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def write(self, chunk: bytes):
+        data = self.__compressor.compress(chunk)
+        if data:
+            self.__write(data)
+
+    def close(self):
+        self.__write(self.__compressor.flush())
+
+class ParquetTransform(Transform):
+    """
+    Converts CSV files (with a header) to Parquet, with row groups of up to row_group_size rows.
+    Requires pyarrow.
+    """
+
+    def __init__(self, row_group_size: int = 65536):
+        if pa is None:
+            raise ImportError('pyarrow is required to convert CSV files to Parquet')
+        self.row_group_size = row_group_size
+
+    def rename(self, name: str) -> str:
+        return f'{name[:-len(".csv")]}.parquet'
+
+    def open(self, write: Callable[[bytes], None]) -> TransformStream:
+        return ParquetStream(write, self.row_group_size)
+
+class ParquetStream(TransformStream):
+    """
+    Converts a CSV file to Parquet as its chunks arrive: records get buffered until there are
+    enough rows for a row group, which gets parsed and written, so memory is bounded by the size
+    of a row group. Column types are inferred from the first row group.
+    """
+
+    def __init__(self, write: Callable[[bytes], None], row_group_size: int):
+        self.__output = _Output(write)
+        self.__row_group_size = row_group_size
+        self.__header: Optional[bytes] = None
+        self.__records: List[bytes] = []
+        # Lines of a record whose quoted field spans many lines
+        self.__record: List[bytes] = []
+        self.__quoted = False
+        self.__partial = b''
+        self.__writer = None
+        self.__schema = None
+
+    def write(self, chunk: bytes):
+        lines = (self.__partial + bytes(chunk)).split(b'\n')
+        self.__partial = lines.pop()
+        for line in lines:
+            self.__add_line(line + b'\n')
+
+    def close(self):
+        if self.__partial:
+            self.__add_line(self.__partial + b'\n')
+            self.__partial = b''
+        if self.__record:
+            self.__records.append(b''.join(self.__record))
+        if self.__records or self.__writer is None:
+            self.__write_row_group()
+        self.__writer.close()
+
+    def __add_line(self, line: bytes):
+        self.__record.append(line)
+        self.__quoted ^= line.count(b'"') % 2 == 1
+        if self.__quoted:
+            return
+
+        record = b''.join(self.__record)
+        self.__record = []
+        if self.__header is None:
+            self.__header = record
+        else:
+            self.__records.append(record)
+            if len(self.__records) >= self.__row_group_size:
+                self.__write_row_group()
+
+    def __write_row_group(self):
+        data = (self.__header or b'') + b''.join(self.__records)
+        self.__records = []
+        if data:
+            table = pa_csv.read_csv(io.BytesIO(data),
+                convert_options=pa_csv.ConvertOptions(column_types=self.__schema))
+        else:
+            table = pa.table({})
+        if self.__writer is None:
+            self.__schema = table.schema
+            self.__writer = pa_parquet.ParquetWriter(self.__output, self.__schema)
+        self.__writer.write_table(table.cast(self.__schema))
+
+class _Output(io.RawIOBase):
+    # File object that Parquet writers write to, forwarding everything to the next stage
+    def __init__(self, write: Callable[[bytes], None]):
+        super().__init__()
+        self.__write = write
+        self.__position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.__write(data)
+        self.__position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.__position
+
+def get_transform(name: Optional[str], row_group_size: Optional[int] = None) \
+    -> Optional[Transform]:
+    """
+    Gets a transform by name ("gzip", "parquet" or "none"/None for no transform).
+    """
+    name = (name or 'none').lower()
+    if name not in TRANSFORMS:
+        raise ValueError(f'Unknown transform "{name}", expected any of {", ".join(TRANSFORMS)}')
+    if name == 'gzip':
+        return GzipTransform()
+    if name == 'parquet':
+        return ParquetTransform(row_group_size) if row_group_size else ParquetTransform()
+    return None
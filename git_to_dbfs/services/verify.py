@@ -0,0 +1,28 @@
+"""
+Verification of copied files, with one list request per DBFS folder instead of one get-status
+request per file.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+def get_folders(dbfs_path: str, names: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Groups the names of the files of a copy (relative to dbfs_path, e.g. "sub/file1.csv") by
+    the DBFS folder they are in.
+    """
+    folders: Dict[str, List[str]] = {}
+    for name in names:
+        folder = name.rsplit('/', 1)[0] if '/' in name else ''
+        folders.setdefault(f'{dbfs_path}/{folder}' if folder else dbfs_path, []).append(name)
+    return folders
+
+def get_mismatched_files(names: List[str], listing: Optional[dict],
+    sizes: Dict[str, int]) -> List[str]:
+    """
+    Gets the names of the files of a folder that are missing from its listing (None if the
+    folder is missing), or whose size in the listing differs from the expected one.
+    """
+    listed_sizes = {x['path'].rstrip('/').split('/')[-1]: x.get('file_size')
+        for x in (listing or {}).get('files', []) if not x.get('is_dir')}
+    return [name for name in names
+        if listed_sizes.get(name.split('/')[-1]) != sizes[name]]
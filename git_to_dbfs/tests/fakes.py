@@ -0,0 +1,549 @@
+"""
+In-process fake GitHub and DBFS servers, implementing the subset of their APIs used by this
+function, with configurable latency, bandwidth and error injection.
+"""
+
+import base64
+from collections import Counter
+import gzip
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+from threading import Lock, Thread
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import unittest
+from urllib.parse import parse_qs, unquote, urlparse
+
+from ..routing import Mapping, RoutingTable
+
+REPO = 'magencio/git_to_dbfs_function'
+BRANCH = 'master'
+BASE_PATH = 'samplefiles'
+DBFS_BASE_PATH = '/mnt/playground/magencio/data/samplefiles'
+
+class FakeServer:
+    """
+    Base class of fake HTTP servers.
+    - latency: seconds added to every request.
+    - bandwidth: bytes per second when reading request bodies and writing response bodies
+      (None for unlimited).
+    - error_rate/error_status: probability of failing a request, and status code of the failure.
+    - max_concurrency: requests beyond this number of in-flight requests get a 429 (throttling).
+    Requests are counted per endpoint in "requests".
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, latency: float = 0, bandwidth: Optional[float] = None,
+        error_rate: float = 0, error_status: int = 503, max_concurrency: Optional[int] = None,
+        seed: int = 0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_concurrency = max_concurrency
+        self.requests = Counter()
+        self.errors = Counter()
+        self.lock = Lock()
+        self.__random = random.Random(seed)
+        self.__in_flight = 0
+        self.__failures: List[int] = []
+        self.__routes: List[Tuple[str, re.Pattern, Callable]] = []
+        self.__server: Optional[ThreadingHTTPServer] = None
+        self.__thread: Optional[Thread] = None
+        self.url = None
+
+    def route(self, method: str, pattern: str, handler: Callable):
+        """
+        Registers the handler of requests with a method and a path matching a regex pattern.
+        Handlers get (request, match, query, body) and return (status, headers, body).
+        """
+        self.__routes.append((method, re.compile(f'^{pattern}$'), handler))
+
+    def fail_next(self, count: int, status: int):
+        """
+        Fails the next requests with the given status code.
+        """
+        with self.lock:
+            self.__failures.extend([status] * count)
+
+    def start(self) -> 'FakeServer':
+        """
+        Starts serving in a background thread, on a free local port.
+        """
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            """
+            Request handler of the fake server.
+            """
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self): # pylint: disable=invalid-name,missing-function-docstring
+                server.handle(self, 'GET')
+
+            def do_POST(self): # pylint: disable=invalid-name,missing-function-docstring
+                server.handle(self, 'POST')
+
+            def do_PUT(self): # pylint: disable=invalid-name,missing-function-docstring
+                server.handle(self, 'PUT')
+
+            def do_DELETE(self): # pylint: disable=invalid-name,missing-function-docstring
+                server.handle(self, 'DELETE')
+
+            def log_message(self, *args): # pylint: disable=arguments-differ
+                pass
+
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.__server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.__server.server_address[1]}'
+        self.__thread = Thread(target=self.__server.serve_forever, args=(0.05,), daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving.
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def handle(self, request: BaseHTTPRequestHandler, method: str):
+        """
+        Handles a request: reads its body, injects latency/errors and routes it.
+        """
+        url = urlparse(request.path)
+        body = self.__read(request)
+
+        with self.lock:
+            self.__in_flight += 1
+            throttled = self.max_concurrency is not None and self.__in_flight > self.max_concurrency
+            failure = self.__failures.pop(0) if self.__failures else None
+            if failure is None and self.error_rate and self.__random.random() < self.error_rate:
+                failure = self.error_status
+            if throttled:
+                failure = 429
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+
+            for route_method, pattern, handler in self.__routes:
+                match = pattern.match(url.path)
+                if route_method == method and match:
+                    with self.lock:
+                        self.requests[handler.__name__] += 1
+                    if failure:
+                        with self.lock:
+                            self.errors[failure] += 1
+                        self.__write(request, failure, {}, b'')
+                    else:
+                        self.__write(request, *handler(request, match, parse_qs(url.query), body))
+                    return
+
+            self.__write(request, 404, {}, b'')
+        finally:
+            with self.lock:
+                self.__in_flight -= 1
+
+    def __read(self, request: BaseHTTPRequestHandler) -> bytes:
+        if request.headers.get('Transfer-Encoding') == 'chunked':
+            return self.__read_chunked(request)
+
+        length = int(request.headers.get('Content-Length') or 0)
+        chunks = []
+        while length > 0:
+            chunk = request.rfile.read(min(length, self.CHUNK_SIZE))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            length -= len(chunk)
+            self.__throttle(len(chunk))
+        return b''.join(chunks)
+
+    def __read_chunked(self, request: BaseHTTPRequestHandler) -> bytes:
+        chunks = []
+        while True:
+            length = int(request.rfile.readline().split(b';')[0], 16)
+            if length == 0:
+                request.rfile.readline()
+                return b''.join(chunks)
+            chunks.append(request.rfile.read(length))
+            request.rfile.readline()
+            self.__throttle(length)
+
+    def __write(self, request: BaseHTTPRequestHandler, status: int, headers: Dict[str, str],
+        body: bytes):
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        if 'Content-Length' not in headers:
+            request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        for offset in range(0, len(body), self.CHUNK_SIZE):
+            chunk = body[offset:offset + self.CHUNK_SIZE]
+            request.wfile.write(chunk)
+            self.__throttle(len(chunk))
+
+    def __throttle(self, size: int):
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+def json_response(status: int, data) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    Creates a JSON response for a fake server handler.
+    """
+    return status, {'Content-Type': 'application/json'}, json.dumps(data).encode()
+
+def get_blob_sha(content: bytes) -> str:
+    """
+    Gets the SHA of a file in Git.
+    """
+    return hashlib.sha1(f'blob {len(content)}\0'.encode() + content).hexdigest()
+
+class FakeGitHub(FakeServer):
+    """
+    Fake GitHub Enterprise server with "repos/{repo}/contents/{path}" and
+    "repos/{repo}/git/trees/{branch}" (always recursive) APIs, raw downloads, and a Git LFS
+    server with the batch API.
+    Files are kept in memory in "files": {(repo, branch): {path: content}}, and LFS objects in
+    "lfs_objects": {oid: content}.
+    Downloads support Range requests, and the next "cut_downloads" downloads break halfway.
+    With "gzip_downloads", downloads get gzip encoded for clients that accept it.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.files: Dict[Tuple[str, str], Dict[str, bytes]] = {}
+        self.lfs_objects: Dict[str, bytes] = {}
+        self.cut_downloads = 0
+        self.gzip_downloads = False
+        self.route('GET', r'/repos/([^/]+/[^/]+)/contents/(.*)', self.contents)
+        self.route('GET', r'/repos/([^/]+/[^/]+)/git/trees/([^/]+)', self.trees)
+        self.route('GET', r'/raw/([^/]+/[^/]+)/([^/]+)/(.*)', self.raw)
+        self.route('POST', r'/([^/]+/[^/]+)\.git/info/lfs/objects/batch', self.lfs_batch)
+        self.route('GET', r'/lfs/objects/([0-9a-f]{64})', self.lfs_download)
+
+    def add_file(self, repo: str, branch: str, path: str, content: bytes):
+        """
+        Adds a file to a branch of a repo.
+        """
+        with self.lock:
+            self.files.setdefault((repo, branch), {})[path] = content
+
+    def add_lfs_file(self, repo: str, branch: str, path: str, content: bytes):
+        """
+        Adds a file tracked by Git LFS to a branch of a repo: its pointer file goes to the repo,
+        and its content to the LFS server.
+        """
+        oid = hashlib.sha256(content).hexdigest()
+        self.add_file(repo, branch, path, 'version https://git-lfs.github.com/spec/v1\n'
+            f'oid sha256:{oid}\nsize {len(content)}\n'.encode())
+        with self.lock:
+            self.lfs_objects[oid] = content
+
+    def remove_file(self, repo: str, branch: str, path: str):
+        """
+        Removes a file from a branch of a repo.
+        """
+        with self.lock:
+            self.files.get((repo, branch), {}).pop(path, None)
+
+    def contents(self, _, match: re.Match, query: dict, __):
+        """
+        Gets the contents of a directory.
+        """
+        repo, path = match.group(1), match.group(2).strip('/')
+        branch = query.get('ref', ['master'])[0]
+        with self.lock:
+            files = dict(self.files.get((repo, branch), {}))
+
+        entries = {}
+        for file_path, content in files.items():
+            if not file_path.startswith(f'{path}/'):
+                continue
+            name = file_path[len(path) + 1:].split('/')[0]
+            is_dir = '/' in file_path[len(path) + 1:]
+            entry_path = f'{path}/{name}'
+            entries[name] = {
+                'name': name,
+                'path': entry_path,
+                'type': 'dir' if is_dir else 'file',
+                'size': 0 if is_dir else len(content),
+                'sha': None if is_dir else get_blob_sha(content),
+                'download_url': None if is_dir else f'{self.url}/raw/{repo}/{branch}/{entry_path}'}
+
+        if not entries:
+            return json_response(404, {'message': 'Not Found'})
+        return json_response(200, list(entries.values()))
+
+    def trees(self, _, match: re.Match, __, ___):
+        """
+        Gets the recursive tree of a branch.
+        """
+        repo, branch = match.group(1), match.group(2)
+        with self.lock:
+            files = self.files.get((repo, branch))
+        if files is None:
+            return json_response(404, {'message': 'Not Found'})
+
+        return json_response(200, {'sha': branch, 'truncated': False, 'tree': [
+            {'path': path, 'type': 'blob', 'size': len(content), 'sha': get_blob_sha(content)}
+            for path, content in sorted(files.items())]})
+
+    def raw(self, request, match: re.Match, __, ___):
+        """
+        Downloads a file.
+        """
+        repo, branch, path = match.group(1), match.group(2), match.group(3)
+        with self.lock:
+            content = self.files.get((repo, branch), {}).get(path)
+        if content is None:
+            return 404, {}, b''
+        return self.__download(request, content)
+
+    def lfs_batch(self, _, __, ___, body: bytes):
+        """
+        Gets the download actions of LFS objects.
+        """
+        objects = []
+        for obj in json.loads(body)['objects']:
+            with self.lock:
+                found = obj['oid'] in self.lfs_objects
+            objects.append({**obj, 'actions': {'download': {
+                'href': f'{self.url}/lfs/objects/{obj["oid"]}',
+                'header': {'Authorization': 'RemoteAuth lfs-token'}}}} if found else
+                {**obj, 'error': {'code': 404, 'message': 'Object does not exist'}})
+        return 200, {'Content-Type': 'application/vnd.git-lfs+json'}, \
+            json.dumps({'transfer': 'basic', 'objects': objects}).encode()
+
+    def lfs_download(self, request, match: re.Match, __, ___):
+        """
+        Downloads an LFS object.
+        """
+        if request.headers.get('Authorization') != 'RemoteAuth lfs-token':
+            return 401, {}, b''
+        with self.lock:
+            content = self.lfs_objects.get(match.group(1))
+        if content is None:
+            return 404, {}, b''
+        return self.__download(request, content)
+
+    def __download(self, request, content: bytes):
+        status, headers = 200, {'Content-Type': 'application/octet-stream'}
+        match = re.match(r'bytes=(\d+)-$', request.headers.get('Range') or '')
+        if match:
+            start = int(match.group(1))
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{len(content) - 1}/{len(content)}'
+            content = content[start:]
+        if self.gzip_downloads and 'gzip' in (request.headers.get('Accept-Encoding') or ''):
+            headers['Content-Encoding'] = 'gzip'
+            content = gzip.compress(content)
+
+        with self.lock:
+            cut = self.cut_downloads > 0 and len(content) > 1
+            if cut:
+                self.cut_downloads -= 1
+        if cut:
+            # Announces the whole body but closes the connection halfway
+            request.close_connection = True
+            headers['Content-Length'] = str(len(content))
+            content = content[:len(content) // 2]
+        return status, headers, content
+
+class FakeDBFS(FakeServer):
+    """
+    Fake DBFS server with create/add-block/close/put/delete/list/mkdirs/get-status APIs, and
+    upload/delete of files and list/delete of directories of the Files API.
+    Files are kept in memory in "files": {path: content}, and the next "cut_uploads" files
+    closed (with DBFS API) lose their second half, as if some blocks got lost.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.files: Dict[str, bytes] = {}
+        self.cut_uploads = 0
+        self.__handles: Dict[int, Tuple[str, bytearray]] = {}
+        self.__next_handle = 1
+        for api in ['create', 'add-block', 'close', 'put', 'delete', 'mkdirs']:
+            self.route('POST', f'/api/2.0/dbfs/{api}', getattr(self, api.replace('-', '_')))
+        for api in ['list', 'get-status']:
+            self.route('GET', f'/api/2.0/dbfs/{api}', getattr(self, api.replace('-', '_')))
+        self.route('PUT', '/api/2.0/fs/files(/.*)', self.upload)
+        self.route('DELETE', '/api/2.0/fs/files(/.*)', self.delete_file)
+        self.route('GET', '/api/2.0/fs/directories(/.*)', self.list_directory)
+        self.route('DELETE', '/api/2.0/fs/directories(/.*)', self.delete_directory)
+
+    def create(self, _, __, ___, body: bytes):
+        """
+        Opens a stream to write to a file.
+        """
+        data = json.loads(body)
+        with self.lock:
+            handle = self.__next_handle
+            self.__next_handle += 1
+            self.__handles[handle] = (data['path'], bytearray())
+        return json_response(200, {'handle': handle})
+
+    def add_block(self, _, __, ___, body: bytes):
+        """
+        Appends a block of data to a stream.
+        """
+        data = json.loads(body)
+        block = base64.b64decode(data['data'])
+        if len(data['data']) > 1024 * 1024:
+            return json_response(400, {'error_code': 'MAX_BLOCK_SIZE_EXCEEDED'})
+        with self.lock:
+            if data['handle'] not in self.__handles:
+                return json_response(404, {'error_code': 'RESOURCE_DOES_NOT_EXIST'})
+            self.__handles[data['handle']][1].extend(block)
+        return json_response(200, {})
+
+    def close(self, _, __, ___, body: bytes):
+        """
+        Closes a stream, publishing its file.
+        """
+        data = json.loads(body)
+        with self.lock:
+            if data['handle'] not in self.__handles:
+                return json_response(404, {'error_code': 'RESOURCE_DOES_NOT_EXIST'})
+            path, content = self.__handles.pop(data['handle'])
+            if self.cut_uploads > 0 and len(content) > 1:
+                self.cut_uploads -= 1
+                content = content[:len(content) // 2]
+            self.files[path] = bytes(content)
+        return json_response(200, {})
+
+    def put(self, _, __, ___, body: bytes):
+        """
+        Uploads a file in a single request.
+        """
+        data = json.loads(body)
+        with self.lock:
+            self.files[data['path']] = base64.b64decode(data.get('contents', ''))
+        return json_response(200, {})
+
+    def delete(self, _, __, ___, body: bytes):
+        """
+        Deletes a file or directory.
+        """
+        data = json.loads(body)
+        path = data['path'].rstrip('/')
+        with self.lock:
+            for file_path in list(self.files):
+                if file_path == path or (data.get('recursive') and
+                    file_path.startswith(f'{path}/')):
+                    del self.files[file_path]
+        return json_response(200, {})
+
+    def mkdirs(self, _, __, ___, ____):
+        """
+        Creates a directory (directories are implicit in this fake).
+        """
+        return json_response(200, {})
+
+    def list(self, _, __, query: dict, ___):
+        """
+        Lists the contents of a directory.
+        """
+        path = query['path'][0].rstrip('/')
+        with self.lock:
+            files = dict(self.files)
+
+        entries = {}
+        for file_path, content in files.items():
+            if not file_path.startswith(f'{path}/'):
+                continue
+            name = file_path[len(path) + 1:].split('/')[0]
+            is_dir = '/' in file_path[len(path) + 1:]
+            entries[name] = {'path': f'{path}/{name}', 'is_dir': is_dir,
+                'file_size': 0 if is_dir else len(content)}
+
+        if not entries and path not in files:
+            return json_response(404, {'error_code': 'RESOURCE_DOES_NOT_EXIST'})
+        return json_response(200, {'files': list(entries.values())})
+
+    def get_status(self, _, __, query: dict, ___):
+        """
+        Gets the status of a file.
+        """
+        path = query['path'][0]
+        with self.lock:
+            content = self.files.get(path)
+        if content is None:
+            return json_response(404, {'error_code': 'RESOURCE_DOES_NOT_EXIST'})
+        return json_response(200, {'path': path, 'is_dir': False, 'file_size': len(content)})
+
+    def upload(self, _, match: re.Match, query: dict, body: bytes):
+        """
+        Uploads a file with its raw contents (Files API).
+        """
+        path = unquote(match.group(1))
+        with self.lock:
+            if path in self.files and query.get('overwrite', ['false'])[0] != 'true':
+                return json_response(409, {'error_code': 'ALREADY_EXISTS'})
+            self.files[path] = body
+        return 204, {}, b''
+
+    def delete_file(self, _, match: re.Match, __, ___):
+        """
+        Deletes a file (Files API).
+        """
+        path = unquote(match.group(1))
+        with self.lock:
+            if self.files.pop(path, None) is None:
+                return json_response(404, {'error_code': 'NOT_FOUND'})
+        return 204, {}, b''
+
+    def list_directory(self, request, match: re.Match, _, body: bytes):
+        """
+        Lists the contents of a directory (Files API).
+        """
+        status, headers, content = self.list(request, None, {'path': [unquote(match.group(1))]},
+            body)
+        if status != 200:
+            return json_response(404, {'error_code': 'NOT_FOUND'})
+        return status, headers, json.dumps({'contents': [
+            {'path': x['path'], 'is_directory': x['is_dir'], 'file_size': x['file_size'],
+                'name': x['path'].split('/')[-1]}
+            for x in json.loads(content)['files']]}).encode()
+
+    def delete_directory(self, _, match: re.Match, __, ___):
+        """
+        Deletes an empty directory (Files API; directories are implicit in this fake).
+        """
+        path = unquote(match.group(1)).rstrip('/')
+        with self.lock:
+            if any(file_path.startswith(f'{path}/') for file_path in self.files):
+                return json_response(409, {'error_code': 'DIRECTORY_NOT_EMPTY'})
+        return 204, {}, b''
+
+class FakeServersTestCase(unittest.TestCase):
+    """
+    Base class of the tests against fake GitHub and DBFS servers, started for every test, with a
+    routing table of a single mapping from REPO/BRANCH/BASE_PATH to DBFS_BASE_PATH.
+    """
+
+    def setUp(self):
+        self.git_server = FakeGitHub().start()
+        self.dbfs_server = FakeDBFS().start()
+        self.mapping = Mapping({
+            'GitApi': self.git_server.url, 'GitToken': 'token', 'GitRepo': REPO,
+            'GitBranch': BRANCH, 'GitBasePath': BASE_PATH,
+            'DatabricksHost': self.dbfs_server.url, 'DatabricksToken': 'token',
+            'DatabricksDbfsBasePath': DBFS_BASE_PATH})
+        self.routing_table = RoutingTable([self.mapping])
+
+    def tearDown(self):
+        self.git_server.stop()
+        self.dbfs_server.stop()
@@ -0,0 +1,112 @@
+"""
+Tests for breaker.py.
+"""
+
+from threading import Event, Thread
+import unittest
+from unittest.mock import patch
+
+from ...services import CircuitBreaker, CircuitOpenException, get_breaker
+
+class TestCircuitBreaker(unittest.TestCase):
+    """
+    Tests for CircuitBreaker class.
+    """
+
+    def test_opens_after_failures(self):
+        """
+        Tests that the circuit opens after failure_threshold consecutive failures, and that
+        successes reset the count.
+        """
+        # Arrange
+        breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=30)
+
+        # Act
+        breaker.record(False)
+        breaker.record(False)
+        breaker.record(True)
+        breaker.record(False)
+        breaker.record(False)
+        closed = breaker.is_open
+        breaker.record(False)
+
+        # Assert
+        self.assertFalse(closed)
+        self.assertTrue(breaker.is_open)
+        self.assertGreater(breaker.retry_in(), 29)
+        with self.assertRaisesRegex(CircuitOpenException, 'test'):
+            breaker.check()
+
+    @patch('time.monotonic')
+    def test_half_open(self, mock_monotonic):
+        """
+        Tests that a single trial request gets through once the circuit has been open for
+        reset_timeout seconds, and that the circuit closes if it succeeds or opens again if it
+        fails.
+        """
+        # Arrange
+        mock_monotonic.return_value = 100
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+        breaker.record(False)
+        mock_monotonic.return_value = 130
+
+        # Act & Assert
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.check())
+        with self.assertRaises(CircuitOpenException):
+            breaker.check()
+        breaker.record(False, trial=True)
+        self.assertTrue(breaker.is_open)
+
+        mock_monotonic.return_value = 160
+        self.assertTrue(breaker.check())
+        breaker.record(True, trial=True)
+        self.assertFalse(breaker.is_open)
+        self.assertFalse(breaker.check())
+        self.assertFalse(breaker.check())
+
+    @patch('time.monotonic')
+    def test_half_open_with_requests_in_flight(self, mock_monotonic):
+        """
+        Tests that requests in flight while the circuit opens don't end its trial when they
+        finish, so no other trial gets through while the trial is in flight.
+        """
+        # Arrange
+        mock_monotonic.return_value = 100
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+        started, finish = Event(), Event()
+        trials = []
+
+        def send():
+            trials.append(breaker.check())
+            started.set()
+            finish.wait()
+            breaker.record(False, trials[0])
+
+        in_flight = Thread(target=send)
+        in_flight.start()
+        started.wait()
+        breaker.record(False)
+        mock_monotonic.return_value = 130
+
+        # Act
+        trial = breaker.check()
+        finish.set()
+        in_flight.join()
+        mock_monotonic.return_value = 160
+
+        # Assert
+        self.assertListEqual([False], trials)
+        self.assertTrue(trial)
+        with self.assertRaises(CircuitOpenException):
+            breaker.check()
+        breaker.record(True, trial)
+        self.assertFalse(breaker.is_open)
+
+    def test_get_breaker(self):
+        """
+        Tests that circuit breakers are shared per endpoint.
+        """
+        # Act & Assert
+        self.assertIs(get_breaker('https://a'), get_breaker('https://a'))
+        self.assertIsNot(get_breaker('https://a'), get_breaker('https://b'))
@@ -0,0 +1,82 @@
+"""
+Tests for cache.py.
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+
+from ...services import DBFS, VersionCache, get_dbfs_key, get_git_key
+
+class TestVersionCache(unittest.TestCase):
+    """
+    Tests for VersionCache class.
+    """
+
+    @patch('time.monotonic')
+    def test_missing_folders_expire(self, mock_monotonic):
+        """
+        Tests that folders are known to be missing for ttl seconds.
+        """
+        # Arrange
+        mock_monotonic.return_value = 100
+        cache = VersionCache(ttl=60)
+        key = get_git_key('https://api.github.com', 'magencio/git_to_dbfs_function', 'master',
+            'samplefiles/v0.0.1', 'sha1')
+
+        # Act
+        cache.set_missing(key)
+        missing = cache.is_missing(key)
+        mock_monotonic.return_value = 159
+        still_missing = cache.is_missing(key)
+        mock_monotonic.return_value = 160
+        expired = cache.is_missing(key)
+
+        # Assert
+        self.assertTrue(missing)
+        self.assertTrue(still_missing)
+        self.assertFalse(expired)
+
+    def test_discard(self):
+        """
+        Tests that discarded folders are no longer known to be missing, and that folders of
+        different DBFS targets and heads are cached separately.
+        """
+        # Arrange
+        cache = VersionCache()
+        target_1 = Mock(spec=DBFS)
+        target_2 = Mock(spec=DBFS)
+        path = '/mnt/playground/magencio/data/samplefiles/v0.0.1'
+        cache.set_missing(get_dbfs_key(target_1, path, 'sha1'))
+        cache.set_missing(get_dbfs_key(target_2, path, 'sha1'))
+
+        # Act
+        cache.discard(get_dbfs_key(target_1, path, 'sha1'))
+        cache.discard(get_dbfs_key(target_1, '/mnt/other', 'sha1'))
+
+        # Assert
+        self.assertFalse(cache.is_missing(get_dbfs_key(target_1, path, 'sha1')))
+        self.assertTrue(cache.is_missing(get_dbfs_key(target_2, path, 'sha1')))
+        self.assertFalse(cache.is_missing(get_dbfs_key(target_2, path, 'sha2')))
+
+    def test_dbfs_folders(self):
+        """
+        Tests recording, filtering and forgetting a folder missing from many DBFS targets.
+        """
+        # Arrange
+        cache = VersionCache()
+        target_1 = Mock(spec=DBFS)
+        target_2 = Mock(spec=DBFS)
+        path = '/mnt/playground/magencio/data/samplefiles/v0.0.1'
+
+        # Act
+        cache.set_dbfs_folder_missing([target_1, target_2], path, 'sha1')
+        missing_targets = cache.get_dbfs_targets([target_1, target_2], path, 'sha1')
+        cache.discard_dbfs_folder([target_2], path, 'sha1')
+        discarded_targets = cache.get_dbfs_targets([target_1, target_2], path, 'sha1')
+        other_head_targets = cache.get_dbfs_targets([target_1, target_2], path, 'sha2')
+
+        # Assert
+        self.assertListEqual([], missing_targets)
+        self.assertListEqual([target_2], discarded_targets)
+        self.assertListEqual([target_1, target_2], other_head_targets)
+        self.assertTrue(cache.is_missing(get_dbfs_key(target_1, path, 'sha1')))
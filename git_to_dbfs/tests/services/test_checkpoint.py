@@ -0,0 +1,76 @@
+"""
+Tests for checkpoint.py.
+"""
+
+import unittest
+
+from ...services import Checkpoint, Deadline
+
+class TestDeadline(unittest.TestCase):
+    """
+    Tests for Deadline class.
+    """
+
+    def test_reached(self):
+        """
+        Tests whether deadlines have been reached.
+        """
+        # Act & Assert
+        self.assertFalse(Deadline().reached())
+        self.assertFalse(Deadline(60).reached())
+        self.assertTrue(Deadline(0).reached())
+        self.assertLessEqual(Deadline(60).remaining(), 60)
+
+    def test_within(self):
+        """
+        Tests getting the earliest of two deadlines.
+        """
+        # Arrange
+        deadline = Deadline(60)
+
+        # Act & Assert
+        self.assertIs(deadline, deadline.within(None))
+        self.assertIs(deadline, deadline.within(120))
+        self.assertTrue(deadline.within(0).reached())
+        self.assertLessEqual(Deadline().within(30).remaining(), 30)
+
+class TestCheckpoint(unittest.TestCase):
+    """
+    Tests for Checkpoint class.
+    """
+
+    def test_to_dict(self):
+        """
+        Tests serializing and deserializing a checkpoint.
+        """
+        # Arrange
+        checkpoint = Checkpoint(True, ['file2.csv', 'file1.csv'])
+
+        # Act
+        result = Checkpoint.from_dict(checkpoint.to_dict())
+
+        # Assert
+        self.assertDictEqual(
+            {'deleted': True, 'completed': ['file1.csv', 'file2.csv'], 'finished': False},
+            result.to_dict())
+
+    def test_plan(self):
+        """
+        Tests that planning keeps the progress of a copy, unless completed files are no longer
+        planned.
+        """
+        # Arrange
+        checkpoint = Checkpoint(True, ['file1.csv'])
+        rolled_back_checkpoint = Checkpoint(True, ['file1.csv', 'file2.csv'])
+
+        # Act
+        checkpoint.plan({'file1.csv': None, 'file2.csv': None})
+        rolled_back_checkpoint.plan({'file1.csv': None})
+
+        # Assert
+        self.assertDictEqual(
+            {'deleted': True, 'completed': ['file1.csv'], 'finished': False},
+            checkpoint.to_dict())
+        self.assertDictEqual(
+            {'deleted': False, 'completed': [], 'finished': False},
+            rolled_back_checkpoint.to_dict())
@@ -2,17 +2,18 @@
 Tests for dbfs.py
 """
 
+import json
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
-from ...services import DBFS, DBFSException
+from ...services import DBFS, DBFSException, DEFAULT_TIMEOUT, RateLimiter
 
 class TestDBFS(unittest.TestCase):
     """
     Tests for DBFS class.
     """
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_list(self, mock_get):
         """
         Tests listing the contents of a directory or details of a file.
@@ -47,9 +48,10 @@ class TestDBFS(unittest.TestCase):
         self.assertDictEqual(mock_get.return_value.json.return_value, result)
 
         mock_get.assert_called_once_with(f'{host}/api/2.0/dbfs/list',
-            headers={'Authorization': f'Bearer {token}'}, params={'path': path})
+            headers={'Authorization': f'Bearer {token}'}, params={'path': path},
+            timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_list_with_dbfs_error(self, mock_get):
         """
         Tests trying to list the contents of a directory or details of a file but getting a DBFS
@@ -70,9 +72,10 @@ class TestDBFS(unittest.TestCase):
             dbfs.list(path)
 
         mock_get.assert_called_once_with(f'{host}/api/2.0/dbfs/list',
-            headers={'Authorization': f'Bearer {token}'}, params={'path': path})
+            headers={'Authorization': f'Bearer {token}'}, params={'path': path},
+            timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_mkdirs(self, mock_post):
         """
         Tests the creation of a directory.
@@ -91,9 +94,10 @@ class TestDBFS(unittest.TestCase):
 
         # Assert
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/mkdirs',
-            headers={'Authorization': f'Bearer {token}'}, json={'path': path})
+            headers={'Authorization': f'Bearer {token}'}, json={'path': path},
+            timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_mkdirs_with_dbfs_error(self, mock_post):
         """
         Tests trying the creation of a directory but getting a DBFS error back.
@@ -113,9 +117,10 @@ class TestDBFS(unittest.TestCase):
             dbfs.mkdirs(path)
 
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/mkdirs',
-            headers={'Authorization': f'Bearer {token}'}, json={'path': path})
+            headers={'Authorization': f'Bearer {token}'}, json={'path': path},
+            timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_create(self, mock_post):
         """
         Tests the creation of a file stream.
@@ -140,9 +145,9 @@ class TestDBFS(unittest.TestCase):
 
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/create',
             headers={'Authorization': f'Bearer {token}'},
-            json={'path': path, 'overwrite': overwrite})
+            json={'path': path, 'overwrite': overwrite}, timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_create_with_dbfs_error(self, mock_post):
         """
         Tests trying the creation of a file stream but getting a DBFS error back.
@@ -164,9 +169,9 @@ class TestDBFS(unittest.TestCase):
 
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/create',
             headers={'Authorization': f'Bearer {token}'},
-            json={'path': path, 'overwrite': overwrite})
+            json={'path': path, 'overwrite': overwrite}, timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_add_block(self, mock_post):
         """
         Tests the appending of a block of data to a stream.
@@ -180,17 +185,37 @@ class TestDBFS(unittest.TestCase):
 
         handle = 1234234
         data = 'somedata'.encode()
-        base64_data = 'c29tZWRhdGE='
+        body = b'{"handle": 1234234, "data": "c29tZWRhdGE="}'
 
         # Act
         dbfs.add_block(handle, data)
 
         # Assert
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/add-block',
-            headers={'Authorization': f'Bearer {token}'},
-            json={'handle': handle, 'data': base64_data})
+            headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+            data=body, timeout=DEFAULT_TIMEOUT)
+        self.assertDictEqual({'handle': handle, 'data': 'c29tZWRhdGE='}, json.loads(body))
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
+    def test_add_block_with_rate_limiter(self, mock_post):
+        """
+        Tests that appending a block of data waits for a token of the add-block budget.
+        """
+        # Arrange
+        mock_post.return_value.status_code = 200
+        mock_rate_limiter = Mock(spec=RateLimiter)
+
+        host = 'https://somehost.azuredatabricks.net'
+        dbfs = DBFS(host, 'token', rate_limiter=mock_rate_limiter)
+
+        # Act
+        dbfs.add_block(1234234, 'somedata'.encode())
+
+        # Assert
+        mock_rate_limiter.acquire.assert_called_once_with('add-block')
+        mock_post.assert_called_once()
+
+    @patch('requests.Session.post')
     def test_add_block_with_dbfs_error(self, mock_post):
         """
         Tests trying to append a block of data to a stream but but getting a DBFS error back.
@@ -205,17 +230,18 @@ class TestDBFS(unittest.TestCase):
 
         handle = 1234234
         data = 'somedata'.encode()
-        base64_data = 'c29tZWRhdGE='
+        body = b'{"handle": 1234234, "data": "c29tZWRhdGE="}'
 
         # Act & Assert
         with self.assertRaisesRegex(DBFSException, '401'):
             dbfs.add_block(handle, data)
 
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/add-block',
-            headers={'Authorization': f'Bearer {token}'},
-            json={'handle': handle, 'data': base64_data})
+            headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+            data=body, timeout=DEFAULT_TIMEOUT)
+        self.assertDictEqual({'handle': handle, 'data': 'c29tZWRhdGE='}, json.loads(body))
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_close(self, mock_post):
         """
         Tests the closing of a file stream.
@@ -234,9 +260,10 @@ class TestDBFS(unittest.TestCase):
 
         # Assert
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/close',
-            headers={'Authorization': f'Bearer {token}'}, json={'handle': handle})
+            headers={'Authorization': f'Bearer {token}'}, json={'handle': handle},
+            timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_close_with_dbfs_error(self, mock_post):
         """
         Tests trying to close a file stream but getting a DBFS error back.
@@ -256,9 +283,10 @@ class TestDBFS(unittest.TestCase):
             dbfs.close(handle)
 
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/close',
-            headers={'Authorization': f'Bearer {token}'}, json={'handle': handle})
+            headers={'Authorization': f'Bearer {token}'}, json={'handle': handle},
+            timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_delete(self, mock_post):
         """
         Tests the deletion of a file or folder.
@@ -279,9 +307,9 @@ class TestDBFS(unittest.TestCase):
         # Assert
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/delete',
             headers={'Authorization': f'Bearer {token}'},
-            json={'path': path, 'recursive': recursive})
+            json={'path': path, 'recursive': recursive}, timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_delete_with_dbfs_error(self, mock_post):
         """
         Tests trying to delete a file or folder but getting a DBFS error back.
@@ -303,4 +331,4 @@ class TestDBFS(unittest.TestCase):
 
         mock_post.assert_called_once_with(f'{host}/api/2.0/dbfs/delete',
             headers={'Authorization': f'Bearer {token}'},
-            json={'path': path, 'recursive': recursive})
+            json={'path': path, 'recursive': recursive}, timeout=DEFAULT_TIMEOUT)
@@ -0,0 +1,94 @@
+"""
+Tests for files.py.
+"""
+
+import unittest
+
+from ...services import AdaptiveLimiter, DBFSException, FilesSink
+from ..fakes import FakeDBFS
+
+class TestFilesSink(unittest.TestCase):
+    """
+    Tests for FilesSink class, against a fake Files API.
+    """
+
+    def setUp(self):
+        self.server = FakeDBFS().start()
+        self.sink = FilesSink(self.server.url, 'token',
+            limiter=AdaptiveLimiter('files', retry_delay=0.001))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_upload(self):
+        """
+        Tests streaming the raw blocks of a file in a single request.
+        """
+        # Arrange
+        path = '/Volumes/main/default/data/v0.0.1/a=1/file1.csv'
+        block = bytearray(b'a,b\n')
+
+        # Act
+        handle = self.sink.create(path, True)
+        self.sink.add_block(handle, block)
+        block[:] = b'1,2\n'
+        self.sink.add_block(handle, block)
+        self.sink.close(handle)
+
+        # Assert
+        self.assertDictEqual({path: b'a,b\n1,2\n'}, self.server.files)
+        self.assertEqual(1, self.server.requests['upload'])
+
+    def test_abort(self):
+        """
+        Tests that aborted uploads don't publish their file.
+        """
+        # Arrange
+        path = '/Volumes/main/default/data/v0.0.1/file1.csv'
+
+        # Act
+        handle = self.sink.create(path, True)
+        self.sink.add_block(handle, b'a,b\n')
+        self.sink.abort(handle)
+
+        # Assert
+        self.assertDictEqual({}, self.server.files)
+
+    def test_upload_error(self):
+        """
+        Tests that failed uploads raise the status code of their response.
+        """
+        # Arrange
+        self.server.fail_next(1, 500)
+
+        # Act
+        handle = self.sink.create('/Volumes/main/default/data/file1.csv', True)
+        self.sink.add_block(handle, b'a,b\n')
+
+        # Assert
+        with self.assertRaisesRegex(DBFSException, '500'):
+            self.sink.close(handle)
+
+    def test_list_and_delete(self):
+        """
+        Tests listing a directory and deleting it recursively.
+        """
+        # Arrange
+        self.server.files.update({
+            '/Volumes/data/v0.0.1/file1.csv': b'a',
+            '/Volumes/data/v0.0.1/a=1/file2.csv': b'bc',
+            '/Volumes/data/v0.0.2/file1.csv': b'd'})
+
+        # Act
+        result = self.sink.list('/Volumes/data/v0.0.1')
+        self.sink.delete('/Volumes/data/v0.0.1', True)
+        self.sink.delete('/Volumes/data/v0.0.3', True)
+
+        # Assert
+        self.assertCountEqual([
+            {'path': '/Volumes/data/v0.0.1/file1.csv', 'is_dir': False, 'file_size': 1},
+            {'path': '/Volumes/data/v0.0.1/a=1', 'is_dir': True, 'file_size': 0}],
+            result['files'])
+        self.assertDictEqual({'/Volumes/data/v0.0.2/file1.csv': b'd'}, self.server.files)
+        with self.assertRaisesRegex(DBFSException, '404'):
+            self.sink.list('/Volumes/data/v0.0.1')
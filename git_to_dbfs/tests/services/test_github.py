@@ -2,8 +2,9 @@
 Tests for github.py.
 """
 
+import io
 import unittest
-from unittest.mock import Mock, patch, call
+from unittest.mock import MagicMock, Mock, patch, call
 
 from hashlib import sha1
 from hmac import HMAC
@@ -11,9 +12,13 @@ from logging import Logger
 from typing import Callable
 
 import azure.functions as func
+import requests
 
 from ...services import validate_payload, GitPath, GitPushNotification, GitHub, GitHubException
-from ...services import DBFS, DBFSException
+from ...services import DBFS, DBFSException, DEFAULT_TIMEOUT, VersionCache
+from ...services.github import GitFile, get_folder_files, set_lfs_downloads
+from ...services.lfs import LFSPointer
+from ..fakes import FakeGitHub
 
 class TestGitHubHelpers(unittest.TestCase):
     """
@@ -111,6 +116,54 @@ class TestGitHubHelpers(unittest.TestCase):
         # Assert
         self.assertFalse(result)
 
+    def test_get_folder_files(self):
+        """
+        Test getting the files and subfolders in the contents of folders of a recursive copy.
+        """
+        # Arrange
+        git_path = GitPath('magencio/git_to_dbfs_function', 'samplefiles/v0.0.1', 'master',
+            recursive=True)
+        base_url = ('https://raw.githubusercontent.com/magencio/git_to_dbfs_function/master/'
+            'samplefiles/v0.0.1')
+        folders = [
+            ('', [{'type': 'file', 'download_url': f'{base_url}/file1.csv', 'size': 8},
+                {'type': 'dir', 'path': 'samplefiles/v0.0.1/images'}]),
+            ('data/', [{'type': 'file', 'download_url': f'{base_url}/data/file2.csv?token=abc',
+                'sha': 'abc'}])]
+
+        # Act
+        files, subfolders = get_folder_files(git_path, folders)
+
+        # Assert
+        self.assertListEqual(['file1.csv', 'data/file2.csv'], [file.name for file in files])
+        self.assertListEqual([8, None], [file.size for file in files])
+        self.assertEqual('abc', files[1].sha)
+        self.assertListEqual([('images/', 'samplefiles/v0.0.1/images')],
+            [(prefix, path.path) for prefix, path in subfolders])
+
+    def test_set_lfs_downloads(self):
+        """
+        Test making LFS files get downloaded from the LFS server, failing on missing objects.
+        """
+        # Arrange
+        file = GitFile('model.bin', 'https://raw.githubusercontent.com/model.bin', 120,
+            content=b'pointer')
+        missing_file = GitFile('other.bin', 'https://raw.githubusercontent.com/other.bin', 120)
+        actions = {'a' * 64: ('https://lfs.github.com/objects/a', {'Authorization': 'x'})}
+        logger = Mock(spec=Logger)
+
+        # Act
+        set_lfs_downloads({file: LFSPointer('a' * 64, 1024)}, actions, logger)
+        with self.assertRaisesRegex(GitHubException, '404'):
+            set_lfs_downloads({missing_file: LFSPointer('b' * 64, 1024)}, actions, logger)
+
+        # Assert
+        self.assertEqual('https://lfs.github.com/objects/a', file.download_url)
+        self.assertDictEqual({'Authorization': 'x'}, file.headers)
+        self.assertEqual(1024, file.size)
+        self.assertIsNone(file.content)
+        logger.error.assert_called_once()
+
 class TestGitPath(unittest.TestCase):
     """
     Tests for GitPath class.
@@ -253,12 +306,103 @@ class TestGitPushNotification(unittest.TestCase):
                 # Assert
                 self.assertCountEqual([], result)
 
+    def test_is_truncated(self):
+        """
+        Tests detecting notifications whose commits may not include all changed files.
+        """
+        # Arrange
+        notification = {
+            'ref': 'refs/heads/master',
+            'repository': { 'full_name': 'magencio/git_to_dbfs_function' },
+            'before': 'a' * 40,
+            'after': 'b' * 40,
+            'commits': [{'added': [], 'removed': [], 'modified': ['README.md']}]
+        }
+        commit = notification['commits'][0]
+        cases = [
+            ({}, False),
+            ({'size': 1}, False),
+            ({'size': 25}, True),
+            ({'distinct_size': 25}, True),
+            ({'commits': [commit] * 20}, True),
+            ({'commits': [commit] * 20, 'after': '0' * 40}, False),
+            ({'commits': [commit, {'added': [], 'removed': [], 'modified': []}]}, True)]
+
+        for changes, expected_result in cases:
+            with self.subTest(f'Changes = {changes}'):
+                # Act
+                result = GitPushNotification(dict(notification, **changes)).is_truncated
+
+                # Assert
+                self.assertEqual(expected_result, result)
+
+    def test_is_truncated_with_webhook_payload(self):
+        """
+        Tests detecting truncated notifications in the payloads of GitHub webhooks, which have no
+        "size", and list no files for commits too large to list them in time.
+        """
+        # Arrange
+        user = {'name': 'Dev', 'email': 'dev@example.com', 'username': 'dev'}
+        def get_commit(sha: str, added: list) -> dict:
+            return {
+                'id': sha, 'tree_id': 'f' * 40, 'distinct': True, 'message': 'Add files',
+                'timestamp': '2026-10-18T10:00:00+02:00',
+                'url': f'https://github.com/magencio/git_to_dbfs_function/commit/{sha}',
+                'author': user, 'committer': user,
+                'added': added, 'removed': [], 'modified': []}
+
+        payload = {
+            'ref': 'refs/heads/master',
+            'before': 'a' * 40,
+            'after': 'c' * 40,
+            'repository': {'id': 1, 'name': 'git_to_dbfs_function',
+                'full_name': 'magencio/git_to_dbfs_function', 'private': True,
+                'default_branch': 'master'},
+            'pusher': {'name': 'dev', 'email': 'dev@example.com'},
+            'sender': {'login': 'dev', 'id': 2, 'type': 'User'},
+            'created': False, 'deleted': False, 'forced': False, 'base_ref': None,
+            'compare': 'https://github.com/magencio/git_to_dbfs_function/compare/aaa...ccc'}
+        commits = [get_commit('b' * 40, ['samplefiles/v0.0.1/file1.csv']),
+            get_commit('c' * 40, ['samplefiles/v0.0.2/file1.csv'])]
+        large_commits = [commits[0], get_commit('c' * 40, [])]
+
+        # Act
+        result = GitPushNotification(
+            dict(payload, commits=commits, head_commit=commits[-1])).is_truncated
+        large_result = GitPushNotification(
+            dict(payload, commits=large_commits, head_commit=large_commits[-1])).is_truncated
+
+        # Assert
+        self.assertFalse(result)
+        self.assertTrue(large_result)
+
+    def test_get_modified_files_from_changed_files(self):
+        """
+        Tests the extraction of all modified files under a certain path from the changed files
+        taken from GitHub instead of the commits.
+        """
+        # Arrange
+        git_notification = GitPushNotification({
+            'ref': 'refs/heads/master',
+            'repository': { 'full_name': 'magencio/git_to_dbfs_function' },
+            'commits': [{ 'added': ['samplefiles/v0.0.1/added.csv'], 'removed': [],
+                'modified': [] }]
+        })
+        git_notification.changed_files = ['samplefiles/v0.0.2/file1.csv', 'other/file1.csv']
+        git_path = GitPath('magencio/git_to_dbfs_function', 'samplefiles', 'master')
+
+        # Act
+        result = git_notification.get_modified_files(git_path)
+
+        # Assert
+        self.assertCountEqual(['samplefiles/v0.0.2/file1.csv'], result)
+
 class TestGitHub(unittest.TestCase):
     """
     Tests for TestGitHub class.
     """
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_repos_content(self, mock_get):
         """
         Tests getting the contents of a file or directory in a repository.
@@ -289,9 +433,10 @@ class TestGitHub(unittest.TestCase):
         self.assertCountEqual(mock_get.return_value.json.return_value, result)
 
         mock_get.assert_called_once_with(f'{api_url}/repos/{repo}/contents/{path}',
-            headers={'Authorization': f'Bearer {token}'}, params={'ref': branch})
+            headers={'Authorization': f'Bearer {token}'}, params={'ref': branch},
+            timeout=DEFAULT_TIMEOUT)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_repos_content_with_github_error(self, mock_get):
         """
         Tests trying to get the contents of a file or directory in a repository but getting a
@@ -316,9 +461,70 @@ class TestGitHub(unittest.TestCase):
             git.repos_content(git_path)
 
         mock_get.assert_called_once_with(f'{api_url}/repos/{repo}/contents/{path}',
-            headers={'Authorization': f'Bearer {token}'}, params={'ref': branch})
+            headers={'Authorization': f'Bearer {token}'}, params={'ref': branch},
+            timeout=DEFAULT_TIMEOUT)
+
+    @patch('requests.Session.get')
+    def test_get_changed_files(self, mock_get):
+        """
+        Tests getting all changed files between two commits with the Compare API.
+        """
+        # Arrange
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'files': [
+            {'filename': 'samplefiles/v0.0.1/file1.csv', 'status': 'modified'},
+            {'filename': 'samplefiles/v0.0.3/file1.csv', 'status': 'renamed',
+                'previous_filename': 'samplefiles/v0.0.2/file1.csv'}]}
+
+        repo = 'magencio/git_to_dbfs_function'
+        api_url = 'https://api.github.com'
+        git = GitHub(api_url, 'token', Mock(spec=Logger))
+
+        # Act
+        result = git.get_changed_files(repo, 'a' * 40, 'b' * 40)
 
-    @patch('requests.get')
+        # Assert
+        self.assertListEqual(['samplefiles/v0.0.1/file1.csv', 'samplefiles/v0.0.2/file1.csv',
+            'samplefiles/v0.0.3/file1.csv'], result)
+        mock_get.assert_called_once_with(f'{api_url}/repos/{repo}/compare/{"a" * 40}...{"b" * 40}',
+            headers={'Authorization': 'Bearer token'}, params={}, timeout=DEFAULT_TIMEOUT)
+
+    @patch('requests.Session.get')
+    def test_get_changed_files_from_trees(self, mock_get):
+        """
+        Tests getting all changed files between two commits from their trees, when there are too
+        many changed files for the Compare API.
+        """
+        # Arrange
+        comparison = {'files': [{'filename': f'file{x}.csv'} for x in range(300)]}
+        before_tree = {'tree': [
+            {'path': 'samplefiles', 'type': 'tree', 'sha': '1'},
+            {'path': 'samplefiles/v0.0.1/file1.csv', 'type': 'blob', 'sha': '2'},
+            {'path': 'samplefiles/v0.0.2/file1.csv', 'type': 'blob', 'sha': '3'},
+            {'path': 'samplefiles/v0.0.3/file1.csv', 'type': 'blob', 'sha': '4'}]}
+        after_tree = {'tree': [
+            {'path': 'samplefiles', 'type': 'tree', 'sha': '5'},
+            {'path': 'samplefiles/v0.0.1/file1.csv', 'type': 'blob', 'sha': '2'},
+            {'path': 'samplefiles/v0.0.2/file1.csv', 'type': 'blob', 'sha': '6'},
+            {'path': 'samplefiles/v0.0.4/file1.csv', 'type': 'blob', 'sha': '7'}]}
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.side_effect = [comparison, before_tree, after_tree]
+
+        repo = 'magencio/git_to_dbfs_function'
+        api_url = 'https://api.github.com'
+        git = GitHub(api_url, 'token', Mock(spec=Logger))
+
+        # Act
+        result = git.get_changed_files(repo, 'a' * 40, 'b' * 40)
+
+        # Assert
+        self.assertListEqual(['samplefiles/v0.0.2/file1.csv', 'samplefiles/v0.0.3/file1.csv',
+            'samplefiles/v0.0.4/file1.csv'], result)
+        mock_get.assert_called_with(f'{api_url}/repos/{repo}/git/trees/{"b" * 40}',
+            headers={'Authorization': 'Bearer token'}, params={'recursive': 1},
+            timeout=DEFAULT_TIMEOUT)
+
+    @patch('requests.Session.get')
     def test_download_file(self, mock_get):
         """
         Tests the download of a file in chunks.
@@ -347,9 +553,128 @@ class TestGitHub(unittest.TestCase):
         mock_got_chunk.assert_has_calls([call(chunk1), call(chunk2)])
 
         mock_get.assert_called_once_with(download_url, headers={'Authorization': f'Bearer {token}'},
-            stream=True)
+            stream=True, timeout=DEFAULT_TIMEOUT)
+
+    @patch('requests.Session.get')
+    def test_download_file_read_into(self, mock_get):
+        """
+        Tests the download of a file read straight into the caller's buffers.
+        """
+        # Arrange
+        mock_get.return_value.__enter__.return_value.status_code = 200
+        mock_get.return_value.__enter__.return_value.headers = {}
+        mock_get.return_value.__enter__.return_value.raw = io.BytesIO(b'chunk1chunk2')
+
+        mock_got_chunk = Mock()
+        buffer = bytearray(16)
+        def read_into(readinto):
+            view = memoryview(buffer)
+            length = 0
+            count = readinto(view[:5])
+            while count:
+                length += count
+                count = readinto(view[length:length + 5])
+            self.assertEqual(12, length)
+
+        download_url = 'https://lfs.example.com/objects/1'
+        git = GitHub('https://api.github.com', 'token', Mock(spec=Logger))
+
+        # Act
+        git.download_file(download_url, mock_got_chunk, read_into=read_into)
+
+        # Assert
+        self.assertEqual(b'chunk1chunk2', bytes(buffer[:12]))
+        mock_got_chunk.assert_not_called()
+        mock_get.return_value.__enter__.return_value.iter_content.assert_not_called()
+        self.assertEqual('identity', mock_get.call_args[1]['headers']['Accept-Encoding'])
+
+    @patch('requests.Session.get')
+    def test_download_file_read_into_encoded(self, mock_get):
+        """
+        Tests that a download compressed by a server that ignored the "identity" encoding goes to
+        got_chunk decoded, instead of being read into the caller's buffers.
+        """
+        # Arrange
+        mock_get.return_value.__enter__.return_value.status_code = 200
+        mock_get.return_value.__enter__.return_value.headers = {'Content-Encoding': 'gzip'}
+        mock_get.return_value.__enter__.return_value.iter_content.return_value = \
+            ['chunk1'.encode(), 'chunk2'.encode()]
+
+        mock_got_chunk = Mock()
+        mock_read_into = Mock()
+        download_url = 'https://lfs.example.com/objects/1'
+        git = GitHub('https://api.github.com', 'token', Mock(spec=Logger))
+
+        # Act
+        git.download_file(download_url, mock_got_chunk, read_into=mock_read_into)
+
+        # Assert
+        mock_read_into.assert_not_called()
+        mock_got_chunk.assert_has_calls([call('chunk1'.encode()), call('chunk2'.encode())])
+
+    def test_download_file_read_into_gzip(self):
+        """
+        Tests reading a download into the caller's buffers from a server that gzip encodes the
+        downloads of clients accepting it.
+        """
+        # Arrange
+        content = b'a,b\n1,2\n' * 8192
+        buffer = bytearray(len(content) + 1)
+        def read_into(readinto):
+            view = memoryview(buffer)
+            length = 0
+            count = readinto(view[:1000])
+            while count:
+                length += count
+                count = readinto(view[length:length + 1000])
+            self.assertEqual(len(content), length)
+
+        with FakeGitHub() as server:
+            server.gzip_downloads = True
+            server.add_file('magencio/git_to_dbfs_function', 'master', 'file1.csv', content)
+            download_url = f'{server.url}/raw/magencio/git_to_dbfs_function/master/file1.csv'
+            git = GitHub(server.url, 'token', Mock(spec=Logger))
+
+            # Act
+            git.download_file(download_url, Mock(), read_into=read_into)
+            chunks = []
+            git.download_file(download_url, chunks.append)
+
+        # Assert
+        self.assertEqual(content, bytes(buffer[:len(content)]))
+        self.assertEqual(content, b''.join(chunks))
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
+    def test_download_file_resumed(self, mock_get):
+        """
+        Tests that a broken download gets resumed from the last byte received.
+        """
+        # Arrange
+        def broken_chunks():
+            yield 'chunk1'.encode()
+            raise requests.exceptions.ChunkedEncodingError('Connection broken')
+        broken = MagicMock(status_code=200)
+        broken.__enter__.return_value.status_code = 200
+        broken.__enter__.return_value.iter_content.return_value = broken_chunks()
+        resumed = MagicMock(status_code=206)
+        resumed.__enter__.return_value.status_code = 206
+        resumed.__enter__.return_value.iter_content.return_value = iter(['chunk2'.encode()])
+        mock_get.side_effect = [broken, resumed]
+
+        mock_got_chunk = Mock()
+        download_url = 'https://lfs.example.com/objects/1'
+        git = GitHub('https://api.github.com', 'token', Mock(spec=Logger))
+
+        # Act
+        git.download_file(download_url, mock_got_chunk, {'Authorization': 'RemoteAuth x'})
+
+        # Assert
+        mock_got_chunk.assert_has_calls([call('chunk1'.encode()), call('chunk2'.encode())])
+        mock_get.assert_called_with(download_url,
+            headers={'Authorization': 'RemoteAuth x', 'Range': 'bytes=6-'}, stream=True,
+            timeout=DEFAULT_TIMEOUT)
+
+    @patch('requests.Session.get')
     def test_download_file_with_github_error(self, mock_get):
         """
         Tests the download of a file in chunks.
@@ -373,7 +698,7 @@ class TestGitHub(unittest.TestCase):
             git.download_file(download_url, got_chunk=mock_got_chunk)
 
         mock_get.assert_called_once_with(download_url, headers={'Authorization': f'Bearer {token}'},
-            stream=True)
+            stream=True, timeout=DEFAULT_TIMEOUT)
 
     def test_copy_folder_to_dbfs(self):
         """
@@ -403,7 +728,7 @@ class TestGitHub(unittest.TestCase):
         chunk_1 = 'chunk1'.encode()
         chunk_2 = 'chunk2'.encode()
         chunk_3 = 'chunk3'.encode()
-        def download_file(download_url: str, got_chunk: Callable[[bytes], None]):
+        def download_file(download_url: str, got_chunk: Callable[[bytes], None], *_):
             if download_url == download_url_1:
                 got_chunk(chunk_1)
             elif download_url == download_url_2:
@@ -428,24 +753,54 @@ class TestGitHub(unittest.TestCase):
             return 3
         dbfs.create = Mock(side_effect=create)
 
+        # Blocks are views of pooled buffers that get reused after add_block
+        blocks = []
+        dbfs.add_block = Mock(side_effect=lambda handle, data: blocks.append((handle, bytes(data))))
+        dbfs.list.return_value = {'files': [
+            {'path': dbfs_file_path_1, 'is_dir': False, 'file_size': len(chunk_1)},
+            {'path': dbfs_file_path_2, 'is_dir': False, 'file_size': len(chunk_2 + chunk_3)}]}
+
         # Act
         git.copy_folder_to_dbfs(git_path, dbfs, dbfs_path)
 
         # Assert
         dbfs.delete.assert_called_once_with(dbfs_path, True)
+        dbfs.list.assert_called_once_with(dbfs_path)
         dbfs.create.assert_has_calls([
             call(dbfs_file_path_1, True),
             call(dbfs_file_path_2, True)],
             any_order=True)
-        dbfs.add_block.assert_has_calls([
-            call(handle_1, chunk_1),
-            call(handle_2, chunk_2), call(handle_2, chunk_3)],
-            any_order=True)
+        self.assertCountEqual([(handle_1, chunk_1), (handle_2, chunk_2 + chunk_3)], blocks)
         dbfs.close.assert_has_calls([
             call(handle_1),
             call(handle_2)],
             any_order=True)
 
+    def test_copy_small_files_first(self):
+        """
+        Tests that files get copied from the smallest to the biggest.
+        """
+        # Arrange
+        git = GitHub('https://api.github.com', 'token', Mock(spec=Logger), max_pending_files=1)
+        raw_url = 'https://raw.githubusercontent.com/magencio/git_to_dbfs_function/master'
+        sizes = {'big.csv': 5000, 'unknown.csv': None, 'small.csv': 2000, 'medium.csv': 3000}
+        git.repos_content = Mock(return_value=[
+            {'download_url': f'{raw_url}/samplefiles/v0.0.1/{name}', 'size': size}
+            for name, size in sizes.items()])
+        git.download_file = Mock(side_effect=lambda url, got_chunk, *_: got_chunk(b'a'))
+        dbfs = Mock(spec=DBFS)
+        dbfs.list.return_value = {'files': [
+            {'path': f'/mnt/v0.0.1/{name}', 'is_dir': False, 'file_size': size or 1}
+            for name, size in sizes.items()]}
+
+        # Act
+        git.copy_folder_to_dbfs(GitPath('magencio/git_to_dbfs_function', 'samplefiles/v0.0.1',
+            'master'), dbfs, '/mnt/v0.0.1')
+
+        # Assert
+        self.assertListEqual(['small.csv', 'medium.csv', 'big.csv', 'unknown.csv'],
+            [x[0][0].split('/')[-1] for x in git.download_file.call_args_list])
+
     def test_copy_missing_folder_to_dbfs(self):
         """
         Tests a copy of a missing folder to a DBFS folder (which should just delete the previous
@@ -476,6 +831,30 @@ class TestGitHub(unittest.TestCase):
         dbfs.add_block.assert_not_called()
         dbfs.close.assert_not_called()
 
+    def test_copy_missing_folder_to_dbfs_with_version_cache(self):
+        """
+        Tests that copies of a folder known to be missing at a head neither list it in GitHub
+        nor delete it in DBFS again, unlike copies for other heads or for unknown heads.
+        """
+        # Arrange
+        git_paths = [
+            GitPath('magencio/git_to_dbfs_function', 'samplefiles/v0.0.1', 'master', head=head)
+            for head in ['sha1', 'sha1', 'sha2', None, None]]
+        git = GitHub('https://api.github.com', 'token', Mock(spec=Logger),
+            version_cache=VersionCache())
+        git.repos_content = Mock(side_effect=GitHubException(404))
+
+        dbfs_path = '/mnt/playground/magencio/data/samplefiles/v0.0.1'
+        dbfs = Mock(spec=DBFS)
+
+        # Act
+        for git_path in git_paths:
+            git.copy_folder_to_dbfs(git_path, dbfs, dbfs_path)
+
+        # Assert
+        self.assertEqual(4, git.repos_content.call_count)
+        self.assertListEqual([call(dbfs_path, True)] * 4, dbfs.delete.call_args_list)
+
     def test_copy_folder_to_dbfs_with_github_error(self):
         """
         Tests a copy of all files in a folder to a DBFS folder when failing to access GitHub.
@@ -543,3 +922,79 @@ class TestGitHub(unittest.TestCase):
         dbfs.create.assert_not_called()
         dbfs.add_block.assert_not_called()
         dbfs.close.assert_not_called()
+
+    def test_copy_folder_to_many_dbfs(self):
+        """
+        Tests a copy of all files in a folder to many DBFS targets, downloading each file once
+        and copying it to all healthy targets even if one of the targets fails.
+        """
+        # Arrange
+        repo = 'magencio/git_to_dbfs_function'
+        path = 'samplefiles/v0.0.1'
+        branch = 'master'
+        git_path = GitPath(repo, path, branch)
+
+        api_url = 'https://api.github.com'
+        token = 'token'
+        logger = Mock(spec=Logger)
+        git = GitHub(api_url, token, logger)
+
+        download_url_1 = 'https://raw.githubusercontent.com/magencio/git_to_dbfs_function/master/' +\
+                'samplefiles/v0.0.1/file1.csv?token=ABACQB6ZHRWQUSV5N2EGKWK7L5YJC'
+        download_url_2 = 'https://raw.githubusercontent.com/magencio/git_to_dbfs_function/master/' +\
+                'samplefiles/v0.0.1/file2.csv?token=ABACQB6ZHRWQUSV5N2EGKWK7L5YJC'
+        git.repos_content = Mock(return_value=[
+            {'download_url': download_url_1},
+            {'download_url': download_url_2}
+        ])
+
+        chunk_1 = 'chunk1'.encode()
+        chunk_2 = 'chunk2'.encode()
+        git.download_file = Mock(side_effect=lambda download_url, got_chunk, *_:
+            [got_chunk(chunk) for chunk in (chunk_1, chunk_2)])
+
+        dbfs_path = '/mnt/playground/magencio/data/samplefiles/v0.0.1'
+        dbfs_1 = Mock(spec=DBFS)
+        dbfs_1.create.return_value = 1
+        dbfs_2 = Mock(spec=DBFS)
+        dbfs_2.create.return_value = 2
+        dbfs_2.add_block.side_effect = DBFSException(503)
+
+        # Act & Assert
+        with self.assertRaisesRegex(DBFSException, '503'):
+            git.copy_folder_to_dbfs(git_path, [dbfs_1, dbfs_2], dbfs_path)
+
+        self.assertEqual(2, git.download_file.call_count)
+        dbfs_1.delete.assert_called_once_with(dbfs_path, True)
+        dbfs_2.delete.assert_called_once_with(dbfs_path, True)
+        dbfs_1.create.assert_has_calls([
+            call(f'{dbfs_path}/file1.csv', True),
+            call(f'{dbfs_path}/file2.csv', True)])
+        self.assertEqual(2, dbfs_1.add_block.call_count)
+        self.assertEqual(2, dbfs_1.close.call_count)
+        dbfs_2.close.assert_not_called()
+
+    def test_copy_folder_to_dbfs_with_download_error(self):
+        """
+        Tests that DBFS files are not closed (published) when their download fails.
+        """
+        # Arrange
+        git_path = GitPath('magencio/git_to_dbfs_function', 'samplefiles/v0.0.1', 'master')
+        logger = Mock(spec=Logger)
+        git = GitHub('https://api.github.com', 'token', logger)
+
+        git.repos_content = Mock(return_value=[
+            {'download_url': 'https://raw.githubusercontent.com/magencio/git_to_dbfs_function/'
+                'master/samplefiles/v0.0.1/file1.csv'}
+        ])
+        git.download_file = Mock(side_effect=GitHubException(500))
+
+        dbfs_path = '/mnt/playground/magencio/data/samplefiles/v0.0.1'
+        dbfs = Mock(spec=DBFS)
+
+        # Act & Assert
+        with self.assertRaisesRegex(GitHubException, '500'):
+            git.copy_folder_to_dbfs(git_path, dbfs, dbfs_path)
+
+        dbfs.create.assert_called_once_with(f'{dbfs_path}/file1.csv', True)
+        dbfs.close.assert_not_called()
@@ -0,0 +1,136 @@
+"""
+Tests for journal.py.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+from ...services import PLANNED, PUBLISHED, UPLOADED, Checkpoint, SyncJournal
+
+class TestSyncJournal(unittest.TestCase):
+    """
+    Tests for SyncJournal class.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.path = os.path.join(self.folder.name, 'journal.db')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_record_copy(self):
+        """
+        Tests that the progress of a copy is recorded as it happens.
+        """
+        # Arrange
+        journal = SyncJournal(self.path)
+        checkpoint = journal.checkpoint('copy', {'Version': 'v0.0.1'})
+
+        # Act
+        checkpoint.deleted = True
+        checkpoint.plan({'file1.csv': 'a', 'file2.csv': 'b', 'file3.csv': 'c'})
+        checkpoint.upload('file1.csv')
+        checkpoint.publish('file1.csv')
+        checkpoint.upload('file2.csv')
+        journal.close()
+        journal = SyncJournal(self.path)
+        reloaded = journal.checkpoint('copy', {'Version': 'v0.0.1'})
+
+        # Assert
+        self.assertDictEqual({'file1.csv': ('a', PUBLISHED), 'file2.csv': ('b', UPLOADED),
+            'file3.csv': ('c', PLANNED)}, journal.get_files('copy'))
+        self.assertTrue(reloaded.deleted)
+        self.assertSetEqual({'file1.csv'}, reloaded.completed)
+
+    def test_plan_changed_files(self):
+        """
+        Tests that published files get copied again if they changed in Git, and that copies get
+        rolled back if published files got removed from Git.
+        """
+        # Arrange
+        journal = SyncJournal(self.path)
+        checkpoint = journal.checkpoint('copy', {})
+        checkpoint.deleted = True
+        checkpoint.plan({'file1.csv': 'a', 'file2.csv': 'b'})
+        checkpoint.publish('file1.csv')
+        checkpoint.publish('file2.csv')
+
+        # Act
+        checkpoint.plan({'file1.csv': 'a', 'file2.csv': 'modified', 'file3.csv': 'c'})
+        changed = set(checkpoint.completed)
+        checkpoint.plan({'file2.csv': 'modified'})
+
+        # Assert
+        self.assertSetEqual({'file1.csv'}, changed)
+        self.assertFalse(checkpoint.deleted)
+        self.assertSetEqual(set(), checkpoint.completed)
+        self.assertDictEqual({'file2.csv': ('modified', PLANNED)}, journal.get_files('copy'))
+
+    def test_checkpoint_from_continuation(self):
+        """
+        Tests that given checkpoints replace the progress in the journal.
+        """
+        # Arrange
+        journal = SyncJournal(self.path)
+
+        # Act
+        checkpoint = journal.checkpoint('copy', {}, Checkpoint(True, ['file1.csv']))
+        checkpoint.plan({'file1.csv': 'a', 'file2.csv': 'b'})
+
+        # Assert
+        self.assertTrue(checkpoint.deleted)
+        self.assertSetEqual({'file1.csv'}, checkpoint.completed)
+        self.assertEqual(('a', PUBLISHED), journal.get_files('copy')['file1.csv'])
+
+    def test_recover(self):
+        """
+        Tests that only copies of other journals whose lease expired get recovered, once.
+        """
+        # Arrange
+        journal = SyncJournal(self.path)
+        crashed_journal = SyncJournal(self.path, lease=0)
+        running_journal = SyncJournal(self.path)
+        checkpoint = crashed_journal.checkpoint('crashed', {'Version': 'v0.0.1'})
+        checkpoint.deleted = True
+        checkpoint.plan({'file1.csv': 'a', 'file2.csv': 'b'})
+        checkpoint.publish('file1.csv')
+        running_journal.checkpoint('running', {'Version': 'v0.0.2'})
+        journal.checkpoint('own', {'Version': 'v0.0.3'})
+        journal.checkpoint('finished', {'Version': 'v0.0.4'})
+        journal.forget(['finished'])
+
+        # Act
+        result = journal.recover()
+        result_again = journal.recover()
+
+        # Assert
+        self.assertEqual(1, len(result))
+        key, data, recovered = result[0]
+        self.assertEqual('crashed', key)
+        self.assertDictEqual({'Version': 'v0.0.1'}, data)
+        self.assertTrue(recovered.deleted)
+        self.assertSetEqual({'file1.csv'}, recovered.completed)
+        self.assertEqual([], result_again)
+
+    def test_recover_with_same_pid(self):
+        """
+        Tests that copies of a crashed worker get recovered by the worker restarted after it
+        once their lease expires, even though it has the same PID (both journals are in this
+        process).
+        """
+        # Arrange
+        crashed_journal = SyncJournal(self.path, lease=0.05)
+        crashed_journal.checkpoint('crashed', {'Version': 'v0.0.1'})
+        journal = SyncJournal(self.path)
+        before_expiry = journal.recover()
+        time.sleep(0.1)
+
+        # Act
+        result = journal.recover()
+
+        # Assert
+        self.assertListEqual([], before_expiry)
+        self.assertListEqual(['crashed'], [key for key, _, _ in result])
@@ -0,0 +1,77 @@
+"""
+Tests for lfs.py.
+"""
+
+import unittest
+
+from ...services import LFSPointer, get_batch_requests, get_download_actions, get_lfs_url
+
+OID = '4d7a214614ab2935c943f9e0ff69d22eadbb8f32b1258daaa5e2ca24d17e2393'
+
+class TestLFS(unittest.TestCase):
+    """
+    Tests for Git LFS helper methods.
+    """
+
+    def test_parse_pointer(self):
+        """
+        Tests detecting pointer files from their content.
+        """
+        # Arrange
+        pointer = ('version https://git-lfs.github.com/spec/v1\n'
+            f'oid sha256:{OID}\nsize 12345\n').encode()
+        pointer_with_extension = ('version https://git-lfs.github.com/spec/v1\n'
+            f'ext-0-foo sha256:{"0" * 64}\noid sha256:{OID}\nsize 1\n').encode()
+
+        # Act
+        result = LFSPointer.parse(pointer)
+        result_with_extension = LFSPointer.parse(pointer_with_extension)
+
+        # Assert
+        self.assertEqual(OID, result.oid)
+        self.assertEqual(12345, result.size)
+        self.assertEqual(1, result_with_extension.size)
+        self.assertIsNone(LFSPointer.parse(b'a,b\n1,2\n'))
+        self.assertIsNone(LFSPointer.parse(pointer.replace(b'size', b'length')))
+        self.assertIsNone(LFSPointer.parse(pointer + b' ' * 1024))
+
+    def test_get_lfs_url(self):
+        """
+        Tests getting the URL of the LFS server of GitHub and GitHub Enterprise repos.
+        """
+        # Act & Assert
+        self.assertEqual('https://github.com/org/repo.git/info/lfs',
+            get_lfs_url('https://api.github.com', 'org/repo'))
+        self.assertEqual('https://github.contoso.com/org/repo.git/info/lfs',
+            get_lfs_url('https://github.contoso.com/api/v3/', 'org/repo'))
+
+    def test_get_batch_requests(self):
+        """
+        Tests that objects get requested once, up to 100 per request.
+        """
+        # Arrange
+        pointers = [LFSPointer(f'{i:064x}', i) for i in range(150)] + [LFSPointer(f'{0:064x}', 0)]
+
+        # Act
+        result = get_batch_requests(pointers)
+
+        # Assert
+        self.assertEqual([100, 50], [len(x['objects']) for x in result])
+        self.assertEqual('download', result[0]['operation'])
+        self.assertEqual({'oid': f'{0:064x}', 'size': 0}, result[0]['objects'][0])
+
+    def test_get_download_actions(self):
+        """
+        Tests getting the download actions of objects, without the objects with errors.
+        """
+        # Arrange
+        response = {'objects': [
+            {'oid': OID, 'size': 1, 'actions': {'download': {'href': 'https://lfs/1',
+                'header': {'Authorization': 'RemoteAuth x'}}}},
+            {'oid': '0' * 64, 'size': 1, 'error': {'code': 404, 'message': 'Not found'}}]}
+
+        # Act
+        result = get_download_actions(response)
+
+        # Assert
+        self.assertDictEqual({OID: ('https://lfs/1', {'Authorization': 'RemoteAuth x'})}, result)
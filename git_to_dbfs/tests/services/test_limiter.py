@@ -0,0 +1,270 @@
+"""
+Tests for limiter.py.
+"""
+
+import os
+import tempfile
+from threading import Event, Thread
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from ...services import AdaptiveLimiter, CircuitBreaker, CircuitOpenException, RateLimiter
+from ...services import get_limiter, get_rate_limiter
+
+def response(status_code: int, headers: dict = None) -> Mock:
+    """
+    Creates a mock response.
+    """
+    return Mock(status_code=status_code, headers=headers or {})
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    """
+    Tests for AdaptiveLimiter class.
+    """
+
+    def test_call_increases_limit(self):
+        """
+        Tests that the limit grows while requests succeed with a stable latency, but only up to
+        the number of requests actually sent at the same time.
+        """
+        # Arrange
+        limiter = AdaptiveLimiter('test', initial_limit=1, max_limit=4)
+
+        # Act
+        results = [limiter.call('list', lambda: response(200)) for _ in range(20)]
+
+        # Assert
+        self.assertEqual([200] * 20, [x.status_code for x in results])
+        self.assertEqual(2, limiter.limit)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_call_retries_throttled_requests(self):
+        """
+        Tests that throttled requests get retried after decreasing the limit.
+        """
+        # Arrange
+        limiter = AdaptiveLimiter('test', initial_limit=8, retry_delay=0.001)
+        send = Mock(side_effect=[response(429, {'Retry-After': '0'}), response(503),
+            response(200)])
+
+        # Act
+        result = limiter.call('add-block', send)
+
+        # Assert
+        self.assertEqual(200, result.status_code)
+        self.assertEqual(3, send.call_count)
+        self.assertEqual(2, limiter.limit)
+
+    def test_call_retries_with_rate_limiter(self):
+        """
+        Tests that retries wait for a token of the rate limiter without holding an in-flight slot.
+        """
+        # Arrange
+        limiter = AdaptiveLimiter('test', retry_delay=0.001)
+        rate_limiter = Mock(spec=RateLimiter)
+        in_flight = []
+        rate_limiter.acquire.side_effect = lambda _: in_flight.append(limiter.in_flight)
+        send = Mock(side_effect=[response(429), response(200)])
+
+        # Act
+        result = limiter.call('add-block', send, rate_limiter=rate_limiter)
+
+        # Assert
+        self.assertEqual(200, result.status_code)
+        rate_limiter.acquire.assert_called_once_with('add-block')
+        self.assertListEqual([0], in_flight)
+
+    def test_call_gives_up_after_max_retries(self):
+        """
+        Tests that the last throttled response is returned after max_retries retries.
+        """
+        # Arrange
+        limiter = AdaptiveLimiter('test', max_retries=2, retry_delay=0.001)
+        send = Mock(return_value=response(429))
+
+        # Act
+        result = limiter.call('add-block', send)
+
+        # Assert
+        self.assertEqual(429, result.status_code)
+        self.assertEqual(3, send.call_count)
+
+    def test_call_decreases_limit_once_per_round(self):
+        """
+        Tests that requests throttled at the same time only decrease the limit once.
+        """
+        # Arrange
+        limiter = AdaptiveLimiter('test', initial_limit=8, max_retries=0)
+        sent = Event()
+        release = Event()
+        def send():
+            sent.set()
+            release.wait()
+            return response(429)
+
+        # Act
+        threads = [Thread(target=limiter.call, args=('add-block', send)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        sent.wait()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        # Assert
+        self.assertEqual(4, limiter.limit)
+
+    def test_call_waits_for_room(self):
+        """
+        Tests that requests beyond the limit wait for in-flight requests to finish.
+        """
+        # Arrange
+        limiter = AdaptiveLimiter('test', initial_limit=1, max_limit=1)
+        release = Event()
+        def send():
+            release.wait()
+            return response(200)
+        first = Thread(target=limiter.call, args=('list', send))
+        first.start()
+        while limiter.in_flight == 0:
+            time.sleep(0.001)
+        second = Thread(target=limiter.call, args=('list', lambda: response(200)))
+
+        # Act
+        second.start()
+        second.join(0.05)
+        waited = second.is_alive()
+        release.set()
+        first.join()
+        second.join()
+
+        # Assert
+        self.assertTrue(waited)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_call_decreases_limit_on_errors(self):
+        """
+        Tests that connection errors decrease the limit and get raised.
+        """
+        # Arrange
+        limiter = AdaptiveLimiter('test', initial_limit=8)
+
+        # Act
+        with self.assertRaises(ConnectionError):
+            limiter.call('list', Mock(side_effect=ConnectionError()))
+
+        # Assert
+        self.assertEqual(4, limiter.limit)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_call_with_breaker(self):
+        """
+        Tests that failing requests open the circuit, and that requests fail right away without
+        being sent while it is open.
+        """
+        # Arrange
+        breaker = CircuitBreaker('test', failure_threshold=2)
+        limiter = AdaptiveLimiter('test', retry_delay=0.001, breaker=breaker)
+        send = Mock(side_effect=[response(500), ConnectionError()])
+
+        # Act
+        first = limiter.call('list', send, max_retries=0)
+        with self.assertRaises(ConnectionError):
+            limiter.call('list', send)
+        with self.assertRaises(CircuitOpenException):
+            limiter.call('list', send)
+
+        # Assert
+        self.assertEqual(500, first.status_code)
+        self.assertEqual(2, send.call_count)
+        self.assertTrue(breaker.is_open)
+
+    def test_get_limiter(self):
+        """
+        Tests that limiters are shared per endpoint.
+        """
+        # Act & Assert
+        self.assertIs(get_limiter('https://a'), get_limiter('https://a'))
+        self.assertIsNot(get_limiter('https://a'), get_limiter('https://b'))
+
+class TestRateLimiter(unittest.TestCase):
+    """
+    Tests for RateLimiter class.
+    """
+
+    def test_budgets(self):
+        """
+        Tests parsing budgets per API.
+        """
+        # Act
+        rate_limiter = RateLimiter('add-block=20/40, list=5,*=30')
+
+        # Assert
+        self.assertDictEqual({'add-block': (20, 40), 'list': (5, 5), '*': (30, 30)},
+            rate_limiter.budgets)
+
+    @patch('time.time')
+    def test_try_acquire(self, mock_time):
+        """
+        Tests taking tokens from the bucket of every API, refilled at its rate.
+        """
+        # Arrange
+        mock_time.return_value = 1000.0
+        rate_limiter = RateLimiter('add-block=2/2,list=1')
+
+        # Act
+        results = [rate_limiter.try_acquire('add-block') for _ in range(3)]
+        other_results = [rate_limiter.try_acquire('list'), rate_limiter.try_acquire('mkdirs')]
+        mock_time.return_value = 1000.5
+        refilled_result = rate_limiter.try_acquire('add-block')
+
+        # Assert
+        self.assertEqual([0, 0, 0.5], results)
+        self.assertEqual([0, 0], other_results)
+        self.assertEqual(0, refilled_result)
+
+    def test_acquire(self):
+        """
+        Tests that acquiring waits for tokens, keeping the rate under the budget.
+        """
+        # Arrange
+        rate_limiter = RateLimiter('*=100/1')
+        start = time.perf_counter()
+
+        # Act
+        for _ in range(6):
+            rate_limiter.acquire('list')
+
+        # Assert
+        self.assertGreaterEqual(time.perf_counter() - start, 0.045)
+
+    def test_shared_state(self):
+        """
+        Tests that rate limiters with the same state file (e.g. in other processes) share tokens.
+        """
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory:
+            state_path = os.path.join(directory, 'state.json')
+            rate_limiter = RateLimiter('*=0.001/2', state_path)
+            other_rate_limiter = RateLimiter('*=0.001/2', state_path)
+
+            # Act
+            results = [rate_limiter.try_acquire('list'), other_rate_limiter.try_acquire('list'),
+                other_rate_limiter.try_acquire('list')]
+
+        # Assert
+        self.assertEqual(0, results[0])
+        self.assertEqual(0, results[1])
+        self.assertGreater(results[2], 0)
+
+    def test_get_rate_limiter(self):
+        """
+        Tests that rate limiters are shared per endpoint and budgets, and optional.
+        """
+        # Act & Assert
+        self.assertIsNone(get_rate_limiter('https://a', None))
+        self.assertIs(get_rate_limiter('https://a', '*=1'), get_rate_limiter('https://a', '*=1'))
+        self.assertIsNot(get_rate_limiter('https://a', '*=1'),
+            get_rate_limiter('https://b', '*=1'))
@@ -0,0 +1,42 @@
+"""
+Tests for local.py.
+"""
+
+import os
+import tempfile
+import unittest
+
+from ...services import DBFSException, LocalSink
+
+class TestLocalSink(unittest.TestCase):
+    """
+    Tests for LocalSink class.
+    """
+
+    def test_write_list_and_delete(self):
+        """
+        Tests writing files, listing and deleting their folders.
+        """
+        # Arrange
+        with tempfile.TemporaryDirectory() as root:
+            sink = LocalSink(root)
+
+            # Act
+            handle = sink.create('/mnt/data/v0.0.1/file1.csv', True)
+            sink.add_block(handle, b'a,b\n')
+            unpublished = sink.list('/mnt/data/v0.0.1')
+            sink.close(handle)
+            aborted_handle = sink.create('/mnt/data/v0.0.1/file2.csv', True)
+            sink.add_block(aborted_handle, b'c,d\n')
+            sink.abort(aborted_handle)
+            result = sink.list('/mnt/data/v0.0.1')
+            sink.delete('/mnt/data/v0.0.1', True)
+
+            # Assert
+            self.assertListEqual([], unpublished['files'])
+            self.assertListEqual(
+                [{'path': '/mnt/data/v0.0.1/file1.csv', 'is_dir': False, 'file_size': 4}],
+                result['files'])
+            self.assertFalse(os.path.exists(os.path.join(root, 'mnt/data/v0.0.1')))
+            with self.assertRaisesRegex(DBFSException, '404'):
+                sink.list('/mnt/data/v0.0.1')
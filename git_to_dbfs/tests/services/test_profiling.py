@@ -0,0 +1,82 @@
+"""
+Tests for profiling.py.
+"""
+
+import os
+import pstats
+import tempfile
+from threading import Thread
+import unittest
+from unittest.mock import Mock
+
+from logging import Logger
+
+from ...services import profiling, telemetry
+
+def work_in_thread():
+    """
+    Function profiled in a thread.
+    """
+    return sum(range(1000))
+
+class TestProfiling(unittest.TestCase):
+    """
+    Tests for profiling helper functions.
+    """
+
+    def test_is_profiling_requested(self):
+        """
+        Tests gating profiling with the setting and the request header.
+        """
+        # Act & Assert
+        self.assertFalse(profiling.is_profiling_requested(None, {}))
+        self.assertFalse(profiling.is_profiling_requested('false', {}))
+        self.assertTrue(profiling.is_profiling_requested('true', {}))
+        self.assertFalse(profiling.is_profiling_requested('header', {}))
+        self.assertTrue(profiling.is_profiling_requested('header',
+            {'X-Git-To-Dbfs-Profile': 'true'}))
+        self.assertFalse(profiling.is_profiling_requested(None,
+            {'X-Git-To-Dbfs-Profile': 'true'}))
+
+    def test_profile_disabled(self):
+        """
+        Tests that nothing gets profiled nor written when profiling is not requested.
+        """
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory:
+
+            # Act
+            with profiling.profile(None, {}, directory, Mock(spec=Logger)) as profiler:
+                work_in_thread()
+
+            # Assert
+            self.assertIsNone(profiler)
+            self.assertEqual([], os.listdir(directory))
+
+    def test_profile(self):
+        """
+        Tests profiling an invocation and the threads it starts.
+        """
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory:
+            mock_logger = Mock(spec=Logger)
+
+            # Act
+            with profiling.profile('true', {}, directory, mock_logger) as profiler:
+                thread = Thread(target=telemetry.run_in_context(work_in_thread))
+                thread.start()
+                thread.join()
+                with profiling.profile('true', {}, directory, mock_logger) as nested_profiler:
+                    pass
+
+            # Assert
+            self.assertIsNone(nested_profiler)
+            self.assertEqual([f'{profiler.name}.prof', f'{profiler.name}.txt'],
+                sorted(os.listdir(directory)))
+            stats = pstats.Stats(os.path.join(directory, f'{profiler.name}.prof'))
+            self.assertIn('work_in_thread', [function for _, _, function in stats.stats])
+            with open(os.path.join(directory, f'{profiler.name}.txt'), encoding='utf-8') as file:
+                report = file.read()
+            self.assertIn('Profiled threads: 2', report)
+            self.assertIn('allocations', report)
+            mock_logger.warning.assert_called_once()
@@ -0,0 +1,92 @@
+"""
+Tests for telemetry.py.
+"""
+
+from threading import Thread
+import unittest
+from unittest.mock import patch
+
+from opencensus.stats import stats
+from opencensus.trace.samplers import AlwaysOnSampler, ProbabilitySampler
+
+from ...services import telemetry
+
+class TestTelemetry(unittest.TestCase):
+    """
+    Tests for telemetry helper functions.
+    """
+
+    def test_get_sampler(self):
+        """
+        Tests choosing a sampler from a sampling rate.
+        """
+        # Act & Assert
+        self.assertIsInstance(telemetry.get_sampler(None), AlwaysOnSampler)
+        self.assertIsInstance(telemetry.get_sampler('1'), AlwaysOnSampler)
+        self.assertIsInstance(telemetry.get_sampler('0.25'), ProbabilitySampler)
+
+    def test_span_without_tracer(self):
+        """
+        Tests that spans are no-ops when there is no tracer.
+        """
+        # Arrange
+        result = telemetry.start_tracing(None)
+
+        # Act
+        with telemetry.span('Some span', attribute=1):
+            pass
+
+        # Assert
+        self.assertIsNone(result)
+
+    @patch('git_to_dbfs.services.telemetry.AzureExporter')
+    def test_span_in_thread(self, mock_exporter):
+        """
+        Tests that spans in threads started in context are children of the current span.
+        """
+        # Arrange
+        def traced():
+            with telemetry.span('Child span'):
+                pass
+
+        # Act
+        def invocation():
+            tracer = telemetry.start_tracing(
+                'InstrumentationKey=00000000-0000-0000-0000-000000000000')
+            with telemetry.span('Parent span', version='v0.0.1'):
+                thread = Thread(target=telemetry.run_in_context(traced))
+                thread.start()
+                thread.join()
+            tracer.finish()
+        Thread(target=telemetry.run_in_context(invocation)).run()
+
+        # Assert
+        spans = {
+            span.name: span
+            for args in mock_exporter.return_value.export.call_args_list
+            for span in args[0][0]}
+        self.assertEqual(spans['Parent span'].span_id, spans['Child span'].parent_span_id)
+        self.assertEqual('v0.0.1', spans['Parent span'].attributes['version'])
+
+    @patch('git_to_dbfs.services.telemetry.new_metrics_exporter')
+    def test_record(self, _):
+        """
+        Tests recording metrics once they are enabled.
+        """
+        # Arrange
+        telemetry.enable_metrics('InstrumentationKey=00000000-0000-0000-0000-000000000000')
+        view_data = stats.stats.view_manager.get_view('git_to_dbfs/blocks')
+        blocks = sum(x.count_data for x in view_data.tag_value_aggregation_data_map.values())
+
+        # Act
+        telemetry.record(telemetry.BLOCKS, 1)
+        telemetry.record(telemetry.BLOCKS, 1)
+        with telemetry.timed(telemetry.DBFS_LATENCY, api='add-block'):
+            pass
+
+        # Assert
+        view_data = stats.stats.view_manager.get_view('git_to_dbfs/blocks')
+        self.assertEqual(blocks + 2,
+            sum(x.count_data for x in view_data.tag_value_aggregation_data_map.values()))
+        view_data = stats.stats.view_manager.get_view('git_to_dbfs/dbfs_latency')
+        self.assertEqual(1, view_data.tag_value_aggregation_data_map[('add-block',)].count_data)
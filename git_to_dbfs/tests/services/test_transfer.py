@@ -0,0 +1,204 @@
+"""
+Tests for transfer.py.
+"""
+
+import base64
+import io
+import os
+import tracemalloc
+import unittest
+from unittest.mock import Mock
+
+from ...services import BufferPool, DBFSFanOut, DBFS, DBFSException, Sink
+
+class TestBufferPool(unittest.TestCase):
+    """
+    Tests for BufferPool class.
+    """
+
+    def test_acquire_and_release(self):
+        """
+        Tests that buffers are reused.
+        """
+        # Arrange
+        pool = BufferPool(2, 4)
+
+        # Act
+        buffer_1 = pool.acquire()
+        buffer_2 = pool.acquire()
+        pool.release(buffer_1)
+        buffer_3 = pool.acquire()
+
+        # Assert
+        self.assertIsNot(buffer_1, buffer_2)
+        self.assertIs(buffer_1, buffer_3)
+        self.assertEqual(4, len(buffer_3))
+        self.assertEqual(0, pool.available())
+
+class Base64Sink(Sink):
+    """
+    Sink that base64 encodes blocks like DBFS, and only keeps their total size and the size of
+    their encodings.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.encoded_size = 0
+
+    def list(self, path):
+        return {}
+
+    def create(self, path, overwrite):
+        return 0
+
+    def add_block(self, handle, data):
+        self.size += len(data)
+        self.encoded_size += len(base64.b64encode(data))
+
+    def close(self, handle):
+        pass
+
+    def abort(self, handle):
+        pass
+
+    def delete(self, path, recursive):
+        pass
+
+class TestDBFSFanOut(unittest.TestCase):
+    """
+    Tests for DBFSFanOut class.
+    """
+
+    def test_write(self):
+        """
+        Tests cutting chunks into blocks and writing them to many targets.
+        """
+        # Arrange
+        pool = BufferPool(2, 4)
+        path = '/mnt/playground/magencio/data/samplefiles/v0.0.1/file1.csv'
+        targets = [Mock(spec=DBFS), Mock(spec=DBFS)]
+        blocks = {0: [], 1: []}
+        for index, target in enumerate(targets):
+            target.create.return_value = index
+            target.add_block.side_effect = lambda handle, data: blocks[handle].append(bytes(data))
+
+        fan_out = DBFSFanOut(targets, path, pool)
+
+        # Act
+        for chunk in [b'abc', b'defgh', b'', b'ijklmnopq']:
+            fan_out.write(chunk)
+        result = fan_out.close()
+
+        # Assert
+        self.assertListEqual([], result)
+        for index, target in enumerate(targets):
+            target.create.assert_called_once_with(path, True)
+            target.close.assert_called_once_with(index)
+            self.assertListEqual([b'abcd', b'efgh', b'ijkl', b'mnop', b'q'], blocks[index])
+        self.assertEqual(2, pool.available())
+
+    def test_write_with_dbfs_error(self):
+        """
+        Tests that a failing target neither stops the other targets nor holds pooled buffers.
+        """
+        # Arrange
+        pool = BufferPool(1, 2)
+        path = '/mnt/playground/magencio/data/samplefiles/v0.0.1/file1.csv'
+        healthy_target = Mock(spec=DBFS)
+        failing_target = Mock(spec=DBFS)
+        failing_target.add_block.side_effect = DBFSException(429)
+
+        fan_out = DBFSFanOut([healthy_target, failing_target], path, pool)
+
+        # Act
+        fan_out.write(b'abcdefgh')
+        result = fan_out.close()
+
+        # Assert
+        self.assertEqual(1, len(result))
+        self.assertIs(failing_target, result[0].dbfs)
+        self.assertEqual('429', str(result[0].error))
+        self.assertEqual(4, healthy_target.add_block.call_count)
+        healthy_target.close.assert_called_once()
+        failing_target.close.assert_not_called()
+        self.assertEqual(1, pool.available())
+
+    def test_abort(self):
+        """
+        Tests that an aborted file is not closed.
+        """
+        # Arrange
+        pool = BufferPool(1, 4)
+        target = Mock(spec=DBFS)
+        fan_out = DBFSFanOut([target], '/mnt/file1.csv', pool)
+
+        # Act
+        fan_out.write(b'abcdef')
+        result = fan_out.close(abort=True)
+
+        # Assert
+        self.assertListEqual([], result)
+        target.add_block.assert_called_once()
+        target.close.assert_not_called()
+        self.assertEqual(1, pool.available())
+
+    def test_read_from(self):
+        """
+        Tests reading a stream straight into pooled buffers, in reads smaller than a block.
+        """
+        # Arrange
+        pool = BufferPool(2, 4)
+        target = Mock(spec=DBFS)
+        target.create.return_value = 1
+        blocks = []
+        target.add_block.side_effect = lambda handle, data: blocks.append(bytes(data))
+        stream = io.BytesIO(b'abcdefghijklmnopq')
+        fan_out = DBFSFanOut([target], '/mnt/file1.csv', pool)
+
+        # Act
+        fan_out.read_from(lambda view: stream.readinto(view[:3]))
+        result = fan_out.close()
+
+        # Assert
+        self.assertListEqual([], result)
+        self.assertListEqual([b'abcd', b'efgh', b'ijkl', b'mnop', b'q'], blocks)
+        self.assertEqual(17, fan_out.size)
+        target.close.assert_called_once_with(1)
+        self.assertEqual(2, pool.available())
+
+    def test_read_from_allocations(self):
+        """
+        Tests that reading a stream into pooled buffers allocates no memory per chunk or block,
+        so memory traced during a long transfer stays within a chunk of what the base64 encoding
+        of a single block takes.
+        """
+        # Arrange
+        block_size = 64 * 1024
+        chunk_size = 8192
+        data = os.urandom(64 * block_size)
+        stream = io.BytesIO(data)
+        pool = BufferPool(4, block_size)
+        target = Base64Sink()
+        fan_out = DBFSFanOut([target], '/mnt/file1.csv', pool)
+        tracemalloc.start()
+        try:
+            base64.b64encode(memoryview(data)[:block_size])
+            _, encoding_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # Act
+        tracemalloc.start()
+        try:
+            fan_out.read_from(lambda view: stream.readinto(view[:chunk_size]))
+            result = fan_out.close()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # Assert
+        self.assertListEqual([], result)
+        self.assertEqual(len(data), target.size)
+        self.assertEqual(64 * len(base64.b64encode(data[:block_size])), target.encoded_size)
+        self.assertLess(peak, encoding_peak + chunk_size)
+        self.assertEqual(4, pool.available())
@@ -0,0 +1,92 @@
+"""
+Tests for transform.py.
+"""
+
+import gzip
+import io
+import unittest
+
+from ...services import GzipTransform, ParquetTransform, get_transform
+from ...services.transform import pa
+
+CSV = b'a,b,c\n1,2.5,"x\ny"\n3,4,z\n5,6,"w,""v"""\n7,8,v'
+
+def transform_in_chunks(transform, data: bytes, chunk_size: int = 3) -> bytes:
+    """
+    Transforms data written in chunks of chunk_size bytes.
+    """
+    output = []
+    stream = transform.open(output.append)
+    for offset in range(0, len(data), chunk_size):
+        stream.write(data[offset:offset + chunk_size])
+    stream.close()
+    return b''.join(output)
+
+class TestTransform(unittest.TestCase):
+    """
+    Tests for transforms of CSV files.
+    """
+
+    def test_gzip(self):
+        """
+        Tests compressing a file with gzip as it is written.
+        """
+        # Arrange
+        transform = GzipTransform()
+
+        # Act
+        result = transform_in_chunks(transform, CSV)
+
+        # Assert
+        self.assertEqual(CSV, gzip.decompress(result))
+        self.assertEqual('file1.csv.gz', transform.rename('file1.csv'))
+        self.assertTrue(transform.applies('FILE1.CSV'))
+        self.assertFalse(transform.applies('model.bin'))
+
+    @unittest.skipUnless(pa, 'pyarrow is not installed')
+    def test_parquet(self):
+        """
+        Tests converting a CSV file to Parquet as it is written, with records spanning many lines
+        and chunks.
+        """
+        # Arrange
+        import pyarrow.parquet as pa_parquet # pylint: disable=import-outside-toplevel
+        transform = ParquetTransform(row_group_size=2)
+
+        # Act
+        result = pa_parquet.ParquetFile(io.BytesIO(transform_in_chunks(transform, CSV)))
+
+        # Assert
+        self.assertEqual(2, result.metadata.num_row_groups)
+        self.assertDictEqual({'a': [1, 3, 5, 7], 'b': [2.5, 4.0, 6.0, 8.0],
+            'c': ['x\ny', 'z', 'w,"v"', 'v']}, result.read().to_pydict())
+        self.assertEqual('file1.parquet', transform.rename('file1.csv'))
+
+    @unittest.skipUnless(pa, 'pyarrow is not installed')
+    def test_parquet_empty(self):
+        """
+        Tests converting empty CSV files (with or without header) to Parquet.
+        """
+        # Arrange
+        import pyarrow.parquet as pa_parquet # pylint: disable=import-outside-toplevel
+        transform = ParquetTransform()
+
+        # Act
+        empty = pa_parquet.read_table(io.BytesIO(transform_in_chunks(transform, b'')))
+        header = pa_parquet.read_table(io.BytesIO(transform_in_chunks(transform, b'a,b\n')))
+
+        # Assert
+        self.assertEqual(0, empty.num_rows)
+        self.assertEqual(['a', 'b'], header.column_names)
+        self.assertEqual(0, header.num_rows)
+
+    def test_get_transform(self):
+        """
+        Tests getting transforms by name.
+        """
+        # Act & Assert
+        self.assertIsNone(get_transform(None))
+        self.assertIsNone(get_transform('none'))
+        self.assertIsInstance(get_transform('GZIP'), GzipTransform)
+        with self.assertRaises(ValueError):
+            get_transform('zip')
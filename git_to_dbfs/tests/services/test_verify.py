@@ -0,0 +1,43 @@
+"""
+Tests for verify.py.
+"""
+
+import unittest
+
+from ...services import get_folders, get_mismatched_files
+
+class TestVerify(unittest.TestCase):
+    """
+    Tests for verification helper methods.
+    """
+
+    def test_get_folders(self):
+        """
+        Tests grouping the files of a copy by DBFS folder.
+        """
+        # Act
+        result = get_folders('/mnt/data/v1', ['file1.csv', 'sub/file2.csv', 'file3.csv'])
+
+        # Assert
+        self.assertDictEqual({
+            '/mnt/data/v1': ['file1.csv', 'file3.csv'],
+            '/mnt/data/v1/sub': ['sub/file2.csv']}, result)
+
+    def test_get_mismatched_files(self):
+        """
+        Tests finding files that are missing or have the wrong size in a listing.
+        """
+        # Arrange
+        listing = {'files': [
+            {'path': '/mnt/data/v1/sub/file1.csv', 'is_dir': False, 'file_size': 10},
+            {'path': '/mnt/data/v1/sub/file2.csv', 'is_dir': False, 'file_size': 5},
+            {'path': '/mnt/data/v1/sub/file3.csv', 'is_dir': True, 'file_size': 0}]}
+        sizes = {'sub/file1.csv': 10, 'sub/file2.csv': 20, 'sub/file3.csv': 0}
+
+        # Act
+        result = get_mismatched_files(list(sizes), listing, sizes)
+        missing_folder = get_mismatched_files(list(sizes), None, sizes)
+
+        # Assert
+        self.assertListEqual(['sub/file2.csv', 'sub/file3.csv'], result)
+        self.assertListEqual(list(sizes), missing_folder)
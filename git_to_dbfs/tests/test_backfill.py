@@ -0,0 +1,121 @@
+"""
+Tests for backfill.py.
+"""
+
+import io
+import os
+import tempfile
+from unittest.mock import Mock
+
+from logging import Logger
+
+from ..backfill import Journal, backfill, plan, print_plan
+from ..routing import RoutingTable
+from ..services import DBFS
+from .fakes import FakeServersTestCase, REPO, BRANCH, BASE_PATH, DBFS_BASE_PATH
+
+class TestBackfill(FakeServersTestCase):
+    """
+    Tests for backfill helper methods, against fake GitHub and DBFS servers.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.files = {
+            f'{BASE_PATH}/v0.0.1/file1.csv': b'a,b\n1,2\n',
+            f'{BASE_PATH}/v0.0.1/file2.csv': bytes(DBFS.MAX_BLOCK_SIZE + 1),
+            f'{BASE_PATH}/v0.0.2/file1.csv': b'c,d\n3,4\n'}
+        for path, content in self.files.items():
+            self.git_server.add_file(REPO, BRANCH, path, content)
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.journal_path = os.path.join(self.directory.name, 'backfill.journal')
+
+    def tearDown(self):
+        super().tearDown()
+        self.directory.cleanup()
+
+    def test_plan(self):
+        """
+        Test planning the copy of all versions, and printing its requests and bytes.
+        """
+        # Arrange
+        out = io.StringIO()
+
+        # Act
+        units = plan(self.routing_table, Mock(spec=Logger))
+        print_plan(units, Journal(self.journal_path), out)
+
+        # Assert
+        self.assertEqual(['v0.0.1', 'v0.0.2'], [unit.version for unit in units])
+        self.assertEqual(DBFS.MAX_BLOCK_SIZE + 9, units[0].size)
+        self.assertEqual(1 + 2 + 1 + (3 + 4), units[0].get_requests())
+        self.assertIn('Planned: 17 requests', out.getvalue())
+        self.assertEqual(1, self.git_server.requests['trees'])
+        self.assertEqual(0, self.git_server.requests['raw'])
+        self.assertDictEqual({}, self.dbfs_server.files)
+
+    def test_backfill(self):
+        """
+        Test copying all versions, and resuming from the journal.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        units = plan(self.routing_table, logger)
+        journal = Journal(self.journal_path)
+        journal.record(units[1])
+        out = io.StringIO()
+
+        # Act
+        failed = backfill(self.routing_table, units, Journal(self.journal_path), logger, 4, out)
+        resumed_failed = backfill(self.routing_table, units, Journal(self.journal_path), logger,
+            4, out)
+
+        # Assert
+        self.assertEqual(0, failed)
+        self.assertEqual(0, resumed_failed)
+        self.assertEqual({f'{DBFS_BASE_PATH}/v0.0.1/file1.csv',
+            f'{DBFS_BASE_PATH}/v0.0.1/file2.csv'}, set(self.dbfs_server.files))
+        self.assertIn('[1/1] v0.0.1: done', out.getvalue())
+        self.assertIn('All 2 versions already done', out.getvalue())
+        self.assertEqual(2, self.git_server.requests['raw'])
+
+    def test_backfill_unfinished(self):
+        """
+        Test that versions whose copies did not finish are not recorded in the journal.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        units = plan(self.routing_table, logger)
+        routing_table = Mock(spec=RoutingTable)
+        routing_table.sync.side_effect = lambda routes, _: {(version, mapping): Mock()
+            for mapping, versions in routes.items() for version in versions
+            if version == 'v0.0.1'}
+        journal = Journal(self.journal_path)
+        out = io.StringIO()
+
+        # Act
+        failed = backfill(routing_table, units, journal, logger, 1, out)
+
+        # Assert
+        self.assertEqual(1, failed)
+        self.assertFalse(Journal(self.journal_path).is_done(units[0]))
+        self.assertTrue(Journal(self.journal_path).is_done(units[1]))
+        self.assertIn('v0.0.1: unfinished', out.getvalue())
+        self.assertIn('Copied 1 versions, 0 failed, 1 unfinished', out.getvalue())
+
+    def test_journal_with_changed_files(self):
+        """
+        Test that versions whose files changed in Git since they were copied are not done.
+        """
+        # Arrange
+        units = plan(self.routing_table, Mock(spec=Logger))
+        Journal(self.journal_path).record(units[1])
+        self.git_server.add_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.2/file1.csv', b'changed')
+
+        # Act
+        changed_units = plan(self.routing_table, Mock(spec=Logger))
+        journal = Journal(self.journal_path)
+
+        # Assert
+        self.assertTrue(journal.is_done(units[1]))
+        self.assertFalse(journal.is_done(changed_units[1]))
@@ -0,0 +1,398 @@
+"""
+End-to-end tests against fake GitHub and DBFS servers.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+from unittest.mock import Mock
+
+from logging import Logger
+
+from ..routing import RoutingTable
+from ..version import copy_versions_to_dbfs
+from ..services import GitPath, GitHub, DBFS, DBFSException
+from ..services import AdaptiveLimiter, Checkpoint, Deadline, FilesSink, LocalSink, GzipTransform
+from ..services import SyncJournal, VersionCache
+from .fakes import FakeServersTestCase, REPO, BRANCH, BASE_PATH, DBFS_BASE_PATH, get_blob_sha
+
+class TestEndToEnd(FakeServersTestCase):
+    """
+    End-to-end tests of copy_versions_to_dbfs.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.files = {
+            f'{BASE_PATH}/v0.0.1/file1.csv': b'a,b\n1,2\n',
+            f'{BASE_PATH}/v0.0.1/file2.csv': bytes(range(256)) * 4096,
+            f'{BASE_PATH}/v0.0.2/file1.csv': b''}
+        for path, content in self.files.items():
+            self.git_server.add_file(REPO, BRANCH, path, content)
+        self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.1/old.csv'] = b'old'
+        self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.3/file1.csv'] = b'removed'
+
+    def expected_files(self) -> dict:
+        """
+        Gets the DBFS files expected after copying all versions.
+        """
+        return {
+            path.replace(BASE_PATH, DBFS_BASE_PATH, 1): content
+            for path, content in self.files.items()}
+
+    def test_copy_versions_to_dbfs(self):
+        """
+        Test the copy of added, modified and removed versions.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        dbfs = DBFS(self.dbfs_server.url, 'token')
+
+        # Act
+        copy_versions_to_dbfs({'v0.0.1', 'v0.0.2', 'v0.0.3'}, git,
+            GitPath(REPO, BASE_PATH, BRANCH), dbfs, DBFS_BASE_PATH, logger)
+
+        # Assert
+        self.assertDictEqual(self.expected_files(), self.dbfs_server.files)
+        self.assertEqual(3, self.dbfs_server.requests['close'])
+
+    def test_copy_recursive_versions_to_dbfs(self):
+        """
+        Test the copy of version folders with subfolders, which are ignored unless recursive.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        dbfs = DBFS(self.dbfs_server.url, 'token')
+        self.git_server.add_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.2/a=1/b=2/part-0.csv', b'0')
+        self.git_server.add_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.2/a=2/part-1.csv', b'1')
+
+        # Act
+        copy_versions_to_dbfs({'v0.0.2'}, git, GitPath(REPO, BASE_PATH, BRANCH), dbfs,
+            DBFS_BASE_PATH, logger)
+        files = sorted(self.dbfs_server.files)
+        copy_versions_to_dbfs({'v0.0.2'}, git, GitPath(REPO, BASE_PATH, BRANCH, True), dbfs,
+            DBFS_BASE_PATH, logger)
+
+        # Assert
+        self.assertNotIn(f'{DBFS_BASE_PATH}/v0.0.2/a=2/part-1.csv', files)
+        self.assertIn(f'{DBFS_BASE_PATH}/v0.0.2/file1.csv', files)
+        self.assertEqual(b'0',
+            self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.2/a=1/b=2/part-0.csv'])
+        self.assertEqual(b'1', self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.2/a=2/part-1.csv'])
+        self.assertEqual(0, self.dbfs_server.requests['mkdirs'])
+
+    def test_copy_lfs_files_to_dbfs(self):
+        """
+        Test that files tracked by Git LFS get copied from the LFS server instead of their
+        pointers, resuming broken downloads.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        dbfs = DBFS(self.dbfs_server.url, 'token')
+        model = bytes(range(256)) * 8192
+        self.git_server.add_lfs_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.1/model.bin', model)
+        self.git_server.cut_downloads = 2
+
+        # Act
+        copy_versions_to_dbfs({'v0.0.1'}, git, GitPath(REPO, BASE_PATH, BRANCH), dbfs,
+            DBFS_BASE_PATH, logger)
+
+        # Assert
+        self.assertEqual(model, self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.1/model.bin'])
+        self.assertEqual(self.files[f'{BASE_PATH}/v0.0.1/file2.csv'],
+            self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.1/file2.csv'])
+        self.assertEqual(1, self.git_server.requests['lfs_batch'])
+        # 3 files, 1 LFS object and 2 resumed downloads
+        self.assertEqual(6,
+            self.git_server.requests['raw'] + self.git_server.requests['lfs_download'])
+
+    def test_copy_versions_to_dbfs_with_transform(self):
+        """
+        Test that CSV files get compressed on the way, and other files copied as they are.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        dbfs = DBFS(self.dbfs_server.url, 'token')
+        self.git_server.add_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.1/notes.txt', b'notes')
+
+        # Act
+        copy_versions_to_dbfs({'v0.0.1'}, git, GitPath(REPO, BASE_PATH, BRANCH), dbfs,
+            DBFS_BASE_PATH, logger, transform=GzipTransform())
+
+        # Assert
+        self.assertCountEqual([f'{DBFS_BASE_PATH}/v0.0.1/file1.csv.gz',
+            f'{DBFS_BASE_PATH}/v0.0.1/file2.csv.gz', f'{DBFS_BASE_PATH}/v0.0.1/notes.txt',
+            f'{DBFS_BASE_PATH}/v0.0.3/file1.csv'], self.dbfs_server.files)
+        self.assertEqual(self.files[f'{BASE_PATH}/v0.0.1/file2.csv'],
+            gzip.decompress(self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.1/file2.csv.gz']))
+        self.assertEqual(b'notes', self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.1/notes.txt'])
+
+    def test_copy_versions_to_sinks(self):
+        """
+        Test the copy of versions to a Files API sink and a local sink at the same time.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        files = FilesSink(self.dbfs_server.url, 'token')
+
+        with tempfile.TemporaryDirectory() as root:
+            local = LocalSink(root)
+
+            # Act
+            copy_versions_to_dbfs({'v0.0.1', 'v0.0.2', 'v0.0.3'}, git,
+                GitPath(REPO, BASE_PATH, BRANCH), [files, local], DBFS_BASE_PATH, logger)
+
+            # Assert
+            self.assertDictEqual(self.expected_files(), self.dbfs_server.files)
+            self.assertEqual(3, self.dbfs_server.requests['upload'])
+            for path, content in self.expected_files().items():
+                with open(os.path.join(root, path.lstrip('/')), 'rb') as file:
+                    self.assertEqual(content, file.read())
+            self.assertFalse(os.path.exists(os.path.join(root, DBFS_BASE_PATH.lstrip('/'),
+                'v0.0.3')))
+
+    def test_recover_interrupted_copy(self):
+        """
+        Test that a copy interrupted by a crash gets finished by another process, without copying
+        again the files it published.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        mapping = self.mapping
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'journal.db')
+            crashed = SyncJournal(path, lease=0).checkpoint(
+                json.dumps([REPO, BRANCH, BASE_PATH, DBFS_BASE_PATH, 'v0.0.1']),
+                {'Mappings': [list(mapping.key)], 'Version': 'v0.0.1'})
+            crashed.deleted = True
+            crashed.plan({name: get_blob_sha(self.files[f'{BASE_PATH}/v0.0.1/{name}'])
+                for name in ['file1.csv', 'file2.csv']})
+            crashed.publish('file1.csv')
+            self.dbfs_server.files = {
+                f'{DBFS_BASE_PATH}/v0.0.1/file1.csv': self.files[f'{BASE_PATH}/v0.0.1/file1.csv']}
+            routing_table = RoutingTable([mapping], journal=SyncJournal(path))
+
+            # Act
+            routes, checkpoints = routing_table.recover(logger)
+            unfinished = routing_table.sync(routes, logger, checkpoints=checkpoints)
+
+            # Assert
+            self.assertDictEqual({mapping: {'v0.0.1'}}, routes)
+            self.assertDictEqual({}, unfinished)
+            self.assertDictEqual({
+                path: content for path, content in self.expected_files().items()
+                if '/v0.0.1/' in path}, self.dbfs_server.files)
+            self.assertEqual(1, self.dbfs_server.requests['create'])
+            self.assertEqual(0, self.dbfs_server.requests['delete'])
+            self.assertListEqual([], routing_table.journal.recover())
+            self.assertDictEqual({}, routing_table.journal.get_files(crashed.key))
+
+    def test_recover_interrupted_copy_with_removed_file(self):
+        """
+        Test that a copy interrupted by a crash gets copied again from the start if a file it
+        published got removed from Git since, so the removed file doesn't stay in DBFS.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        dbfs = DBFS(self.dbfs_server.url, 'token')
+        dbfs_path = f'{DBFS_BASE_PATH}/v0.0.1'
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'journal.db')
+            crashed = SyncJournal(path, lease=0).checkpoint('copy', {})
+            crashed.deleted = True
+            crashed.plan({name: get_blob_sha(self.files[f'{BASE_PATH}/v0.0.1/{name}'])
+                for name in ['file1.csv', 'file2.csv']})
+            crashed.publish('file1.csv')
+            crashed.publish('file2.csv')
+            self.dbfs_server.files = {
+                f'{dbfs_path}/{name}': self.files[f'{BASE_PATH}/v0.0.1/{name}']
+                for name in ['file1.csv', 'file2.csv']}
+            self.git_server.remove_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.1/file2.csv')
+            journal = SyncJournal(path)
+            checkpoint = journal.recover()[0][2]
+
+            # Act
+            git.copy_folder_to_dbfs(GitPath(REPO, f'{BASE_PATH}/v0.0.1', BRANCH), dbfs,
+                dbfs_path, checkpoint)
+
+            # Assert
+            self.assertListEqual([f'{dbfs_path}/file1.csv'],
+                [file['path'] for file in dbfs.list(dbfs_path)['files']])
+            self.assertTrue(checkpoint.deleted)
+            self.assertTrue(checkpoint.finished)
+            self.assertEqual(1, self.dbfs_server.requests['delete'])
+            journal.close()
+
+    def test_continue_copy_with_removed_file(self):
+        """
+        Test that a continued copy gets copied again from the start if a file it completed got
+        removed from Git since, so the removed file doesn't stay in DBFS.
+        """
+        # Arrange
+        git = GitHub(self.git_server.url, 'token', Mock(spec=Logger))
+        dbfs = DBFS(self.dbfs_server.url, 'token')
+        dbfs_path = f'{DBFS_BASE_PATH}/v0.0.1'
+        checkpoint = Checkpoint.from_dict(
+            {'deleted': True, 'completed': ['file1.csv', 'file2.csv'], 'finished': False})
+        self.dbfs_server.files = {
+            f'{dbfs_path}/{name}': self.files[f'{BASE_PATH}/v0.0.1/{name}']
+            for name in ['file1.csv', 'file2.csv']}
+        self.git_server.remove_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.1/file2.csv')
+
+        # Act
+        git.copy_folder_to_dbfs(GitPath(REPO, f'{BASE_PATH}/v0.0.1', BRANCH), dbfs, dbfs_path,
+            checkpoint)
+
+        # Assert
+        self.assertListEqual([f'{dbfs_path}/file1.csv'],
+            [file['path'] for file in dbfs.list(dbfs_path)['files']])
+        self.assertTrue(checkpoint.deleted)
+        self.assertTrue(checkpoint.finished)
+        self.assertEqual(1, self.dbfs_server.requests['delete'])
+
+    def test_sync_with_version_caches_of_many_workers(self):
+        """
+        Test that versions that a worker cached as missing get copied again by the worker once
+        other workers copied them back, as cache entries only apply to the head of their push.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        mapping = self.mapping
+        worker_a = RoutingTable([mapping], version_cache=VersionCache())
+        worker_b = RoutingTable([mapping], version_cache=VersionCache())
+        routes = {mapping: {'v0.0.1'}}
+        ref = f'refs/heads/{BRANCH}'
+        files = {path: content for path, content in self.files.items() if '/v0.0.1/' in path}
+
+        # Act
+        for path in files:
+            self.git_server.remove_file(REPO, BRANCH, path)
+        worker_a.sync(routes, logger, heads={(REPO, ref): 'sha1'})
+        worker_a.sync(routes, logger, heads={(REPO, ref): 'sha1'})
+        removed_requests = dict(self.git_server.requests)
+        for path, content in files.items():
+            self.git_server.add_file(REPO, BRANCH, path, content)
+        worker_b.sync(routes, logger, heads={(REPO, ref): 'sha2'})
+        self.git_server.remove_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.1/file2.csv')
+        worker_a.sync(routes, logger, heads={(REPO, ref): 'sha3'})
+
+        # Assert
+        self.assertEqual(1, removed_requests['contents'])
+        self.assertDictEqual({
+            f'{DBFS_BASE_PATH}/v0.0.1/file1.csv': self.files[f'{BASE_PATH}/v0.0.1/file1.csv']},
+            {path: content for path, content in self.dbfs_server.files.items()
+                if '/v0.0.1/' in path})
+
+    def test_copy_versions_to_dbfs_with_lost_blocks(self):
+        """
+        Test that files that are incomplete in DBFS after being copied get copied again.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        dbfs = DBFS(self.dbfs_server.url, 'token')
+        self.dbfs_server.cut_uploads = 1
+
+        # Act
+        copy_versions_to_dbfs({'v0.0.1', 'v0.0.2', 'v0.0.3'}, git,
+            GitPath(REPO, BASE_PATH, BRANCH), dbfs, DBFS_BASE_PATH, logger)
+
+        # Assert
+        self.assertDictEqual(self.expected_files(), self.dbfs_server.files)
+        self.assertEqual(4, self.dbfs_server.requests['close'])
+        self.assertEqual(3, self.dbfs_server.requests['list'])
+
+    def test_copy_versions_to_dbfs_with_corrupt_dbfs(self):
+        """
+        Test that a copy fails if files are still incomplete in DBFS after being copied again.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        dbfs = DBFS(self.dbfs_server.url, 'token')
+        self.dbfs_server.cut_uploads = 100
+        checkpoints = {}
+
+        # Act & Assert
+        with self.assertRaisesRegex(DBFSException, '500'):
+            copy_versions_to_dbfs({'v0.0.1'}, git, GitPath(REPO, BASE_PATH, BRANCH), dbfs,
+                DBFS_BASE_PATH, logger, checkpoints=checkpoints)
+        self.assertEqual(2 * (1 + GitHub.MAX_REPAIRS), self.dbfs_server.requests['close'])
+        self.assertSetEqual(set(), checkpoints['v0.0.1'].completed)
+
+    def test_copy_versions_to_dbfs_with_deadline(self):
+        """
+        Test that a copy stopped by its deadline continues where it left off.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger, max_pending_files=1)
+        dbfs = DBFS(self.dbfs_server.url, 'token')
+        mock_deadline = Mock(spec=Deadline)
+        mock_deadline.reached.side_effect = [False, False, True]
+        checkpoints = {}
+
+        # Act
+        copy_versions_to_dbfs({'v0.0.1'}, git, GitPath(REPO, BASE_PATH, BRANCH), dbfs,
+            DBFS_BASE_PATH, logger, mock_deadline, checkpoints)
+        checkpoint = Checkpoint.from_dict(checkpoints['v0.0.1'].to_dict())
+        copied_files = dict(self.dbfs_server.files)
+        copy_versions_to_dbfs({'v0.0.1'}, git, GitPath(REPO, BASE_PATH, BRANCH), dbfs,
+            DBFS_BASE_PATH, logger, Deadline(), {'v0.0.1': checkpoint})
+
+        # Assert
+        self.assertDictEqual({'deleted': True, 'completed': ['file1.csv'], 'finished': False},
+            checkpoints['v0.0.1'].to_dict())
+        self.assertEqual([f'{DBFS_BASE_PATH}/v0.0.1/file1.csv',
+            f'{DBFS_BASE_PATH}/v0.0.3/file1.csv'], sorted(copied_files))
+        self.assertTrue(checkpoint.finished)
+        self.assertEqual(1, self.dbfs_server.requests['delete'])
+        self.assertEqual(2, self.dbfs_server.requests['close'])
+        for file in ['file1.csv', 'file2.csv']:
+            self.assertEqual(self.files[f'{BASE_PATH}/v0.0.1/{file}'],
+                self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.1/{file}'])
+
+    def test_copy_versions_to_dbfs_with_dbfs_errors(self):
+        """
+        Test that files are not published when DBFS fails.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        dbfs = DBFS(self.dbfs_server.url, 'token',
+            limiter=AdaptiveLimiter('dbfs', retry_delay=0.001))
+        self.dbfs_server.error_rate = 1
+
+        # Act & Assert
+        with self.assertRaisesRegex(DBFSException, '503'):
+            copy_versions_to_dbfs({'v0.0.1'}, git, GitPath(REPO, BASE_PATH, BRANCH), dbfs,
+                DBFS_BASE_PATH, logger)
+
+        self.assertEqual(0, self.dbfs_server.requests['close'])
+
+    def test_copy_versions_to_dbfs_with_dbfs_throttling(self):
+        """
+        Test that throttled requests get retried with a lower concurrency limit.
+        """
+        # Arrange
+        logger = Mock(spec=Logger)
+        git = GitHub(self.git_server.url, 'token', logger)
+        limiter = AdaptiveLimiter('dbfs', initial_limit=8, retry_delay=0.001)
+        dbfs = DBFS(self.dbfs_server.url, 'token', limiter=limiter)
+        self.dbfs_server.fail_next(2, 429)
+
+        # Act
+        copy_versions_to_dbfs({'v0.0.1', 'v0.0.2', 'v0.0.3'}, git,
+            GitPath(REPO, BASE_PATH, BRANCH), dbfs, DBFS_BASE_PATH, logger)
+
+        # Assert
+        self.assertDictEqual(self.expected_files(), self.dbfs_server.files)
+        self.assertEqual(2, self.dbfs_server.errors[429])
+        self.assertLess(limiter.limit, 8)
@@ -0,0 +1,74 @@
+"""
+Tests for the entry points of the functions in __init__.py.
+"""
+
+import asyncio
+from hashlib import sha1
+from hmac import HMAC
+import json
+import os
+from unittest.mock import Mock, patch
+
+from logging import Logger
+
+import azure.functions as func
+
+from .. import continue_copy, main
+from ..routing import RoutingTable
+from ..services import CircuitOpenException, GitPushNotification
+from .fakes import FakeServersTestCase, REPO, BRANCH, BASE_PATH, DBFS_BASE_PATH
+
+SECRET = 'somesecret'
+
+class TestFunction(FakeServersTestCase):
+    """
+    Tests for the entry points of the functions, against fake GitHub and DBFS servers.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.git_server.add_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.1/file1.csv', b'a,b\n1,2\n')
+        self.patches = [
+            patch.dict(os.environ, {'WebhookSecret': SECRET}),
+            patch('git_to_dbfs.__get_logger', lambda: Mock(spec=Logger)),
+            patch('git_to_dbfs.__get_routing_table', lambda: self.routing_table)]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+        super().tearDown()
+
+    def test_truncated_notification_with_open_circuit(self):
+        """
+        Test that a truncated notification that can't be completed because the circuit of GitHub
+        is open gets completed and copied by a continuation.
+        """
+        # Arrange
+        body = json.dumps({
+            'ref': f'refs/heads/{BRANCH}', 'before': 'a' * 40, 'after': 'b' * 40, 'size': 30,
+            'repository': {'full_name': REPO},
+            'commits': [{'added': [], 'removed': [], 'modified': ['README.md']}] * 20}).encode()
+        signature = HMAC(key=SECRET.encode(), msg=body, digestmod=sha1).hexdigest()
+        req = func.HttpRequest(method='POST', url='/api/git_to_dbfs', body=body,
+            headers={'X-Hub-Signature': f'sha1={signature}'})
+        continuation = Mock()
+
+        def complete(notification: GitPushNotification, _):
+            notification.changed_files = [f'{BASE_PATH}/v0.0.1/file1.csv']
+            return True
+
+        # Act
+        with patch.object(RoutingTable, 'complete', side_effect=CircuitOpenException('GitHub')):
+            response = asyncio.run(main(req, continuation))
+        message = json.loads(continuation.set.call_args[0][0])
+        with patch.object(RoutingTable, 'complete', side_effect=complete):
+            asyncio.run(continue_copy(message, Mock()))
+
+        # Assert
+        self.assertEqual(202, response.status_code)
+        self.assertListEqual([], message['Copies'])
+        self.assertEqual('b' * 40, message['Notification']['after'])
+        self.assertEqual(20, len(message['Notification']['commits']))
+        self.assertEqual({f'{DBFS_BASE_PATH}/v0.0.1/file1.csv'}, set(self.dbfs_server.files))
@@ -0,0 +1,165 @@
+"""
+Tests for reconcile.py.
+"""
+
+from unittest.mock import Mock
+
+from logging import Logger
+
+from ..reconcile import ApiBudget, get_drifted_versions, get_git_versions
+from ..services import DBFS, GitHub, GzipTransform
+from .fakes import FakeServersTestCase, REPO, BRANCH, BASE_PATH, DBFS_BASE_PATH
+
+class TestReconcile(FakeServersTestCase):
+    """
+    Tests for reconciliation helper methods, against fake GitHub and DBFS servers.
+    """
+
+    def setUp(self):
+        super().setUp()
+        files = {
+            'v0.0.1/file1.csv': b'a,b\n1,2\n',
+            'v0.0.1/file2.csv': b'c,d\n3,4\n',
+            'v0.0.2/file1.csv': b'modified',
+            'v0.0.4/file1.csv': b'missing'}
+        for path, content in files.items():
+            self.git_server.add_file(REPO, BRANCH, f'{BASE_PATH}/{path}', content)
+        self.git_server.add_file(REPO, BRANCH, 'otherfiles/v0.0.1/file1.csv', b'other')
+        self.dbfs_server.files.update({
+            f'{DBFS_BASE_PATH}/v0.0.1/file1.csv': b'a,b\n1,2\n',
+            f'{DBFS_BASE_PATH}/v0.0.1/file2.csv': b'c,d\n3,4\n',
+            f'{DBFS_BASE_PATH}/v0.0.2/file1.csv': b'old',
+            f'{DBFS_BASE_PATH}/v0.0.3/file1.csv': b'removed'})
+
+    def test_get_git_versions(self):
+        """
+        Test indexing the files of the version folders under a base path from a tree.
+        """
+        # Arrange
+        git = GitHub(self.git_server.url, 'token', Mock(spec=Logger))
+
+        # Act
+        result = get_git_versions(git.get_tree(REPO, BRANCH), BASE_PATH)
+
+        # Assert
+        self.assertEqual(['v0.0.1', 'v0.0.2', 'v0.0.4'], sorted(result))
+        self.assertEqual(['file1.csv', 'file2.csv'], sorted(result['v0.0.1']))
+        self.assertEqual(('d84012fbd8415354de6b29158b6e5e17c4fda70b', 8),
+            result['v0.0.2']['file1.csv'])
+        with self.assertRaises(ValueError):
+            get_git_versions({'truncated': True, 'tree': []}, BASE_PATH)
+
+    def test_get_drifted_versions(self):
+        """
+        Test finding versions missing from DBFS, removed from Git or with different files.
+        """
+        # Arrange
+        git = GitHub(self.git_server.url, 'token', Mock(spec=Logger))
+        git_versions = get_git_versions(git.get_tree(REPO, BRANCH), BASE_PATH)
+        budget = ApiBudget(10)
+
+        # Act
+        result = get_drifted_versions(git_versions, DBFS(self.dbfs_server.url, 'token'),
+            DBFS_BASE_PATH, budget, Mock(spec=Logger))
+
+        # Assert
+        self.assertSetEqual({'v0.0.2', 'v0.0.3', 'v0.0.4'}, result)
+        self.assertEqual(3, self.dbfs_server.requests['list'])
+        self.assertEqual(7, budget.calls)
+
+    def test_get_drifted_versions_with_budget(self):
+        """
+        Test that version folders stop being listed once the budget is exhausted.
+        """
+        # Arrange
+        git = GitHub(self.git_server.url, 'token', Mock(spec=Logger))
+        git_versions = get_git_versions(git.get_tree(REPO, BRANCH), BASE_PATH)
+        budget = ApiBudget(2)
+        mock_logger = Mock(spec=Logger)
+
+        # Act
+        result = get_drifted_versions(git_versions, DBFS(self.dbfs_server.url, 'token'),
+            DBFS_BASE_PATH, budget, mock_logger, order=['v0.0.2', 'v0.0.1'])
+
+        # Assert
+        self.assertSetEqual({'v0.0.2', 'v0.0.3', 'v0.0.4'}, result)
+        self.assertEqual(2, self.dbfs_server.requests['list'])
+        self.assertEqual(0, budget.calls)
+        mock_logger.warning.assert_called_once()
+
+    def test_get_drifted_versions_recursive(self):
+        """
+        Test that files in subfolders of version folders are compared for recursive base paths.
+        """
+        # Arrange
+        self.git_server.add_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.1/a=1/part-0.csv', b'0')
+        self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.1/a=1/part-0.csv'] = b'0'
+        git = GitHub(self.git_server.url, 'token', Mock(spec=Logger))
+        git_versions = get_git_versions(git.get_tree(REPO, BRANCH), BASE_PATH, True)
+        budget = ApiBudget(10)
+
+        # Act
+        result = get_drifted_versions(git_versions, DBFS(self.dbfs_server.url, 'token'),
+            DBFS_BASE_PATH, budget, Mock(spec=Logger), recursive=True)
+
+        # Assert
+        self.assertSetEqual({'v0.0.2', 'v0.0.3', 'v0.0.4'}, result)
+        self.assertEqual(4, self.dbfs_server.requests['list'])
+        self.assertEqual(6, budget.calls)
+
+    def test_get_drifted_versions_with_lfs_files(self):
+        """
+        Test that copies of files tracked by Git LFS are not taken as resized pointer files.
+        """
+        # Arrange
+        self.git_server.add_lfs_file(REPO, BRANCH, f'{BASE_PATH}/v0.0.1/model.bin', b'0' * 2048)
+        self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.1/model.bin'] = b'0' * 2048
+        git = GitHub(self.git_server.url, 'token', Mock(spec=Logger))
+        git_versions = get_git_versions(git.get_tree(REPO, BRANCH), BASE_PATH)
+
+        # Act
+        result = get_drifted_versions(git_versions, DBFS(self.dbfs_server.url, 'token'),
+            DBFS_BASE_PATH, ApiBudget(10), Mock(spec=Logger))
+
+        # Assert
+        self.assertSetEqual({'v0.0.2', 'v0.0.3', 'v0.0.4'}, result)
+
+    def test_get_drifted_versions_with_transform(self):
+        """
+        Test that transformed files are expected with their new names.
+        """
+        # Arrange
+        self.dbfs_server.files = {
+            f'{DBFS_BASE_PATH}/v0.0.1/file1.csv.gz': b'a',
+            f'{DBFS_BASE_PATH}/v0.0.1/file2.csv.gz': b'b',
+            f'{DBFS_BASE_PATH}/v0.0.2/file1.csv': b'modified'}
+        git = GitHub(self.git_server.url, 'token', Mock(spec=Logger))
+        git_versions = get_git_versions(git.get_tree(REPO, BRANCH), BASE_PATH)
+
+        # Act
+        result = get_drifted_versions(git_versions, DBFS(self.dbfs_server.url, 'token'),
+            DBFS_BASE_PATH, ApiBudget(10), Mock(spec=Logger), transform=GzipTransform())
+
+        # Assert
+        self.assertSetEqual({'v0.0.2', 'v0.0.4'}, result)
+
+    def test_reconcile(self):
+        """
+        Test that syncing the drifted versions found by a routing table brings DBFS back in
+        line with Git.
+        """
+        # Arrange
+        routing_table = self.routing_table
+        logger = Mock(spec=Logger)
+
+        # Act
+        routes = routing_table.reconcile(logger, 100)
+        routing_table.sync(routes, logger)
+        routes_after_sync = routing_table.reconcile(logger, 100)
+
+        # Assert
+        self.assertSetEqual({'v0.0.2', 'v0.0.3', 'v0.0.4'}, routes[routing_table.mappings[0]])
+        self.assertDictEqual({}, routes_after_sync)
+        self.assertEqual(2, self.git_server.requests['trees'])
+        self.assertEqual(b'modified', self.dbfs_server.files[f'{DBFS_BASE_PATH}/v0.0.2/file1.csv'])
+        self.assertNotIn(f'{DBFS_BASE_PATH}/v0.0.3/file1.csv', self.dbfs_server.files)
@@ -0,0 +1,113 @@
+"""
+Tests for replay.py.
+"""
+
+import io
+import json
+from unittest.mock import Mock
+
+from logging import Logger
+
+from ..replay import get_routes, print_plan, read_deliveries, reduce_deliveries, replay
+from .fakes import FakeServersTestCase, REPO, BRANCH, BASE_PATH, DBFS_BASE_PATH
+
+def get_payload(after: str, files: list, branch: str = BRANCH) -> dict:
+    """
+    Creates the payload of a push notification modifying some files.
+    """
+    return {
+        'ref': f'refs/heads/{branch}',
+        'before': '0' * 39 + '1',
+        'after': after,
+        'repository': {'full_name': REPO},
+        'commits': [{'added': [], 'removed': [], 'modified': files}]}
+
+class TestReplay(FakeServersTestCase):
+    """
+    Tests for replay helper methods, against fake GitHub and DBFS servers.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for path in [f'{BASE_PATH}/v0.0.1/file1.csv', f'{BASE_PATH}/v0.0.1/file2.csv',
+            f'{BASE_PATH}/v0.0.2/file1.csv']:
+            self.git_server.add_file(REPO, BRANCH, path, b'a,b\n1,2\n')
+
+    def test_read_deliveries(self):
+        """
+        Test reading push payloads and deliveries, skipping duplicates, other events and invalid
+        lines.
+        """
+        # Arrange
+        payload = get_payload('a' * 40, [f'{BASE_PATH}/v0.0.1/file1.csv'])
+        lines = [
+            json.dumps(payload),
+            json.dumps({'event': 'push', 'request': {'headers': {},
+                'payload': get_payload('b' * 40, [f'{BASE_PATH}/v0.0.2/file1.csv'])}}),
+            json.dumps({'request': {'headers': {'X-GitHub-Event': 'push'}, 'payload': payload}}),
+            json.dumps({'event': 'ping', 'request': {'payload': {'zen': 'Keep it simple'}}}),
+            '',
+            '{"ref": ',
+            json.dumps({'ref': 'refs/heads/master', 'repository': {'full_name': REPO}})]
+        logger = Mock(spec=Logger)
+
+        # Act
+        deliveries, invalid = read_deliveries(lines, logger)
+
+        # Assert
+        self.assertListEqual([1, 2], [delivery.line for delivery in deliveries])
+        self.assertListEqual(['a' * 40, 'b' * 40],
+            [delivery.notification.after for delivery in deliveries])
+        self.assertEqual(2, invalid)
+        self.assertEqual(2, logger.warning.call_count)
+
+    def test_reduce_deliveries(self):
+        """
+        Test reducing deliveries to each modified version folder once.
+        """
+        # Arrange
+        lines = [json.dumps(payload) for payload in [
+            get_payload('c' * 40, [f'{BASE_PATH}/v0.0.1/file1.csv']),
+            get_payload('a' * 40, [f'{BASE_PATH}/v0.0.1/file2.csv', 'README.md']),
+            get_payload('b' * 40, [f'{BASE_PATH}/v0.0.2/file1.csv',
+                f'{BASE_PATH}/v0.0.1/file1.csv']),
+            get_payload('d' * 40, [f'{BASE_PATH}/v0.0.3/file1.csv'], branch='develop')]]
+        logger = Mock(spec=Logger)
+        deliveries, _ = read_deliveries(lines, logger)
+        out = io.StringIO()
+
+        # Act
+        targets = reduce_deliveries(self.routing_table, deliveries, logger)
+        print_plan(deliveries, targets, out)
+
+        # Assert
+        mapping = self.routing_table.mappings[0]
+        self.assertListEqual(['v0.0.1', 'v0.0.2'], [target.version for target in targets])
+        self.assertListEqual([[mapping], [mapping]], [target.mappings for target in targets])
+        self.assertDictEqual({mapping: {'v0.0.1', 'v0.0.2'}}, get_routes(targets))
+        self.assertIn('Planned: 2 version folders from 4 pushes', out.getvalue())
+        self.assertEqual(0, sum(self.git_server.requests.values()))
+
+    def test_replay(self):
+        """
+        Test copying the version folders of many deliveries in a single sync, each of them once.
+        """
+        # Arrange
+        lines = [json.dumps(get_payload(sha * 40, [f'{BASE_PATH}/v0.0.1/file1.csv',
+            f'{BASE_PATH}/v0.0.2/file1.csv'])) for sha in 'abcde']
+        logger = Mock(spec=Logger)
+        deliveries, _ = read_deliveries(lines, logger)
+        targets = reduce_deliveries(self.routing_table, deliveries, logger)
+        out = io.StringIO()
+
+        # Act
+        result = replay(self.routing_table, targets, logger, out)
+
+        # Assert
+        self.assertTrue(result)
+        self.assertEqual({f'{DBFS_BASE_PATH}/v0.0.1/file1.csv',
+            f'{DBFS_BASE_PATH}/v0.0.1/file2.csv', f'{DBFS_BASE_PATH}/v0.0.2/file1.csv'},
+            set(self.dbfs_server.files))
+        self.assertEqual(3, self.git_server.requests['raw'])
+        self.assertEqual(3, self.dbfs_server.requests['close'])
+        self.assertIn('Copied 2 version folders', out.getvalue())
@@ -0,0 +1,415 @@
+"""
+Tests for routing.py.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from logging import Logger
+
+from ..routing import Mapping, RoutingTable
+from ..services import GitHub, GitPushNotification, Deadline, DBFS, FilesSink, LocalSink
+from ..services import CircuitBreaker, CircuitOpenException, GzipTransform
+
+class TestRoutingTable(unittest.TestCase):
+    """
+    Tests for RoutingTable class.
+    """
+
+    config = {
+        'MaxConcurrency': 2,
+        'Mappings': [
+            {
+                'GitApi': 'https://api.github.com', 'GitToken': 'token',
+                'GitRepo': 'magencio/git_to_dbfs_function', 'GitBranch': 'master',
+                'GitBasePath': 'samplefiles',
+                'DatabricksHost': 'https://dev.azuredatabricks.net', 'DatabricksToken': 'token',
+                'DatabricksDbfsBasePath': '/mnt/dev/samplefiles'
+            },
+            {
+                'GitApi': 'https://api.github.com', 'GitToken': 'token',
+                'GitRepo': 'magencio/git_to_dbfs_function', 'GitBranch': 'master',
+                'GitBasePath': 'samplefiles',
+                'DatabricksHost': 'https://prod.azuredatabricks.net', 'DatabricksToken': 'token',
+                'DatabricksDbfsBasePath': '/mnt/prod/samplefiles'
+            },
+            {
+                'GitApi': 'https://api.github.com', 'GitToken': 'token',
+                'GitRepo': 'magencio/git_to_dbfs_function', 'GitBranch': 'master',
+                'GitBasePath': 'otherfiles',
+                'DatabricksHost': 'https://dev.azuredatabricks.net', 'DatabricksToken': 'token',
+                'DatabricksDbfsBasePath': '/mnt/dev/otherfiles'
+            },
+            {
+                'GitApi': 'https://api.github.com', 'GitToken': 'token',
+                'GitRepo': 'magencio/git_to_dbfs_function', 'GitBranch': 'develop',
+                'GitBasePath': 'samplefiles',
+                'DatabricksHost': 'https://dev.azuredatabricks.net', 'DatabricksToken': 'token',
+                'DatabricksDbfsBasePath': '/mnt/develop/samplefiles'
+            }
+        ]
+    }
+
+    notification = {
+        'ref': 'refs/heads/master',
+        'repository': { 'full_name': 'magencio/git_to_dbfs_function' },
+        'commits': [
+            {
+                'added': ['samplefiles/v0.0.1/file1.csv'],
+                'removed': ['otherfiles/v0.0.2/file1.csv'],
+                'modified': ['samplefiles/v0.0.3/file1.csv', 'unknown/v0.0.4/file1.csv']
+            }
+        ]
+    }
+
+    def test_mapping_from_env(self):
+        """
+        Test the construction of a mapping with settings missing from config taken from
+        environment variables.
+        """
+        # Arrange
+        env = {'GitRepo': 'magencio/git_to_dbfs_function', 'GitBranch': 'master',
+            'GitBasePath': 'samplefiles', 'DatabricksDbfsBasePath': '/mnt/samplefiles'}
+
+        # Act
+        with patch.dict(os.environ, env):
+            result = Mapping({'GitBasePath': 'otherfiles'})
+
+        # Assert
+        self.assertEqual('magencio/git_to_dbfs_function', result.git_path.repo)
+        self.assertEqual('otherfiles', result.git_path.path)
+        self.assertEqual('refs/heads/master', result.git_path.ref)
+        self.assertEqual('/mnt/samplefiles', result.dbfs_base_path)
+
+    def test_from_file(self):
+        """
+        Test the construction of a routing table from a JSON file.
+        """
+        # Arrange
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'routing.json')
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(self.config, file)
+
+            # Act
+            result = RoutingTable.from_file(path)
+
+        # Assert
+        self.assertEqual(2, result.max_concurrency)
+        self.assertEqual(4, len(result.mappings))
+
+    def test_route(self):
+        """
+        Test the fan-out of a notification to every matching mapping.
+        """
+        # Arrange
+        routing_table = RoutingTable.from_dict(self.config)
+        notification = GitPushNotification(self.notification)
+
+        # Act
+        result = routing_table.route(notification)
+
+        # Assert
+        expected_result = {
+            '/mnt/dev/samplefiles': set(['v0.0.1', 'v0.0.3']),
+            '/mnt/prod/samplefiles': set(['v0.0.1', 'v0.0.3']),
+            '/mnt/dev/otherfiles': set(['v0.0.2'])}
+        self.assertDictEqual(expected_result,
+            {mapping.dbfs_base_path: versions for mapping, versions in result.items()})
+
+    def test_route_recursive(self):
+        """
+        Test that files in subfolders of version folders only route to recursive mappings.
+        """
+        # Arrange
+        config = json.loads(json.dumps(self.config))
+        config['Mappings'][1]['RecursiveVersions'] = 'true'
+        routing_table = RoutingTable.from_dict(config)
+        notification = GitPushNotification(dict(self.notification, commits=[{'added': [],
+            'removed': [], 'modified': ['samplefiles/v0.0.6/partition=1/part-0.csv']}]))
+
+        # Act
+        result = routing_table.route(notification)
+
+        # Assert
+        self.assertDictEqual({'/mnt/prod/samplefiles': {'v0.0.6'}},
+            {mapping.dbfs_base_path: versions for mapping, versions in result.items()})
+
+    def test_route_unknown_ref(self):
+        """
+        Test routing a notification for a repo/branch without mappings.
+        """
+        # Arrange
+        routing_table = RoutingTable.from_dict(self.config)
+        notification = GitPushNotification(dict(self.notification, ref='refs/heads/unknown'))
+
+        # Act
+        result = routing_table.route(notification)
+
+        # Assert
+        self.assertDictEqual({}, result)
+
+    def test_shared_clients(self):
+        """
+        Test that mappings with the same GitHub/DBFS settings share their clients.
+        """
+        # Arrange
+        routing_table = RoutingTable.from_dict(self.config)
+        dev, prod, other, _ = routing_table.mappings
+        logger = Mock(spec=Logger)
+
+        # Act & Assert
+        self.assertIs(routing_table.git(dev, logger), routing_table.git(prod, logger))
+        self.assertIs(routing_table.dbfs(dev), routing_table.dbfs(other))
+        self.assertIsNot(routing_table.dbfs(dev), routing_table.dbfs(prod))
+
+    def test_sinks(self):
+        """
+        Test picking the sink of every mapping with "DatabricksSink" setting.
+        """
+        # Arrange
+        config = json.loads(json.dumps(self.config))
+        config['Mappings'][1]['DatabricksSink'] = 'files'
+        config['Mappings'][2].update({'DatabricksSink': 'local', 'LocalSinkPath': '/tmp/sink'})
+        routing_table = RoutingTable.from_dict(config)
+        dev, prod, other, _ = routing_table.mappings
+
+        # Act & Assert
+        self.assertIsInstance(routing_table.dbfs(dev), DBFS)
+        self.assertIsInstance(routing_table.dbfs(prod), FilesSink)
+        self.assertIsInstance(routing_table.dbfs(other), LocalSink)
+        self.assertEqual('/tmp/sink', routing_table.dbfs(other).root)
+        with self.assertRaises(ValueError):
+            Mapping({'DatabricksSink': 'unknown'})
+
+    def test_transforms(self):
+        """
+        Test picking the transform of every mapping with "Transform" setting.
+        """
+        # Arrange
+        config = json.loads(json.dumps(self.config))
+        config['Mappings'][1]['Transform'] = 'gzip'
+        routing_table = RoutingTable.from_dict(config)
+        dev, prod, _, _ = routing_table.mappings
+
+        # Act & Assert
+        self.assertIsNone(dev.transform)
+        self.assertIsInstance(prod.transform, GzipTransform)
+        with self.assertRaises(ValueError):
+            Mapping({'Transform': 'unknown'})
+
+    @patch.object(GitHub, 'copy_folder_to_dbfs')
+    def test_sync(self, mock_copy_folder_to_dbfs):
+        """
+        Test the copy of all modified versions of every mapping.
+        """
+        # Arrange
+        mock_copy_folder_to_dbfs.return_value = 0
+        routing_table = RoutingTable.from_dict(self.config)
+        routes = routing_table.route(GitPushNotification(self.notification))
+        logger = Mock(spec=Logger)
+
+        # Act
+        routing_table.sync(routes, logger)
+
+        # Assert
+        expected_args = [
+            ('samplefiles/v0.0.1', '/mnt/dev/samplefiles/v0.0.1'),
+            ('samplefiles/v0.0.3', '/mnt/dev/samplefiles/v0.0.3'),
+            ('samplefiles/v0.0.1', '/mnt/prod/samplefiles/v0.0.1'),
+            ('samplefiles/v0.0.3', '/mnt/prod/samplefiles/v0.0.3'),
+            ('otherfiles/v0.0.2', '/mnt/dev/otherfiles/v0.0.2')]
+        args = [(x[0][0].path, x[0][2]) for x in mock_copy_folder_to_dbfs.call_args_list]
+        self.assertCountEqual(expected_args, args)
+
+    @patch.object(GitHub, 'copy_folder_to_dbfs')
+    def test_sync_with_heads(self, mock_copy_folder_to_dbfs):
+        """
+        Test that copies of the branches with a known head get copied for that head, so they
+        use the version cache, unlike copies of other branches.
+        """
+        # Arrange
+        mock_copy_folder_to_dbfs.return_value = 0
+        routing_table = RoutingTable.from_dict(self.config)
+        routes = routing_table.route(GitPushNotification(self.notification))
+        routes[routing_table.mappings[3]] = {'v0.0.1'}
+        heads = {('magencio/git_to_dbfs_function', 'refs/heads/master'): 'sha1'}
+
+        # Act
+        routing_table.sync(routes, Mock(spec=Logger), heads=heads)
+
+        # Assert
+        expected_args = [
+            ('/mnt/dev/samplefiles/v0.0.1', 'sha1'), ('/mnt/dev/samplefiles/v0.0.3', 'sha1'),
+            ('/mnt/prod/samplefiles/v0.0.1', 'sha1'), ('/mnt/prod/samplefiles/v0.0.3', 'sha1'),
+            ('/mnt/dev/otherfiles/v0.0.2', 'sha1'), ('/mnt/develop/samplefiles/v0.0.1', None)]
+        args = [(x[0][2], x[0][0].head) for x in mock_copy_folder_to_dbfs.call_args_list]
+        self.assertCountEqual(expected_args, args)
+        self.assertIsNone(routing_table.mappings[0].git_path.head)
+
+    @patch.object(GitHub, 'copy_folder_to_dbfs')
+    def test_sync_by_priority(self, mock_copy_folder_to_dbfs):
+        """
+        Test that every mapping gets its most urgent version copied first, and that versions get
+        their own deadlines with "VersionTimeBudget" setting.
+        """
+        # Arrange
+        mock_copy_folder_to_dbfs.return_value = 0
+        config = json.loads(json.dumps(self.config))
+        config['MaxConcurrency'] = 1
+        config['Mappings'][1]['VersionOrder'] = 'oldest'
+        config['Mappings'][1]['VersionTimeBudget'] = '60'
+        routing_table = RoutingTable.from_dict(config)
+        routes = routing_table.route(GitPushNotification(self.notification))
+        logger = Mock(spec=Logger)
+        deadline = Deadline(600)
+
+        # Act
+        routing_table.sync(routes, logger, deadline)
+
+        # Assert
+        first_args = [
+            ('samplefiles/v0.0.3', '/mnt/dev/samplefiles/v0.0.3', True),
+            ('samplefiles/v0.0.1', '/mnt/prod/samplefiles/v0.0.1', False),
+            ('otherfiles/v0.0.2', '/mnt/dev/otherfiles/v0.0.2', True)]
+        second_args = [
+            ('samplefiles/v0.0.1', '/mnt/dev/samplefiles/v0.0.1', True),
+            ('samplefiles/v0.0.3', '/mnt/prod/samplefiles/v0.0.3', False)]
+        args = [(x[0][0].path, x[0][2], x[0][4] is deadline)
+            for x in mock_copy_folder_to_dbfs.call_args_list]
+        self.assertCountEqual(first_args, args[:3])
+        self.assertCountEqual(second_args, args[3:])
+        with self.assertRaises(ValueError):
+            Mapping({'VersionOrder': 'unknown'})
+
+    @patch.object(GitHub, 'copy_folder_to_dbfs')
+    def test_sync_many_workspaces(self, mock_copy_folder_to_dbfs):
+        """
+        Test that mappings only differing in their Databricks workspace are copied together.
+        """
+        # Arrange
+        mock_copy_folder_to_dbfs.return_value = 0
+        config = {'Mappings': [
+            dict(self.config['Mappings'][0]),
+            dict(self.config['Mappings'][1], DatabricksDbfsBasePath='/mnt/dev/samplefiles')]}
+        routing_table = RoutingTable.from_dict(config)
+        routes = routing_table.route(GitPushNotification(self.notification))
+        logger = Mock(spec=Logger)
+
+        # Act
+        routing_table.sync(routes, logger)
+
+        # Assert
+        dev, prod = routing_table.mappings
+        expected_args = [
+            ('samplefiles/v0.0.1', '/mnt/dev/samplefiles/v0.0.1'),
+            ('samplefiles/v0.0.3', '/mnt/dev/samplefiles/v0.0.3')]
+        args = [(x[0][0].path, x[0][2]) for x in mock_copy_folder_to_dbfs.call_args_list]
+        self.assertCountEqual(expected_args, args)
+        for args in mock_copy_folder_to_dbfs.call_args_list:
+            self.assertListEqual([routing_table.dbfs(dev), routing_table.dbfs(prod)], args[0][1])
+
+    @patch.object(GitHub, 'copy_folder_to_dbfs')
+    def test_sync_continuation(self, mock_copy_folder_to_dbfs):
+        """
+        Test that unfinished copies are returned with their checkpoints, and can be continued
+        from a continuation message.
+        """
+        # Arrange
+        def copy_folder_to_dbfs(git_path, _, __, checkpoint, *___):
+            checkpoint.deleted = True
+            checkpoint.completed.add('file1.csv')
+            checkpoint.finished = git_path.path != 'samplefiles/v0.0.3'
+            return 0
+        mock_copy_folder_to_dbfs.side_effect = copy_folder_to_dbfs
+        routing_table = RoutingTable.from_dict(self.config)
+        routes = routing_table.route(GitPushNotification(self.notification))
+        logger = Mock(spec=Logger)
+
+        # Act
+        unfinished = routing_table.sync(routes, logger, Deadline())
+        message = json.loads(json.dumps(routing_table.to_continuation(unfinished, 2)))
+        continued_routes, checkpoints = routing_table.from_continuation(message)
+
+        # Assert
+        dev, prod, _, _ = routing_table.mappings
+        self.assertCountEqual([('v0.0.3', dev), ('v0.0.3', prod)], unfinished)
+        self.assertEqual(2, message['Continuation'])
+        self.assertDictEqual({dev: {'v0.0.3'}, prod: {'v0.0.3'}}, continued_routes)
+        self.assertDictEqual({'deleted': True, 'completed': ['file1.csv'], 'finished': False},
+            checkpoints[('v0.0.3', dev)].to_dict())
+
+    @patch.object(GitHub, 'copy_folder_to_dbfs')
+    def test_sync_with_open_circuit(self, mock_copy_folder_to_dbfs):
+        """
+        Test that copies stopped by an open circuit don't fail, but are returned as unfinished
+        with their checkpoints.
+        """
+        # Arrange
+        def copy_folder_to_dbfs(git_path, _, __, checkpoint, *___):
+            checkpoint.deleted = True
+            if git_path.path == 'samplefiles/v0.0.3':
+                raise CircuitOpenException('https://dev.azuredatabricks.net')
+            checkpoint.finished = True
+            return 0
+        mock_copy_folder_to_dbfs.side_effect = copy_folder_to_dbfs
+        routing_table = RoutingTable.from_dict(self.config)
+        routes = routing_table.route(GitPushNotification(self.notification))
+        logger = Mock(spec=Logger)
+
+        # Act
+        unfinished = routing_table.sync(routes, logger, Deadline())
+
+        # Assert
+        dev, prod, _, _ = routing_table.mappings
+        self.assertCountEqual([('v0.0.3', dev), ('v0.0.3', prod)], unfinished)
+        self.assertDictEqual({'deleted': True, 'completed': [], 'finished': False},
+            unfinished[('v0.0.3', dev)].to_dict())
+        logger.warning.assert_called_once()
+
+    def test_get_open_circuits(self):
+        """
+        Test getting the endpoints of the routes whose circuit is open.
+        """
+        # Arrange
+        breakers = {'https://prod.azuredatabricks.net': CircuitBreaker('prod', 1)}
+        breakers['https://prod.azuredatabricks.net'].record(False)
+        routing_table = RoutingTable.from_dict(self.config)
+        routes = routing_table.route(GitPushNotification(self.notification))
+        dev, _, _, _ = routing_table.mappings
+
+        # Act
+        with patch('git_to_dbfs.routing.get_breaker',
+            lambda endpoint: breakers.get(endpoint, CircuitBreaker(endpoint))):
+            open_circuits = routing_table.get_open_circuits(routes)
+            dev_open_circuits = routing_table.get_open_circuits({dev: {'v0.0.1'}})
+
+        # Assert
+        self.assertListEqual(['https://prod.azuredatabricks.net'], open_circuits)
+        self.assertListEqual([], dev_open_circuits)
+
+    @patch.object(GitHub, 'get_changed_files')
+    def test_complete(self, mock_get_changed_files):
+        """
+        Test getting all changed files of a truncated notification from GitHub.
+        """
+        # Arrange
+        mock_get_changed_files.return_value = ['samplefiles/v0.0.5/file1.csv']
+        routing_table = RoutingTable.from_dict(self.config)
+        notification = GitPushNotification(dict(self.notification, before='a' * 40,
+            after='b' * 40, size=21))
+
+        # Act
+        result = routing_table.complete(notification, Mock(spec=Logger))
+        routes = routing_table.route(notification)
+
+        # Assert
+        self.assertTrue(result)
+        mock_get_changed_files.assert_called_once_with('magencio/git_to_dbfs_function',
+            'a' * 40, 'b' * 40)
+        self.assertDictEqual(
+            {'/mnt/dev/samplefiles': {'v0.0.5'}, '/mnt/prod/samplefiles': {'v0.0.5'}},
+            {mapping.dbfs_base_path: versions for mapping, versions in routes.items()})
@@ -7,8 +7,8 @@ from unittest.mock import Mock
 
 from logging import Logger
 
-from ..version import get_versions, copy_versions_to_dbfs
-from ..services import GitPath, GitHub, DBFS
+from ..version import VersionMatcher, get_versions, copy_versions_to_dbfs, sort_versions
+from ..services import GitPath, GitHub, DBFS, Deadline
 
 class TestVersionHelpers(unittest.TestCase):
     """
@@ -41,6 +41,23 @@ class TestVersionHelpers(unittest.TestCase):
                 expected_results = set(['v0.0.2', 'v0.0.1'])
                 self.assertSetEqual(expected_results, results)
 
+    def test_get_versions_with_regex_characters_in_base_path(self):
+        """
+        Test the extraction of versions when base path contains regex metacharacters.
+        """
+        # Arrange
+        base_path = 'base.path+'
+        files = (file for file in [
+            'base.path+/v0.0.1/file1.csv',
+            'baseXpath+/v0.0.2/file1.csv',
+            'base.pathh/v0.0.3/file1.csv'])
+
+        # Act
+        results = get_versions(base_path, files)
+
+        # Assert
+        self.assertSetEqual(set(['v0.0.1']), results)
+
     def test_copy_versions_to_dbfs(self):
         """
         Test the copy of all files in version folders from GitHub to Databricks
@@ -48,6 +65,7 @@ class TestVersionHelpers(unittest.TestCase):
         # Arrange
         versions = ['v0.0.1', 'v0.0.2']
         mock_git = Mock(spec = GitHub)
+        mock_git.copy_folder_to_dbfs.return_value = 0
         repo = 'magencio/git_to_dbfs_function'
         base_path = 'samplefiles'
         branch = 'master'
@@ -69,3 +87,114 @@ class TestVersionHelpers(unittest.TestCase):
             for x in mock_git.copy_folder_to_dbfs.call_args_list]
 
         self.assertCountEqual(expected_args, args)
+
+    def test_sort_versions(self):
+        """
+        Test the order of versions by priority.
+        """
+        # Arrange
+        versions = ['v0.0.9', 'v0.0.10', 'v1.0.0-rc.2', 'v1.0.0', 'v1.0.0-rc.10', 'latest',
+            '2021-10-2', '2021-10-10']
+
+        # Act
+        newest = sort_versions(versions)
+        oldest = sort_versions(versions, 'oldest')
+
+        # Assert
+        self.assertListEqual(['v1.0.0', 'v1.0.0-rc.10', 'v1.0.0-rc.2', 'v0.0.10', 'v0.0.9',
+            'latest', '2021-10-10', '2021-10-2'], newest)
+        self.assertListEqual(list(reversed(newest)), oldest)
+        with self.assertRaises(ValueError):
+            sort_versions(versions, 'random')
+
+    def test_copy_versions_to_dbfs_by_priority(self):
+        """
+        Test that versions get copied newest first, each with its own deadline.
+        """
+        # Arrange
+        mock_git = Mock(spec = GitHub)
+        mock_git.copy_folder_to_dbfs.return_value = 0
+        git_base_path = GitPath('magencio/git_to_dbfs_function', 'samplefiles', 'master')
+        deadline = Deadline(600)
+
+        # Act
+        copy_versions_to_dbfs({'v0.0.9', 'v0.0.10', 'v0.0.2'}, mock_git, git_base_path,
+            Mock(spec = DBFS), '/mnt/samplefiles', Mock(spec=Logger), deadline,
+            version_time_budget=60)
+
+        # Assert
+        calls = mock_git.copy_folder_to_dbfs.call_args_list
+        self.assertListEqual(['samplefiles/v0.0.10', 'samplefiles/v0.0.9', 'samplefiles/v0.0.2'],
+            [x[0][0].path for x in calls])
+        for call in calls:
+            self.assertIsNot(deadline, call[0][4])
+            self.assertLessEqual(call[0][4].remaining(), 60)
+
+class TestVersionMatcher(unittest.TestCase):
+    """
+    Tests for VersionMatcher class.
+    """
+
+    def test_match(self):
+        """
+        Test the classification of paths into (base_path, version, file) with many base paths.
+        """
+        # Arrange
+        matcher = VersionMatcher(['base', 'base/path', 'other/'])
+        cases = {
+            'base/v0.0.1/file1.csv': ('base', 'v0.0.1', 'file1.csv'),
+            'base/path/v0.0.2/file2.csv': ('base/path', 'v0.0.2', 'file2.csv'),
+            'other/v0.0.3/file3.csv': ('other/', 'v0.0.3', 'file3.csv'),
+            'base/file1.csv': None,
+            'base/path/file1.csv': ('base', 'path', 'file1.csv'),
+            'base/another/path/v0.0.4/file1.csv': None,
+            'unknown/v0.0.5/file1.csv': None,
+            'file1.csv': None}
+
+        for path, expected_result in cases.items():
+            with self.subTest(f'Path = {path}'):
+                # Act
+                result = matcher.match(path)
+
+                # Assert
+                self.assertEqual(expected_result, result)
+
+    def test_match_recursive(self):
+        """
+        Test the classification of paths in subfolders of version folders of recursive base
+        paths.
+        """
+        # Arrange
+        matcher = VersionMatcher(['base', 'base/path', 'other'], ['base'])
+        cases = {
+            'base/v0.0.1/file1.csv': ('base', 'v0.0.1', 'file1.csv'),
+            'base/v0.0.1/partition=1/part-0.csv': ('base', 'v0.0.1', 'partition=1/part-0.csv'),
+            'base/path/v0.0.2/file2.csv': ('base/path', 'v0.0.2', 'file2.csv'),
+            'base/path/v0.0.2/a/file2.csv': ('base', 'path', 'v0.0.2/a/file2.csv'),
+            'other/v0.0.3/a/file3.csv': None}
+
+        for path, expected_result in cases.items():
+            with self.subTest(f'Path = {path}'):
+                # Act
+                result = matcher.match(path)
+
+                # Assert
+                self.assertEqual(expected_result, result)
+
+    def test_get_versions(self):
+        """
+        Test the extraction of (base_path, version) pairs with many base paths.
+        """
+        # Arrange
+        matcher = VersionMatcher(['base', 'other'])
+        files = iter([
+            'base/v0.0.1/file1.csv',
+            'base/v0.0.1/file2.csv',
+            'other/v0.0.1/file1.csv',
+            'other/v0.0.2/sub/file1.csv'])
+
+        # Act
+        results = matcher.get_versions(files)
+
+        # Assert
+        self.assertSetEqual(set([('base', 'v0.0.1'), ('other', 'v0.0.1')]), results)
@@ -2,34 +2,151 @@
 Helper methods related to version folders.
 """
 import copy
-from logging import Logger
+from functools import lru_cache
 import re
-from typing import List, Set
+import time
+from logging import Logger
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from .services import GitHub, GitPath, Sink, Checkpoint, Deadline
+from .services import Transform
+from .services.telemetry import VERSION_THROUGHPUT, record, span
+
+class VersionMatcher:
+    """
+    Prefix trie over one or more base paths that classifies file paths with format
+    {base_path}/{version}/{file} into (base_path, version, file) in a single pass.
+    For recursive base paths, files in subfolders of version folders match too, with format
+    {base_path}/{version}/{folders}/{file} (file is then "{folders}/{file}").
+    """
+
+    __BASE_PATH = object()
 
-from .services import GitHub, GitPath, DBFS
+    def __init__(self, base_paths: Iterable[str], recursive_base_paths: Iterable[str] = ()):
+        self.__root = {}
+        self.__recursive = set(recursive_base_paths)
+        for base_path in base_paths:
+            node = self.__root
+            for part in base_path.strip('/').split('/'):
+                node = node.setdefault(part, {})
+            node[self.__BASE_PATH] = base_path
+
+    def match(self, path: str) -> Optional[Tuple[str, str, str]]:
+        """
+        Gets (base_path, version, file) for a path, or None if path is not a file under a version
+        folder of any of the base paths (directly under it, for base paths that are not
+        recursive). The deepest matching base path wins.
+        """
+        parts = path.split('/')
+        if len(parts) < 3:
+            return None
+
+        match = None
+        node = self.__root
+        for depth, part in enumerate(parts[:-2]):
+            node = node.get(part)
+            if node is None:
+                break
+            base_path = node.get(self.__BASE_PATH)
+            if base_path is not None and \
+                (depth == len(parts) - 3 or base_path in self.__recursive):
+                match = base_path, parts[depth + 1], '/'.join(parts[depth + 2:])
+        return match
+
+    def get_versions(self, files: Iterable[str]) -> Set[Tuple[str, str]]:
+        """
+        Gets the (base_path, version) pairs of all files under any of the base paths.
+        """
+        versions = set()
+        for file in files:
+            match = self.match(file)
+            if match:
+                versions.add(match[:2])
+        return versions
+
+@lru_cache(maxsize=32)
+def get_version_matcher(*base_paths: str) -> VersionMatcher:
+    """
+    Gets a (cached) VersionMatcher for the given base paths.
+    """
+    return VersionMatcher(base_paths)
 
-def get_versions(base_path: str, files: List[str]) -> set:
+def get_versions(base_path: str, files: Iterable[str]) -> set:
     """
     Gets the versions of all files with path {base_path}/{version}/{file}
     """
-    versions = set()
-    for file in files:
-        path_parts = re.sub(f'^{base_path}/', '', file, 1).split('/')
-        if len(path_parts) == 2:
-            versions.add(path_parts[0])
-    return versions
+    return {version for _, version in get_version_matcher(base_path).get_versions(files)}
+
+VERSION_ORDERS = ['newest', 'oldest']
+
+_SEMVER = re.compile(r'^v?(\d+)\.(\d+)\.(\d+)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$')
+
+def get_version_key(version: str) -> tuple:
+    """
+    Gets the sort key of a version: semantic versions ("v1.2.10", "1.3.0-rc.1") sort by
+    major/minor/patch, with pre-releases before their release, and after any other version
+    names, which sort naturally ("2021-10-2" before "2021-10-10").
+    """
+    match = _SEMVER.match(version)
+    if not match:
+        return (0, __get_natural_key(version))
+    major, minor, patch, pre_release = match.groups()
+    return (1, int(major), int(minor), int(patch), pre_release is None,
+        __get_natural_key(pre_release or ''))
+
+def sort_versions(versions: Iterable[str], order: str = 'newest') -> List[str]:
+    """
+    Sorts versions by priority: "newest" (highest semantic version first) or "oldest".
+    """
+    if order not in VERSION_ORDERS:
+        raise ValueError(f'Unknown version order "{order}", expected any of '
+            f'{", ".join(VERSION_ORDERS)}')
+    return sorted(versions, key=get_version_key, reverse=order == 'newest')
+
+def __get_natural_key(text: str) -> tuple:
+    return tuple((0, int(part), '') if part.isdigit() else (1, 0, part)
+        for part in re.findall(r'\d+|\D+', text))
 
 def copy_versions_to_dbfs(
     versions: Set[str],
     git: GitHub, git_base_path: GitPath,
-    dbfs: DBFS, dbfs_base_path: str,
-    logger: Logger):
+    dbfs: Union[Sink, Sequence[Sink]], dbfs_base_path: str,
+    logger: Logger, deadline: Optional[Deadline] = None,
+    checkpoints: Optional[Dict[str, Checkpoint]] = None, transform: Optional[Transform] = None,
+    order: str = 'newest', version_time_budget: Optional[float] = None):
     """
-    Copy all files in version folders from GitHub to Databricks
+    Copy all files in version folders from GitHub to Databricks (one or many DBFS targets), in
+    the given order of versions (see sort_versions).
+    Progress of every version is tracked in checkpoints (a new checkpoint gets added for versions
+    without one), and copies stop once the deadline is reached, or once a version has been
+    copied for version_time_budget seconds (if set). Copies of unfinished checkpoints can be
+    continued by calling this function with them again.
+    CSV files get transformed on the way with transform, if any.
     """
-    for version in versions:
+    checkpoints = {} if checkpoints is None else checkpoints
+    for version in sort_versions(versions, order):
+        checkpoint = checkpoints.setdefault(version, Checkpoint())
+        if deadline and deadline.reached():
+            break
+
         logger.info('Version "%s" has been modified', version)
         git_path = copy.deepcopy(git_base_path)
         git_path.path = f'{git_base_path.path}/{version}'
         dbfs_path = f'{dbfs_base_path}/{version}'
-        git.copy_folder_to_dbfs(git_path, dbfs, dbfs_path)
+        with span('Copy version', version=git_path.path):
+            start = time.perf_counter()
+            size = git.copy_folder_to_dbfs(git_path, dbfs, dbfs_path, checkpoint,
+                __get_version_deadline(deadline, version_time_budget), transform)
+            __record_throughput(git_path.path, size, start)
+
+def __get_version_deadline(deadline: Optional[Deadline],
+    version_time_budget: Optional[float]) -> Optional[Deadline]:
+    # Versions get their own deadline once they start, so big ones can't hold their slot forever
+    if version_time_budget is None:
+        return deadline
+    return (deadline or Deadline()).within(version_time_budget)
+
+def __record_throughput(version: str, size: Optional[int], start: float):
+    seconds = time.perf_counter() - start
+    if size and seconds > 0:
+        record(VERSION_THROUGHPUT, size / seconds / (1024 * 1024), version=version)
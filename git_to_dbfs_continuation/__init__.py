@@ -0,0 +1,14 @@
+"""
+Queue Triggered Azure Function that continues the copies that git_to_dbfs function could not
+finish within its time budget, from the checkpoints in the continuation message.
+"""
+
+import azure.functions as func
+
+from git_to_dbfs import continue_copy
+
+async def main(msg: func.QueueMessage, continuation: func.Out[str]):
+    """
+    Entry point for this Azure Function.
+    """
+    await continue_copy(msg.get_json(), continuation)
@@ -0,0 +1,18 @@
+"""
+Timer Triggered Azure Function that copies again the version folders whose DBFS copy drifted
+from Git, e.g. because git_to_dbfs function missed a webhook delivery. Runs every hour.
+"""
+
+import logging
+
+import azure.functions as func
+
+from git_to_dbfs import reconcile_dbfs
+
+async def main(timer: func.TimerRequest, continuation: func.Out[str]):
+    """
+    Entry point for this Azure Function.
+    """
+    if timer.past_due:
+        logging.warning('Reconciliation is past due')
+    await reconcile_dbfs(continuation)